@@ -0,0 +1,12 @@
+"""
+Throughput benchmarks for the gwsurrogate models.
+
+The benchmarks run offline, against synthetic surrogate data files with the
+same format as the NRHybSur3dq8 and NRSur7dq4 data files, see
+synthetic_models.py. To run all benchmarks and store the results as JSON do
+
+>>> python -m benchmarks.run -o results.json
+
+from the top-level folder. See python -m benchmarks.run --help for options,
+including how to compare against the results of a previous release.
+"""
@@ -0,0 +1,135 @@
+"""
+Benchmark cases for the NRHybSur3dq8, NRHybSur3dq8Tidal and NRSur7dq4
+models.
+
+The cases follow the asv layout: each class has a list of params with one
+list of values per entry of param_names, a setup method taking one value of
+each param, and time_* methods that are timed for every combination of
+params. run.py runs them and stores the results as JSON.
+"""
+
+from __future__ import division
+
+import contextlib
+import io
+
+from gwtools import gwtools as _gwtools
+
+from gwsurrogate import surrogate
+from benchmarks.synthetic_models import get_model_files
+
+# Total mass and distance used for the 'mks' cases
+M_TOT = 60.
+DIST_MPC = 100.
+
+MODEL_CLASSES = {
+    'NRHybSur3dq8': surrogate.NRHybSur3dq8,
+    'NRHybSur3dq8Tidal': surrogate.NRHybSur3dq8Tidal,
+    'NRSur7dq4': surrogate.NRSur7dq4,
+    }
+
+# Intrinsic parameters at which the models are evaluated
+MODEL_PARAMS = {
+    'NRHybSur3dq8': {'q': 2.3, 'chiA0': [0, 0, 0.3], 'chiB0': [0, 0, -0.2]},
+    'NRHybSur3dq8Tidal': {'q': 1.2, 'chiA0': [0, 0, 0.1],
+        'chiB0': [0, 0, 0.1],
+        'tidal_opts': {'Lambda1': 1000., 'Lambda2': 4000.}},
+    'NRSur7dq4': {'q': 2., 'chiA0': [-0.2, 0.4, 0.1],
+        'chiB0': [-0.5, 0.2, -0.4]},
+    }
+
+# Directory for the synthetic data files, None for the default. Set by run.py.
+DATA_DIR = None
+
+# Loaded models, so that every parameter combination reuses the same model
+_LOADED_MODELS = {}
+
+
+def load_model(name, precision='double', compiled_fits=False):
+    """ Loads the synthetic version of model name, without printing. """
+    filename = get_model_files(DATA_DIR)[name]
+    with contextlib.redirect_stdout(io.StringIO()):
+        return MODEL_CLASSES[name](filename, precision=precision,
+            compiled_fits=compiled_fits)
+
+
+def get_model(name):
+    """ Same as load_model, but only loads each model once. """
+    if name not in _LOADED_MODELS:
+        _LOADED_MODELS[name] = load_model(name)
+    return _LOADED_MODELS[name]
+
+
+def waveform_kwargs(name, f_low, dt, ellMax, units, inclination):
+    """
+    Returns the keyword arguments for a waveform evaluation. f_low and dt
+    are always given in units of M (cycles/M) and are converted to seconds
+    (Hz) for units='mks'.
+    """
+    kwargs = dict(MODEL_PARAMS[name])
+    if units == 'mks':
+        t_scale = _gwtools.Msuninsec*M_TOT
+        kwargs.update(M=M_TOT, dist_mpc=DIST_MPC)
+        f_low = f_low/t_scale
+        dt = None if dt is None else dt*t_scale
+    elif units != 'dimensionless':
+        raise ValueError('Invalid units %s'%units)
+    kwargs.update(f_low=f_low, dt=dt, ellMax=ellMax, units=units,
+        inclination=inclination)
+    return kwargs
+
+
+class _WaveformBenchmark(object):
+    """ Times a single waveform evaluation of model. """
+
+    model = None
+    param_names = ['f_low', 'dt', 'ellMax', 'units', 'inclination']
+
+    def setup(self, f_low, dt, ellMax, units, inclination):
+        self.sur = get_model(self.model)
+        self.kwargs = waveform_kwargs(self.model, f_low, dt, ellMax, units,
+            inclination)
+
+    def time_waveform(self, f_low, dt, ellMax, units, inclination):
+        self.sur(**self.kwargs)
+
+
+class TimeNRHybSur3dq8(_WaveformBenchmark):
+    model = 'NRHybSur3dq8'
+    params = [[0, 6e-3], [None, 0.5], [2, None], ['dimensionless', 'mks'],
+              [None, 0.7]]
+
+
+class TimeNRHybSur3dq8Tidal(_WaveformBenchmark):
+    # This model needs a nonzero f_low and a dt
+    model = 'NRHybSur3dq8Tidal'
+    params = [[6e-3, 8e-3], [0.5, 1.0], [2, None], ['dimensionless', 'mks'],
+              [None, 0.7]]
+
+
+class TimeNRSur7dq4(_WaveformBenchmark):
+    model = 'NRSur7dq4'
+    params = [[0, 0.012], [None, 1.0], [2, None], ['dimensionless', 'mks'],
+              [None, 0.7]]
+
+
+class TimeLoad(object):
+    """ Times loading a model from its h5 file. """
+
+    param_names = ['model', 'precision', 'compiled_fits']
+    params = [sorted(MODEL_CLASSES.keys()), ['double', 'single'],
+              [False, True]]
+
+    def setup(self, model, precision, compiled_fits):
+        # Generate the data files, and the compiled fits, outside of the
+        # timing
+        get_model_files(DATA_DIR)
+        if compiled_fits:
+            load_model(model, compiled_fits=True)
+
+    def time_load(self, model, precision, compiled_fits):
+        load_model(model, precision=precision, compiled_fits=compiled_fits)
+
+
+BENCHMARK_CLASSES = [TimeLoad, TimeNRHybSur3dq8, TimeNRHybSur3dq8Tidal,
+                     TimeNRSur7dq4]
@@ -0,0 +1,179 @@
+"""
+Runs the benchmarks in bench_surrogates.py and stores the results as JSON.
+
+For each benchmark case (a time_* method at one combination of params) this
+records the latency percentiles of single calls and the throughput in
+calls (waveforms) per second. Example:
+
+>>> python -m benchmarks.run -o results_1.0.7.json
+>>> python -m benchmarks.run -o results_new.json --compare results_1.0.7.json
+
+The second command also prints the cases that got slower than in the
+results of the first one.
+"""
+
+from __future__ import division
+
+import argparse
+import datetime
+import itertools
+import json
+import platform
+import sys
+import time
+import warnings
+
+import numpy as np
+
+import gwsurrogate
+from benchmarks import bench_surrogates, synthetic_models
+
+# Version of the format of the JSON results
+RESULTS_VERSION = 1
+
+
+def iter_cases(benchmark_classes, name_filter=None):
+    """
+    Yields (case_name, benchmark_class, method_name, params) for all
+    combinations of params of all time_* methods. If name_filter is given,
+    only cases whose names contain it are yielded.
+    """
+    for cls in benchmark_classes:
+        methods = sorted(k for k in dir(cls) if k.startswith('time_'))
+        for method in methods:
+            for params in itertools.product(*cls.params):
+                param_str = ', '.join('%s=%r'%(k, v)
+                    for k, v in zip(cls.param_names, params))
+                case_name = '%s.%s(%s)'%(cls.__name__, method, param_str)
+                if name_filter is not None and name_filter not in case_name:
+                    continue
+                yield case_name, cls, method, params
+
+
+def run_case(cls, method, params, repeat, warmup=1):
+    """
+    Runs one benchmark case. Calls setup once, then the method warmup times
+    without timing and repeat times with timing.
+
+    Returns a dict with the latency statistics in seconds and the
+    throughput in calls per second.
+    """
+    bench = cls()
+    bench.setup(*params)
+    func = getattr(bench, method)
+    for _ in range(warmup):
+        func(*params)
+
+    times = np.zeros(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(*params)
+        times[i] = time.perf_counter() - start
+
+    return {
+        'repeat': repeat,
+        'mean': np.mean(times),
+        'min': np.min(times),
+        'max': np.max(times),
+        'p50': np.percentile(times, 50),
+        'p90': np.percentile(times, 90),
+        'p99': np.percentile(times, 99),
+        'per_second': 1./np.mean(times),
+        }
+
+
+def run(benchmark_classes, repeat=20, name_filter=None, verbose=True):
+    """
+    Runs all benchmark cases and returns the results as a JSON serializable
+    dict. Cases that raise an exception are recorded with the error message.
+    """
+    results = {
+        'version': RESULTS_VERSION,
+        'gwsurrogate_version': gwsurrogate.__version__,
+        'numpy_version': np.__version__,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'date': datetime.datetime.now().isoformat(),
+        'repeat': repeat,
+        'cases': {},
+        }
+
+    for case_name, cls, method, params in iter_cases(benchmark_classes,
+            name_filter):
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                res = run_case(cls, method, params, repeat)
+        except Exception as e:
+            res = {'error': '%s: %s'%(e.__class__.__name__, e)}
+        results['cases'][case_name] = res
+
+        if verbose:
+            if 'error' in res:
+                print('%s: %s'%(case_name, res['error']))
+            else:
+                print('%s: p50 %.3f ms, p90 %.3f ms, %.1f per second'%(
+                    case_name, 1e3*res['p50'], 1e3*res['p90'],
+                    res['per_second']))
+            sys.stdout.flush()
+
+    return results
+
+
+def compare(results, baseline, threshold=1.2):
+    """
+    Returns a list of (case_name, ratio) for the cases whose median latency
+    in results is more than threshold times that in baseline, sorted from
+    the largest slowdown.
+    """
+    slower = []
+    for case_name, res in results['cases'].items():
+        base = baseline['cases'].get(case_name)
+        if base is None or 'error' in res or 'error' in base:
+            continue
+        ratio = res['p50']/base['p50']
+        if ratio > threshold:
+            slower.append((case_name, ratio))
+    return sorted(slower, key=lambda x: -x[1])
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Runs the gwsurrogate'
+        ' benchmarks and stores the results as JSON.')
+    parser.add_argument('-o', '--output', default='benchmark_results.json',
+        help='JSON file for the results. Default: %(default)s')
+    parser.add_argument('-r', '--repeat', type=int, default=20,
+        help='Number of timed calls per case. Default: %(default)s')
+    parser.add_argument('-k', '--filter', default=None,
+        help='Only run cases whose names contain this string, e.g.'
+        ' NRSur7dq4 or TimeLoad.')
+    parser.add_argument('--data-dir', default=None,
+        help='Directory for the synthetic surrogate data files. Default: %s'
+        %synthetic_models.DEFAULT_DATA_DIR)
+    parser.add_argument('--compare', default=None,
+        help='JSON results of a previous run. Cases with a median latency'
+        ' more than THRESHOLD times larger are reported.')
+    parser.add_argument('--threshold', type=float, default=1.2,
+        help='See --compare. Default: %(default)s')
+    args = parser.parse_args(args)
+
+    bench_surrogates.DATA_DIR = args.data_dir
+    results = run(bench_surrogates.BENCHMARK_CLASSES, repeat=args.repeat,
+        name_filter=args.filter)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('Results written to %s'%args.output)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline, threshold=args.threshold)
+        if len(slower) == 0:
+            print('No case is slower than %s by more than a factor %s.'%(
+                args.compare, args.threshold))
+        for case_name, ratio in slower:
+            print('SLOWER by %.2fx: %s'%(ratio, case_name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+Synthetic surrogate data files for the benchmarks.
+
+The files have the same format, and roughly the same structure, as the
+NRHybSur3dq8 and NRSur7dq4 data files, but are built from smooth made-up
+waveform data pieces and fits. So they can be generated locally in a few
+seconds, and the benchmarks do not need to download any surrogate data.
+The waveforms are not physical, only the cost of evaluating them is
+meaningful.
+"""
+
+from __future__ import division
+
+import os
+import tempfile
+import warnings
+
+import numpy as np
+import h5py
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import RBF, ConstantKernel, \
+    WhiteKernel
+
+from gwsurrogate.new import surrogate, nodeFunction
+
+# Bump this when the generated files change, so that files in the data
+# directory from an older version are regenerated.
+SYNTHETIC_MODELS_VERSION = 2
+
+# The data directory used when none is given, see get_model_files
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(),
+    'gwsurrogate_benchmark_data')
+
+
+def _kernel_params(kernel):
+    """ Kernel parameters in the format expected by NRHybSur3dq8Fit """
+    params = {'name': kernel.__class__.__name__}
+    for key, val in kernel.get_params(deep=False).items():
+        if hasattr(val, 'get_params'):
+            params[key] = _kernel_params(val)
+        else:
+            params[key] = val
+    return params
+
+
+def _gpr_fit_data(X, scale, offset):
+    """ Fit data of a GPR fit over (log(q), chi1z, chi2z) """
+    y = offset + scale*(0.3*X[:, 0] + 0.1*np.sin(3*X[:, 1]) \
+        + 0.05*X[:, 2]**2)
+    mean = np.mean(y)
+    std = np.std(y)
+    kernel = ConstantKernel(1.0) * RBF(length_scale=np.ones(3)) \
+        + WhiteKernel(1e-5)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        gp = GaussianProcessRegressor(kernel=kernel).fit(X, (y - mean)/std)
+    gp_params = {
+        'kernel_': _kernel_params(gp.kernel_),
+        'X_train_': gp.X_train_,
+        'alpha_': gp.alpha_,
+        '_y_train_mean': gp._y_train_mean,
+        '_y_train_std': gp._y_train_std,
+        'L_': gp.L_,
+        }
+    return {'fitType': 'GPR', 'data_mean': mean, 'data_std': std,
+            'GPR_params': gp_params, 'lin_reg_params': None}
+
+
+def make_aligned(filename, n_times=2000, n_nodes=8, n_train=40, seed=0):
+    """
+    Writes a synthetic NRHybSur3dq8 data file with modes up to ell=5 and GPR
+    node fits.
+
+    n_times: Number of samples of the sparse time domain.
+    n_nodes: Number of empirical nodes of each data piece.
+    n_train: Number of training points of the GPR fits. As for the real
+             model, all fits share the same training points.
+    """
+    rng = np.random.RandomState(seed)
+    X_train = np.column_stack([rng.uniform(0, np.log(8), n_train),
+                               rng.uniform(-0.8, 0.8, n_train),
+                               rng.uniform(-0.8, 0.8, n_train)])
+    n_merger = n_times//10
+    t = np.concatenate([
+        -5000 + 4960*(np.linspace(0, 1, n_times - n_merger)**0.7),
+        np.linspace(-39, 40, n_merger)])
+    t = np.unique(t)
+    amp0 = 0.4*(1 + (t/10.)**2)**(-1./8)
+
+    def data_piece(base, scale, offset):
+        ei_basis = np.array([base*(1 + 0.05*np.sin(t/(300.*(j + 1))))
+                             for j in range(n_nodes)])/n_nodes
+        node_functions = []
+        for j in range(n_nodes):
+            fit = nodeFunction.NRHybSur3dq8Fit('node_%d'%j,
+                _gpr_fit_data(X_train, scale*(1 + 0.1*j), offset))
+            node_functions.append(nodeFunction.NodeFunction('node_%d'%j,
+                fit))
+        return (ei_basis, node_functions)
+
+    modes = [(2, 2), (2, 1), (2, 0), (3, 3), (3, 2), (3, 1), (3, 0),
+             (4, 4), (4, 3), (4, 2), (5, 5)]
+    coorb_mode_data = {}
+    for mode in modes:
+        if mode == (2, 2):
+            coorb_mode_data[mode] = {
+                'amp': data_piece(amp0, 0.1, 1.0),
+                'phase': data_piece(np.cos(t/2000.), 0.05, 0.),
+                }
+        else:
+            ell, m = mode
+            coorb_mode_data[mode] = {'re': data_piece(amp0*0.1/ell, 0.2, 1.0)}
+            if m != 0:
+                coorb_mode_data[mode]['im'] \
+                    = data_piece(amp0*0.02/ell, 0.2, 0.5)
+
+    params = [surrogate.ParamDim('q', 0.98, 10.02),
+              surrogate.ParamDim('chi1', -1.01, 1.01),
+              surrogate.ParamDim('chi2', -1.01, 1.01)]
+    param_space = surrogate.ParamSpace('NRHybSur3dq8', params)
+    sur = surrogate.AlignedSpinCoOrbitalFrameSurrogate('NRHybSur3dq8', t,
+        param_space, phaseAlignIdx=int(np.argmin(abs(t + 1000))),
+        TaylorT3_t_ref=60., coorb_mode_data=coorb_mode_data)
+    if os.path.exists(filename):
+        os.remove(filename)
+    sur.save(filename)
+
+
+def make_precessing(filename, ellMax=4, n_times=1200, n_nodes=6, seed=0):
+    """
+    Writes a synthetic NRSur7dq4 data file with modes up to ellMax.
+
+    n_times: Number of samples of the coorbital time domain.
+    n_nodes: Number of empirical nodes of each coorbital data piece.
+    """
+    rng = np.random.RandomState(seed)
+    t_ds = np.concatenate([-4000 + 5*np.arange(6), np.arange(-3970, 101, 10.)])
+    t_coorb = np.linspace(-4000, 100, n_times)
+    amp0 = 0.4*(1 + (t_coorb/10.)**2)**(-1./8)
+
+    def fit(const, scale, n_terms=8):
+        orders = np.zeros((n_terms, 7), dtype=np.int64)
+        for i in range(1, n_terms):
+            j = rng.randint(7)
+            orders[i, j] = rng.randint(1, 4 if j == 0 else 3)
+        coefs = scale*rng.randn(n_terms)
+        coefs[0] = const
+        return coefs, orders
+
+    def write_fit(group, key, const, scale):
+        coefs, orders = fit(const, scale)
+        group['%s_coefs'%key] = coefs
+        group['%s_bfOrders'%key] = orders
+
+    def write_component(f, name, scale):
+        group = f.create_group(name)
+        group['EIBasis'] = np.array([amp0*np.cos(t_coorb/(500.*(j + 1)))
+                                     for j in range(n_nodes)])/n_nodes
+        group['nodeIndices'] = np.sort(rng.choice(n_times, n_nodes,
+            replace=False))
+        node_modelers = group.create_group('nodeModelers')
+        for j in range(n_nodes):
+            coefs, orders = fit(scale, 0.1*scale)
+            node_modelers['coefs_%d'%j] = coefs
+            node_modelers['bfOrders_%d'%j] = orders
+
+    if os.path.exists(filename):
+        os.remove(filename)
+    with h5py.File(filename, 'w') as f:
+        f['t_ds'] = t_ds
+        n_ds = len(t_ds)
+        for i in range(n_ds):
+            group = f.create_group('ds_node_%d'%i)
+            omega = 0.02 + 0.18*(i/(n_ds - 1.))**3
+            write_fit(group, 'omega', omega, 1e-3*omega)
+            for k in range(2):
+                write_fit(group, 'omega_orb_%d'%k, 1e-4, 1e-5)
+            for key in ['chiA', 'chiB']:
+                for k in range(3):
+                    write_fit(group, '%s_%d'%(key, k), 0., 1e-5)
+
+        f['t_coorb'] = t_coorb
+        for ell in range(2, ellMax + 1):
+            for reim in ['real', 'imag']:
+                write_component(f, 'hCoorb_%d_0_%s'%(ell, reim), 0.01)
+            for m in range(1, ell + 1):
+                for reim in ['Re', 'Im']:
+                    for pm in ['+', '-']:
+                        scale = 1.0 if (ell, m, reim, pm) == (2, 2, 'Re', '+') \
+                            else 0.02
+                        write_component(f, 'hCoorb_%d_%d_%s%s'%(ell, m, reim,
+                            pm), scale)
+
+
+def get_model_files(data_dir=None):
+    """
+    Returns a dict with the model names as keys and the paths of the
+    synthetic data files as values. The files are generated in data_dir
+    (default: DEFAULT_DATA_DIR) if they do not exist yet.
+    """
+    if data_dir is None:
+        data_dir = DEFAULT_DATA_DIR
+    if not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+
+    files = {}
+    for name, make_file in [('NRHybSur3dq8', make_aligned),
+                            ('NRSur7dq4', make_precessing)]:
+        filename = os.path.join(data_dir, '%s_synthetic_v%d.h5'%(name,
+            SYNTHETIC_MODELS_VERSION))
+        if not os.path.isfile(filename):
+            # Write to a temporary file first, so that an interrupted run
+            # does not leave a broken file behind
+            tmp_filename = filename + '.tmp%d'%os.getpid()
+            make_file(tmp_filename)
+            os.rename(tmp_filename, filename)
+        files[name] = filename
+
+    # The tidal model is built on top of the NRHybSur3dq8 data
+    files['NRHybSur3dq8Tidal'] = files['NRHybSur3dq8']
+    return files
@@ -0,0 +1,150 @@
+"""Memory bounded caches used by the surrogate evaluators"""
+
+from __future__ import division  # for py2
+
+__copyright__ = "Copyright (C) 2014 Scott Field and Chad Galley"
+__email__     = "sfield@astro.cornell.edu, crgalley@tapir.caltech.edu"
+__status__    = "testing"
+__author__    = "Jonathan Blackman, Scott Field, Chad Galley, Vijay Varma"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+def nbytes(obj):
+    """
+    Approximate memory used by obj in bytes. Only numpy arrays and objects
+    with an nbytes attribute (like SplineOperator) are counted precisely,
+    containers are searched recursively and everything else is counted as 8
+    bytes.
+    """
+    if isinstance(obj, np.ndarray) or hasattr(obj, 'nbytes'):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sum(nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(nbytes(v) for v in obj)
+    return 8
+
+
+def copy_arrays(obj):
+    """
+    Returns a copy of obj where all numpy arrays, including those inside
+    (nested) dicts/lists/tuples, are copied.
+    """
+    if isinstance(obj, np.ndarray):
+        return np.copy(obj)
+    if isinstance(obj, dict):
+        return {k: copy_arrays(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(copy_arrays(v) for v in obj)
+    return obj
+
+
+def array_key(arr):
+    """
+    Hashable key for an array (or None). Large arrays, like a times array,
+    are replaced by their length and a digest of their data so that keys stay
+    small.
+    """
+    if arr is None:
+        return None
+    arr = np.ascontiguousarray(arr, dtype=float)
+    if arr.size <= 16:
+        return tuple(arr.ravel())
+    return (arr.shape, hashlib.sha1(arr.tobytes()).hexdigest())
+
+
+class LRUCache(object):
+    """
+    A least recently used cache, bounded by the total size in bytes of the
+    stored values.
+
+    Values should be numpy arrays or (nested) dicts/lists/tuples of numpy
+    arrays. Values are stored and returned as is, so the caller is
+    responsible for not modifying them in place.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        max_bytes: Maximum total size of the stored values. When exceeded, the
+                   least recently used entries are evicted. A value larger
+                   than max_bytes is never stored.
+        """
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key):
+        """ Returns the value for key, or None if not in the cache. """
+        if key not in self._data:
+            self.misses += 1
+            return None
+        self.hits += 1
+        value, size = self._data.pop(key)
+        self._data[key] = (value, size)
+        return value
+
+    def put(self, key, value):
+        """ Stores value for key, evicting old entries if needed. """
+        if key in self._data:
+            self.nbytes -= self._data.pop(key)[1]
+        size = nbytes(value)
+        if size > self.max_bytes:
+            return
+        self._data[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, old_size) = self._data.popitem(last=False)
+            self.nbytes -= old_size
+            self.evictions += 1
+
+    def clear(self):
+        """ Removes all entries and resets the counters. """
+        self._data.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def info(self):
+        """ Returns a dict with the cache statistics. """
+        return {
+            'entries': len(self._data),
+            'nbytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            }
@@ -0,0 +1,167 @@
+"""Versioned sidecar files with the compiled node fits of a surrogate"""
+
+from __future__ import division  # for py2
+
+__copyright__ = "Copyright (C) 2014 Scott Field and Chad Galley"
+__email__     = "sfield@astro.cornell.edu, crgalley@tapir.caltech.edu"
+__status__    = "testing"
+__author__    = "Jonathan Blackman, Scott Field, Chad Galley, Vijay Varma"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import warnings
+
+import numpy as np
+
+# Bump this when the format of the compiled arrays changes (see
+# nodeFunction.compile_node_functions). Sidecar files of other versions are
+# ignored, and replaced when a model is loaded with compiled_fits=True.
+SIDECAR_VERSION = 1
+
+# The loader of the load in progress, see loading
+_ACTIVE = None
+
+
+def sidecar_filename(h5filename):
+    """ The sidecar file of the surrogate data file h5filename. """
+    return '%s.compiled_fits_v%d.npz'%(os.path.splitext(h5filename)[0],
+        SIDECAR_VERSION)
+
+
+def _source_id(h5filename):
+    """ Identifies the version of h5filename the sidecar was built from. """
+    stat = os.stat(h5filename)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+class SidecarLoader(object):
+    """
+    Holds the compiled node fits of the data pieces of a surrogate while it
+    is being loaded. Data pieces are identified by the name of their group
+    in the h5 file.
+    """
+
+    def __init__(self, h5filename):
+        self.h5filename = h5filename
+        self.filename = sidecar_filename(h5filename)
+        self.source_id = _source_id(h5filename)
+        self.pieces = self._read()
+        self.n_read = 0
+        self.n_compiled = 0
+
+    def _read(self):
+        """
+        Returns a dict with the arrays of each data piece in the sidecar
+        file, or an empty dict if there is no valid sidecar file.
+        """
+        if not os.path.isfile(self.filename):
+            return {}
+        try:
+            with np.load(self.filename, allow_pickle=False) as data:
+                if int(data['__version__']) != SIDECAR_VERSION \
+                        or not np.array_equal(data['__source_id__'],
+                        self.source_id):
+                    return {}
+                pieces = {}
+                for key in data.files:
+                    if key.startswith('__'):
+                        continue
+                    path, name = key.split(':')
+                    pieces.setdefault(path, {})[name] = data[key]
+                return pieces
+        except Exception as e:
+            warnings.warn('Ignoring unreadable compiled fits file %s: %s'%(
+                self.filename, e))
+            return {}
+
+    def get(self, path):
+        """ Returns the arrays of the data piece at path, or None. """
+        arrays = self.pieces.get(path)
+        if arrays is not None:
+            self.n_read += 1
+        return arrays
+
+    def add(self, path, arrays):
+        """ Adds the arrays of a data piece that was compiled during the load.
+        """
+        self.pieces[path] = arrays
+        self.n_compiled += 1
+
+    def write(self):
+        """
+        Writes all data pieces to the sidecar file, if some were compiled
+        during this load. Failing to write, e.g. in a read-only directory,
+        only raises a warning.
+        """
+        if self.n_compiled == 0:
+            return
+        data = {'__version__': np.array(SIDECAR_VERSION),
+            '__source_id__': self.source_id}
+        for path, arrays in self.pieces.items():
+            for name, arr in arrays.items():
+                data['%s:%s'%(path, name)] = arr
+        # Write to a temporary file first, so that concurrent loads never see
+        # a partially written file
+        tmp_filename = '%s.tmp%d.npz'%(self.filename, os.getpid())
+        try:
+            np.savez(tmp_filename, **data)
+            os.replace(tmp_filename, self.filename)
+        except (IOError, OSError) as e:
+            warnings.warn('Could not write compiled fits file %s: %s'%(
+                self.filename, e))
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+
+
+class loading(object):
+    """
+    Context manager for loading a surrogate from h5filename with compiled
+    node fits. Data pieces found in the sidecar file of h5filename are
+    loaded without reading or building their node function objects, see
+    _SingleFunctionSurrogate_NoChecks. The others are loaded from the h5 file
+    and compiled, and the sidecar file is updated when the load succeeds.
+
+    Use as:
+    >>> with fit_sidecar.loading(h5filename):
+    >>>     sur.load(h5filename)
+    """
+
+    def __init__(self, h5filename):
+        self.loader = SidecarLoader(h5filename)
+
+    def __enter__(self):
+        global _ACTIVE
+        self._previous = _ACTIVE
+        _ACTIVE = self.loader
+        return self.loader
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _ACTIVE
+        _ACTIVE = self._previous
+        if exc_type is None:
+            self.loader.write()
+        return False
+
+
+def active_loader():
+    """ Returns the SidecarLoader of the load in progress, or None. """
+    return _ACTIVE
@@ -0,0 +1,138 @@
+"""Frequency domain output for time domain surrogate waveforms"""
+
+from __future__ import division  # for py2
+
+__copyright__ = "Copyright (C) 2014 Scott Field and Chad Galley"
+__email__     = "sfield@astro.cornell.edu, crgalley@tapir.caltech.edu"
+__status__    = "testing"
+__author__    = "Jonathan Blackman, Scott Field, Chad Galley, Vijay Varma"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import numpy as np
+from scipy import fft as _fft
+
+from gwsurrogate import spline_interp_Cwrapper
+from gwsurrogate.new.cache import LRUCache
+
+
+# Planck windows and time shift phasors per FFT length, see planck_window and
+# time_shift. The FFT plans themselves are cached by scipy.fft.
+_WINDOW_CACHE = LRUCache(2**28)
+
+
+def planck_window(n, n_start, n_end):
+    """
+    Planck taper window of length n, rising from 0 to 1 over the first
+    n_start samples and falling from 1 to 0 over the last n_end samples.
+    The window is cached, so it should not be modified.
+    """
+    key = ('planck', n, n_start, n_end)
+    window = _WINDOW_CACHE.get(key)
+    if window is not None:
+        return window
+
+    if n_start + n_end > n:
+        raise ValueError('The tapers are longer than the waveform.')
+    window = np.ones(n)
+    for taper, n_taper in [(window[:n_start], n_start),
+                           (window[::-1][:n_end], n_end)]:
+        if n_taper == 0:
+            continue
+        # x in (0, 1) over the taper, the end points are 0 and 1
+        x = np.arange(n_taper)/max(n_taper - 1, 1)
+        taper[0] = 0.
+        with np.errstate(divide='ignore', over='ignore'):
+            inner = x[1:-1]
+            taper[1:-1] = 1./(1. + np.exp(1./inner - 1./(1. - inner)))
+    _WINDOW_CACHE.put(key, window)
+    return window
+
+
+def fft_length(n, oversample=1):
+    """ An FFT friendly length of at least oversample*n samples. """
+    return _fft.next_fast_len(int(oversample*n))
+
+
+def rfft_freqs(n_fft, dt):
+    """ Frequencies of rfft for n_fft samples with time step dt. """
+    return np.arange(n_fft//2 + 1)/(n_fft*dt)
+
+
+def fft_freqs(n_fft, dt):
+    """ Frequencies of fft for n_fft samples with time step dt, sorted. """
+    return _fft.fftshift(_fft.fftfreq(n_fft, dt))
+
+
+def time_shift(freqs, t0):
+    """
+    Returns exp(-2j*pi*freqs*t0), which moves the time origin of the
+    discrete Fourier transform from the first sample, at t0, to t=0. Cached
+    per frequency grid, so it should not be modified.
+    """
+    key = ('shift', len(freqs), freqs[0], freqs[-1], t0)
+    shift = _WINDOW_CACHE.get(key)
+    if shift is None:
+        shift = np.exp(-2j*np.pi*freqs*t0)
+        _WINDOW_CACHE.put(key, shift)
+    return shift
+
+
+def rfft(h, dt, t0, n_fft):
+    """
+    Fourier transform of the real time series h (the last axis, with time
+    step dt, starting at t0), zero padded to n_fft samples:
+        htilde(f) = dt * sum_k h(t_k) exp(-2j*pi*f*t_k),
+    for the frequencies rfft_freqs(n_fft, dt). The padding is done by
+    scipy.fft, without copying h into a padded array.
+    """
+    freqs = rfft_freqs(n_fft, dt)
+    htilde = _fft.rfft(h, n=n_fft, axis=-1)
+    htilde *= dt*time_shift(freqs, t0)
+    return freqs, htilde
+
+
+def fft(h, dt, t0, n_fft):
+    """ Same as rfft, but for complex h, for the frequencies
+    fft_freqs(n_fft, dt), which include the negative frequencies. """
+    freqs = fft_freqs(n_fft, dt)
+    htilde = _fft.fftshift(_fft.fft(h, n=n_fft, axis=-1), axes=-1)
+    htilde *= dt*time_shift(freqs, t0)
+    return freqs, htilde
+
+
+def resample(freqs_out, freqs, htilde):
+    """
+    Resamples htilde, with the frequencies freqs along its last axis, onto
+    freqs_out. The amplitude and unwrapped phase are interpolated with cubic
+    splines, which is much more accurate than interpolating the rapidly
+    oscillating real and imaginary parts.
+    """
+    htilde = np.asarray(htilde)
+    shape = htilde.shape
+    htilde = htilde.reshape(-1, shape[-1])
+    amp = np.abs(htilde)
+    phase = np.unwrap(np.angle(htilde), axis=-1)
+    amp_phase = spline_interp_Cwrapper.interpolate_many(freqs_out, freqs,
+        np.concatenate([amp, phase]))
+    n_rows = len(htilde)
+    res = amp_phase[:n_rows]*np.exp(1j*amp_phase[n_rows:])
+    return res.reshape(shape[:-1] + (len(freqs_out),))
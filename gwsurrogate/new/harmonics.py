@@ -0,0 +1,202 @@
+"""Vectorized spin-weighted spherical harmonics and mode summation"""
+
+from __future__ import division  # for py2
+
+__copyright__ = "Copyright (C) 2014 Scott Field and Chad Galley"
+__email__     = "sfield@astro.cornell.edu, crgalley@tapir.caltech.edu"
+__status__    = "testing"
+__author__    = "Jonathan Blackman, Scott Field, Chad Galley, Vijay Varma"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from math import factorial
+
+import numpy as np
+
+from gwsurrogate.new.cache import LRUCache, array_key
+
+
+# Harmonic tables per (mode_list, orientation), see mode_sum_coefs. The
+# tables are small, this just bounds the memory if many orientations are used.
+_TABLE_CACHE = LRUCache(2**24)
+
+
+def _Cslm(s, l, m):
+    return np.sqrt(l*l * (4.0*l*l - 1.0) / ((l*l - m*m) * (l*l - s*s)))
+
+
+def _s_lambda_lm(s, l, m, x):
+    """ Same recursion as gwtools.harmonics.s_lambda_lm, but for arrays x. """
+    Pm = pow(-0.5, m)
+    if m != s:
+        Pm = Pm * np.power(1.0 + x, (m - s)*1.0/2)
+    if m != -s:
+        Pm = Pm * np.power(1.0 - x, (m + s)*1.0/2)
+    Pm = Pm * np.sqrt(factorial(2*m + 1) * 1.0
+        / (4.0*np.pi * factorial(m + s) * factorial(m - s)))
+
+    if l == m:
+        return Pm
+
+    Pm1 = (x + s*1.0/(m + 1)) * _Cslm(s, m + 1, m) * Pm
+    if l == m + 1:
+        return Pm1
+
+    for n in range(m + 2, l + 1):
+        Pn = (x + s*m * 1.0/(n*(n - 1.0))) * _Cslm(s, n, m) * Pm1 \
+            - _Cslm(s, n, m) * 1.0/_Cslm(s, n - 1, m) * Pm
+        Pm = Pm1
+        Pm1 = Pn
+    return Pn
+
+
+def sYlm(s, ell, m, theta, phi):
+    """
+    Spin-weighted spherical harmonic sYlm(theta, phi), following the same
+    conventions as gwtools.harmonics.sYlm, but theta and phi can be arrays.
+    Returns a complex array with the broadcast shape of theta and phi.
+    """
+    theta, phi = np.broadcast_arrays(np.asarray(theta, dtype=float),
+        np.asarray(phi, dtype=float))
+    result = np.zeros(theta.shape, dtype=complex)
+    if ell < 0 or abs(m) > ell or ell < abs(s):
+        return result
+
+    Pm = 1.0
+    ss = s
+    mm = m
+    if abs(m) < abs(s):
+        ss = m
+        mm = s
+        if (mm + ss) % 2:
+            Pm = -Pm
+    if mm < 0:
+        ss = -ss
+        mm = -mm
+        if (mm + ss) % 2:
+            Pm = -Pm
+
+    amp = Pm * _s_lambda_lm(ss, ell, mm, np.cos(theta))
+    result.real = amp * np.cos(m*phi)
+    result.imag = amp * np.sin(m*phi)
+    return result
+
+
+def sYlm_table(mode_list, theta, phi, s=-2):
+    """
+    Evaluates sYlm for all (ell, m) in mode_list at once.
+
+    Returns a complex array with shape theta.shape + (len(mode_list),),
+    where theta and phi are broadcast against each other.
+    """
+    theta, phi = np.broadcast_arrays(np.asarray(theta, dtype=float),
+        np.asarray(phi, dtype=float))
+    table = np.zeros(theta.shape + (len(mode_list),), dtype=complex)
+    for i, (ell, m) in enumerate(mode_list):
+        table[..., i] = sYlm(s, ell, m, theta, phi)
+    return table
+
+
+def mode_sum_coefs(mode_list, theta, phi, fake_neg_modes=False):
+    """
+    Returns the coefficients used by mode_sum, cached per orientation.
+
+    coefs, conj_coefs:
+        coefs: -2Ylm(theta, phi) for each mode in mode_list, with shape
+            theta.shape + (len(mode_list),).
+        conj_coefs: If fake_neg_modes, the complex conjugate of
+            (-1)**ell * -2Yl-m(theta, phi) for m>0 modes and 0 for m=0
+            modes. These multiply the m>0 modes to give the m<0 modes.
+            Otherwise None.
+
+    The returned arrays are shared with the cache, do not modify them.
+    """
+    mode_list = tuple((int(ell), int(m)) for ell, m in mode_list)
+    key = (mode_list, array_key(theta), array_key(phi), fake_neg_modes)
+    res = _TABLE_CACHE.get(key)
+    if res is not None:
+        return res
+
+    coefs = sYlm_table(mode_list, theta, phi)
+    conj_coefs = None
+    if fake_neg_modes:
+        if any(m < 0 for ell, m in mode_list):
+            # Looks like this m<0 mode exits, we should be using that.
+            raise Exception('Expected only m>0 modes.')
+        neg_modes = [(ell, -m) for ell, m in mode_list]
+        signs = np.array([(-1)**ell if m > 0 else 0 for ell, m in mode_list])
+        conj_coefs = np.conjugate(signs * sYlm_table(neg_modes, theta, phi))
+
+    res = (coefs, conj_coefs)
+    _TABLE_CACHE.put(key, res)
+    return res
+
+
+def mode_sum(h_modes, mode_list, theta, phi, fake_neg_modes=False, out=None):
+    """
+    Sums the modes h_modes, an array with shape (len(mode_list), ...),
+    usually (len(mode_list), n_times), at the orientation(s) theta, phi.
+
+    If fake_neg_modes = True, deduces m<0 modes from m>0 modes, in which case
+    m<0 modes should not be in mode_list.
+
+    Returns an array with shape theta.shape + h_modes.shape[1:]. For arrays
+    of theta/phi, this is a single (n_orient, n_modes) x (n_modes, n_times)
+    matrix product.
+
+    If out is given, it should be a complex128 array with this shape; the
+    result is written into it and out is returned.
+    """
+    coefs, conj_coefs = mode_sum_coefs(mode_list, theta, phi,
+        fake_neg_modes=fake_neg_modes)
+    if out is None:
+        h = np.tensordot(coefs, h_modes, axes=1)
+    else:
+        shape = np.shape(coefs)[:-1] + np.shape(h_modes)[1:]
+        if not isinstance(out, np.ndarray) or out.dtype != np.complex128 \
+                or out.shape != shape:
+            raise ValueError('out should be a complex128 array with shape'
+                ' %s.'%(shape,))
+        if out.ndim <= 2 and out.flags.c_contiguous \
+                and h_modes.dtype == np.complex128:
+            # Writes the product directly into out
+            np.dot(coefs, h_modes, out=out)
+        else:
+            out[...] = np.tensordot(coefs, h_modes, axes=1)
+        h = out
+    if conj_coefs is not None:
+        # sum_lm c_lm conj(h_lm) = conj(sum_lm conj(c_lm) h_lm)
+        h_neg = np.tensordot(conj_coefs, h_modes, axes=1)
+        h += np.conjugate(h_neg, out=h_neg)
+    return h
+
+
+def stack_modes(h_modes):
+    """
+    Converts a dict of modes with (ell, m) keys into (mode_list, h) where h
+    is a contiguous array with shape (len(mode_list), n_times).
+    """
+    mode_list = list(h_modes.keys())
+    first = h_modes[mode_list[0]]
+    h = np.empty((len(mode_list),) + np.shape(first), dtype=complex)
+    for i, mode in enumerate(mode_list):
+        h[i] = h_modes[mode]
+    return mode_list, h
@@ -0,0 +1,162 @@
+"""
+Piecewise uniform (multibanded) time grids for time domain surrogates.
+
+The early inspiral of a long waveform oscillates much slower than the merger,
+so it can be sampled with a much larger time step. A multibanded grid is a
+sequence of bands, each uniformly sampled, with time steps dt_min*2**k that
+decrease towards the merger. The time step of each band is chosen from the
+frequency of the (2,2) mode, such that the highest mode is sampled with at
+least samples_per_cycle samples per cycle.
+"""
+
+from __future__ import division  # for py2
+
+__copyright__ = "Copyright (C) 2014 Scott Field and Chad Galley"
+__email__     = "sfield@astro.cornell.edu, crgalley@tapir.caltech.edu"
+__status__    = "testing"
+__author__    = "Jonathan Blackman, Scott Field, Chad Galley, Vijay Varma"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import numpy as np
+
+# The largest time step is dt_min*2**MAX_LEVEL, if dt_max is not given
+MAX_LEVEL = 20
+
+
+def get_multiband_opts(multiband_opts):
+    """
+    Returns (dt_max, samples_per_cycle) from a multiband_opts dict, see the
+    __call__ of the models. Raises a ValueError for unknown keys.
+    """
+    opts = dict(multiband_opts)
+    dt_max = opts.pop('dt_max', None)
+    samples_per_cycle = opts.pop('samples_per_cycle', 4)
+    if len(opts) != 0:
+        raise ValueError('Unused keys in multiband_opts: %s'%(
+            ', '.join("'%s'"%k for k in opts.keys())))
+    if samples_per_cycle <= 2:
+        raise ValueError('samples_per_cycle should be larger than 2.')
+    return dt_max, samples_per_cycle
+
+
+def multiband_times(t0, tf, times, omega22, dt_min, m_max, dt_max=None,
+        samples_per_cycle=4):
+    """
+    Piecewise uniform time grid from t0 to tf, see the module docstring.
+
+    t0, tf:     Start and end of the grid. The grid starts at t0, and all
+                times are smaller than tf.
+    times, omega22:
+                The angular frequency of the (2,2) mode omega22 at times, for
+                example on the sparse surrogate domain. Only the increasing
+                part of the frequency should be included. After times[-1],
+                dt_min is used.
+    dt_min:     The smallest time step, used after times[-1].
+    m_max:      The largest |m| of the modes, which sets the highest
+                frequency m_max*omega22/2.
+    dt_max:     The largest time step. Default: None, no limit.
+    samples_per_cycle:
+                Minimum number of samples per cycle of the highest mode.
+
+    Returns timesM, edges, key
+        timesM: The grid. Band k starts where band k-1 would have continued.
+        edges:  The indices of the starts of the bands, followed by
+            len(timesM), see split_bands. Every band but the last one has at
+            least two samples.
+        key:    A hashable key, which determines the grid.
+    """
+    # The largest allowed time step at each time, from the frequency of the
+    # highest mode. The running maximum makes this nonincreasing in time,
+    # even with small wiggles in the frequency.
+    omega_max = np.maximum.accumulate(np.abs(omega22))*m_max/2.
+    with np.errstate(divide='ignore'):
+        dt_allowed = 2*np.pi/(samples_per_cycle*omega_max)
+    max_level = MAX_LEVEL if dt_max is None \
+        else max(int(np.floor(np.log2(dt_max/dt_min))), 0)
+    levels = np.floor(np.log2(dt_allowed/dt_min))
+    levels = np.clip(np.nan_to_num(levels), 0, max_level).astype(int)
+
+    bands = []
+    t_start = t0
+    level = levels[np.searchsorted(times, t0, side='right') - 1] \
+        if t0 >= times[0] else levels[0]
+    while level > 0:
+        dt = dt_min*2**level
+        # The band ends at the last time where its time step is allowed
+        idx = np.where(levels < level)[0]
+        t_end = min(times[idx[0] - 1] if len(idx) else times[-1], tf)
+        num_times = int(np.floor((t_end - t_start)/dt))
+        # A band with a single sample has no time step of its own, so the
+        # next band, with a smaller time step, starts here instead
+        if num_times > 1:
+            bands.append((dt, num_times, t_start))
+            t_start = t_start + dt*num_times
+        level -= 1
+    bands.append((dt_min, max(int(np.ceil((tf - t_start)/dt_min)), 1),
+        t_start))
+
+    timesM = np.concatenate([start + dt*np.arange(num_times)
+        for dt, num_times, start in bands])
+    edges = np.concatenate([[0], np.cumsum([num_times for _, num_times, _
+        in bands])])
+    key = ('multiband', t0) + tuple((dt, num_times) for dt, num_times, _
+        in bands)
+    return timesM, edges, key
+
+
+def slice_edges(edges, start, stop=None):
+    """
+    Returns the band edges of times[start:stop], given the band edges of
+    times, see multiband_times.
+    """
+    edges = np.asarray(edges)
+    if stop is None:
+        stop = edges[-1]
+    inner = edges[(edges > start) & (edges < stop)]
+    return np.concatenate([[0], inner - start, [stop - start]])
+
+
+def band_edges(times):
+    """
+    Returns the indices of the starts of the bands of a multibanded grid
+    times, followed by len(times). Band i is times[edges[i]:edges[i+1]].
+    The bands are found from the changes of the time step, so a band with a
+    single sample at the end of times is merged into the previous band. Use
+    the edges returned by multiband_times where they are available.
+    """
+    if len(times) < 3:
+        return np.array([0, len(times)])
+    steps = np.diff(times)
+    change = np.abs(steps[1:] - steps[:-1]) \
+        > 0.25*np.minimum(steps[1:], steps[:-1])
+    return np.concatenate([[0], np.where(change)[0] + 1, [len(times)]])
+
+
+def split_bands(edges, arr):
+    """
+    Splits the last axis of arr, or of each value of a dict of arrays, into
+    the bands given by edges. Returns a list of views, one per band.
+    """
+    slices = [slice(i, j) for i, j in zip(edges[:-1], edges[1:])]
+    if isinstance(arr, dict):
+        return [{k: v[..., s] for k, v in arr.items()} for s in slices]
+    return [arr[..., s] for s in slices]
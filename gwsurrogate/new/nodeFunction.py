@@ -37,6 +37,7 @@ from gwsurrogate import parametric_funcs
 import numpy as np
 import gwtools
 from gwsurrogate.eval_pysur import evaluate_fit
+from sklearn import gaussian_process
 
 import warnings
 
@@ -97,6 +98,23 @@ class pySurrogateFit(SimpleH5Object):
         return self.fitFunc(x)
 
 
+def _NRHybSur3dq8_fit_params(x):
+    """
+    Maps from [q, chi1z, chi2z] to [np.log(q), chiHat, chi_a], see
+    NRHybSur3dq8Fit. x can also be an array with shape (n_params, 3), in
+    which case the mapped parameters have the same shape.
+    """
+    x = np.asarray(x, dtype=float)
+    q, chi1z, chi2z = x[..., 0], x[..., 1], x[..., 2]
+
+    eta = q/(1.+q)**2
+    chi_wtAvg = (q*chi1z+chi2z)/(1.+q)
+    chiHat = (chi_wtAvg - 38.*eta/113.*(chi1z + chi2z))/(1. - 76.*eta/113.)
+    chi_a = (chi1z - chi2z)/2.
+
+    return np.stack([np.log(q), chiHat, chi_a], axis=-1)
+
+
 class NRHybSur3dq8Fit(pySurrogateFit):
     """
     Evaluates fits for the NRHybSur3dq8 surrogate model.
@@ -108,14 +126,7 @@ class NRHybSur3dq8Fit(pySurrogateFit):
     """
 
     def __call__(self, x):
-        q, chi1z, chi2z = x
-
-        eta = q/(1.+q)**2
-        chi_wtAvg = (q*chi1z+chi2z)/(1.+q)
-        chiHat = (chi_wtAvg - 38.*eta/113.*(chi1z + chi2z))/(1. - 76.*eta/113.)
-        chi_a = (chi1z - chi2z)/2.
-
-        mapped_x = [np.log(q), chiHat, chi_a]
+        mapped_x = list(_NRHybSur3dq8_fit_params(x))
 
         with warnings.catch_warnings():
             # Ignore this specific GPR warning.
@@ -140,6 +151,433 @@ class MappedPolyFit1D_q10_q_to_nu(Polyfit1D):
         return super(MappedPolyFit1D_q10_q_to_nu, self).__call__(mapped_x)
 
 
+def _rbf_params(kernel):
+    """
+    If kernel(x, X_train) is the same as c*RBF(length_scale)(x, X_train) for
+    x not in X_train, returns (c, length_scale). Otherwise returns None.
+
+    This covers the kernels used for the NRHybSur3dq8 fits, like
+    ConstantKernel*RBF + WhiteKernel. WhiteKernel only contributes when x is
+    in X_train, so it does not affect predictions.
+    """
+    # Compare exact types, since e.g. Matern is a subclass of RBF
+    kernels = gaussian_process.kernels
+    if type(kernel) == kernels.RBF:
+        return 1., kernel.length_scale
+    if type(kernel) == kernels.Product:
+        for k1, k2 in [(kernel.k1, kernel.k2), (kernel.k2, kernel.k1)]:
+            if type(k1) == kernels.ConstantKernel:
+                res = _rbf_params(k2)
+                if res is not None:
+                    return k1.constant_value*res[0], res[1]
+    if type(kernel) == kernels.Sum:
+        for k1, k2 in [(kernel.k1, kernel.k2), (kernel.k2, kernel.k1)]:
+            if type(k1) == kernels.WhiteKernel:
+                return _rbf_params(k2)
+    return None
+
+
+class _GPRGroup(object):
+    """
+    GPR fits that share their training points, evaluated with a single
+    kernel evaluation and a matrix product with the stacked alpha vectors.
+
+    If all fits have a kernel of the form c*RBF(length_scale) (see
+    _rbf_params), rbf_consts and rbf_inv_l2 hold c and 1/length_scale**2 of
+    each fit, and the kernels of all fits are evaluated together even when
+    their hyperparameters differ. Otherwise, kernel is the kernel shared by
+    all fits in the group.
+    """
+
+    def __init__(self, X_train, alphas, rbf_consts=None, rbf_inv_l2=None,
+            kernel=None):
+        """
+        X_train:    Training points, shape (n_train, dim).
+        alphas:     Stacked alpha vectors, shape (n_train, n_fits).
+        rbf_consts: Shape (n_fits,), or None if kernel is given.
+        rbf_inv_l2: Shape (dim, n_fits), or None if kernel is given.
+        kernel:     The sklearn kernel of all fits, only used if rbf_consts
+                    is None.
+        """
+        self.X_train = X_train
+        self.alphas = alphas
+        self.rbf_consts = rbf_consts
+        self.rbf_inv_l2 = rbf_inv_l2
+        self.kernel = kernel
+
+    def __call__(self, xs):
+        """ Returns the normalized GPR predictions, shape (n_params, n_fits).
+        """
+        if self.rbf_consts is None:
+            return self.kernel(xs, self.X_train).dot(self.alphas)
+
+        # diff2.dot(self.rbf_inv_l2)[i, j, k] is the squared distance
+        # between xs[i] and X_train[j], scaled by the length scales of fit k
+        diff2 = (xs[:, np.newaxis, :] - self.X_train[np.newaxis, :, :])**2
+        kernel_vals = np.exp(-0.5*diff2.dot(self.rbf_inv_l2))
+        kernel_vals *= self.rbf_consts
+        return np.einsum('ijk,jk->ik', kernel_vals, self.alphas)
+
+
+def _gpr_group(X_train, kernel, predictors):
+    """ Creates a _GPRGroup from GPRPredictors sharing X_train. """
+    alphas = np.array([np.ravel(p.GPR_obj.alpha_) for p in predictors]).T
+    rbf_params = [_rbf_params(p.GPR_obj.kernel_) for p in predictors]
+    if any(res is None for res in rbf_params):
+        return _GPRGroup(X_train, alphas, kernel=kernel)
+
+    dim = X_train.shape[1]
+    rbf_consts = np.array([res[0] for res in rbf_params])
+    rbf_inv_l2 = np.array([
+        np.broadcast_to(1./np.asarray(res[1], dtype=float)**2, dim)
+        for res in rbf_params]).T
+    return _GPRGroup(X_train, alphas, rbf_consts, rbf_inv_l2)
+
+
+class BatchedGPRFits(object):
+    """
+    Evaluates a list of NRHybSur3dq8Fit GPR fits together, for example all
+    node functions of a data piece. The parameters are mapped to the fit
+    parameters only once, and fits sharing training points are evaluated
+    together, see _GPRGroup.
+
+    Use get_batched_node_evaluator or CompiledNodeFits to create one.
+    """
+
+    def __init__(self, groups, group_indices, y_train_std, y_train_mean,
+            data_std, data_mean, lin_indices, lin_coefs=None,
+            lin_intercepts=None):
+        """
+        groups:         A list of _GPRGroups.
+        group_indices:  For each group, the indices of its fits.
+        y_train_std, y_train_mean, data_std, data_mean:
+                        The normalization of the data of each fit, see
+                        evaluate_fit.GPRPredictor. Each has shape (n_fits,).
+        lin_indices:    Indices of the fits with a linear model.
+        lin_coefs:      Coefficients of these linear models, shape
+                        (dim, len(lin_indices)).
+        lin_intercepts: Intercepts of these linear models.
+        """
+        self.groups = groups
+        self.group_indices = group_indices
+        self.n_fits = len(y_train_std)
+        self.y_train_std = y_train_std
+        self.y_train_mean = y_train_mean
+        self.data_std = data_std
+        self.data_mean = data_mean
+        self.lin_indices = lin_indices
+        self.lin_coefs = lin_coefs
+        self.lin_intercepts = lin_intercepts
+
+    def __call__(self, x):
+        """ Evaluates all fits at x = [q, chi1z, chi2z]. """
+        return self.evaluate_batch(np.asarray(x, dtype=float)[np.newaxis])[0]
+
+    def evaluate_batch(self, xs):
+        """
+        Evaluates all fits at each row of xs, which should have shape
+        (n_params, 3). Returns an array with shape (n_params, n_fits).
+        """
+        return self._evaluate_mapped(_NRHybSur3dq8_fit_params(xs))
+
+    def _evaluate_mapped(self, mapped_xs):
+        res = np.empty((len(mapped_xs), self.n_fits))
+        for group, indices in zip(self.groups, self.group_indices):
+            res[:, indices] = group(mapped_xs)
+
+        # Undo the normalizations, see GaussianProcessRegressor.predict and
+        # evaluate_fit.GPRPredictor
+        res = res*self.y_train_std + self.y_train_mean
+        res = res*self.data_std + self.data_mean
+        if len(self.lin_indices) > 0:
+            res[:, self.lin_indices] += mapped_xs.dot(self.lin_coefs) \
+                + self.lin_intercepts
+        return res
+
+    def to_arrays(self):
+        """
+        Returns a dict of arrays from which CompiledNodeFits can rebuild
+        these fits, or None if some group does not have RBF kernels.
+        """
+        if any(group.rbf_consts is None for group in self.groups):
+            return None
+        arrays = {
+            'gpr_n_groups': np.array(len(self.groups)),
+            'gpr_y_train_std': self.y_train_std,
+            'gpr_y_train_mean': self.y_train_mean,
+            'gpr_data_std': self.data_std,
+            'gpr_data_mean': self.data_mean,
+            'gpr_lin_indices': self.lin_indices,
+            }
+        if len(self.lin_indices) > 0:
+            arrays['gpr_lin_coefs'] = self.lin_coefs
+            arrays['gpr_lin_intercepts'] = self.lin_intercepts
+        for i, (group, indices) in enumerate(zip(self.groups,
+                self.group_indices)):
+            arrays['gpr_%d_indices'%i] = indices
+            arrays['gpr_%d_X_train'%i] = group.X_train
+            arrays['gpr_%d_alphas'%i] = group.alphas
+            arrays['gpr_%d_rbf_consts'%i] = group.rbf_consts
+            arrays['gpr_%d_rbf_inv_l2'%i] = group.rbf_inv_l2
+        return arrays
+
+
+def _batched_gpr_fits(fit_data_list):
+    """
+    Creates a BatchedGPRFits from the fit_data of NRHybSur3dq8Fit GPR fits.
+    """
+    predictors = [evaluate_fit.GPRPredictor(fit_data)
+        for fit_data in fit_data_list]
+
+    # Group the fits by their training points. Fits whose kernel is not
+    # of the RBF form additionally need the same kernel.
+    groups = []
+    for i, p in enumerate(predictors):
+        X_train = np.asarray(p.GPR_obj.X_train_, dtype=float)
+        kernel = p.GPR_obj.kernel_
+        is_rbf = _rbf_params(kernel) is not None
+        for group in groups:
+            if group['is_rbf'] == is_rbf \
+                    and np.array_equal(group['X_train'], X_train) \
+                    and (is_rbf or group['kernel'] == kernel):
+                group['indices'].append(i)
+                break
+        else:
+            groups.append({'X_train': X_train, 'kernel': kernel,
+                'is_rbf': is_rbf, 'indices': [i]})
+
+    gpr_groups = [_gpr_group(group['X_train'], group['kernel'],
+        [predictors[i] for i in group['indices']]) for group in groups]
+    group_indices = [np.array(group['indices']) for group in groups]
+
+    # Linear models that were subtracted before the GPR fits
+    lin_indices = np.array([i for i, p in enumerate(predictors)
+        if p.linearModel is not None], dtype=int)
+    lin_coefs = None
+    lin_intercepts = None
+    if len(lin_indices) > 0:
+        lin_coefs = np.array([np.ravel(predictors[i].linearModel.coef_)
+            for i in lin_indices]).T
+        lin_intercepts = np.array([
+            np.ravel(predictors[i].linearModel.intercept_)[0]
+            for i in lin_indices])
+
+    return BatchedGPRFits(gpr_groups, group_indices,
+        np.array([np.ravel(p.GPR_obj._y_train_std)[0] for p in predictors]),
+        np.array([np.ravel(p.GPR_obj._y_train_mean)[0] for p in predictors]),
+        np.array([p.data_std for p in predictors], dtype=float),
+        np.array([p.data_mean for p in predictors], dtype=float),
+        lin_indices, lin_coefs, lin_intercepts)
+
+
+def _is_gpr_fit(fit):
+    return type(fit) == NRHybSur3dq8Fit and fit.fit_data is not None \
+        and fit.fit_data.get('fitType') == 'GPR'
+
+
+def get_batched_node_evaluator(node_functions):
+    """
+    Returns a BatchedGPRFits evaluating all node_functions (a list of
+    NodeFunctions) together, or None if some of them are not NRHybSur3dq8Fit
+    GPR fits.
+    """
+    if len(node_functions) == 0:
+        return None
+    if not all(_is_gpr_fit(nf.node_function) for nf in node_functions):
+        return None
+    return _batched_gpr_fits([nf.node_function.fit_data
+        for nf in node_functions])
+
+
+def as_batched_gpr_fits(evaluator):
+    """
+    Returns evaluator, a node evaluator of a data piece, as a BatchedGPRFits
+    if all its node functions are GPR fits. Otherwise returns None.
+    """
+    if isinstance(evaluator, BatchedGPRFits):
+        return evaluator
+    if isinstance(evaluator, CompiledNodeFits) \
+            and len(evaluator.poly_indices) == 0:
+        return evaluator.gpr_fits
+    return None
+
+
+def _can_merge(group1, group2):
+    """ Whether two _GPRGroups can be evaluated as one. """
+    if not np.array_equal(group1.X_train, group2.X_train):
+        return False
+    if group1.rbf_consts is not None and group2.rbf_consts is not None:
+        return True
+    return group1.rbf_consts is None and group2.rbf_consts is None \
+        and group1.kernel == group2.kernel
+
+
+def merge_gpr_fits(fits_list):
+    """
+    Combines a list of BatchedGPRFits into one that evaluates all their fits,
+    in order. Groups that share their training points are merged, so that for
+    example all node functions of a model whose GPR fits share the training
+    points are evaluated with a single kernel evaluation.
+    """
+    groups = []
+    offset = 0
+    for fits in fits_list:
+        for group, indices in zip(fits.groups, fits.group_indices):
+            indices = indices + offset
+            for merged in groups:
+                if _can_merge(merged['group'], group):
+                    merged['parts'].append((group, indices))
+                    break
+            else:
+                groups.append({'group': group, 'parts': [(group, indices)]})
+        offset += fits.n_fits
+
+    gpr_groups = []
+    group_indices = []
+    for merged in groups:
+        parts = [g for g, _ in merged['parts']]
+        g = merged['group']
+        if g.rbf_consts is None:
+            gpr_groups.append(_GPRGroup(g.X_train,
+                np.hstack([p.alphas for p in parts]), kernel=g.kernel))
+        else:
+            gpr_groups.append(_GPRGroup(g.X_train,
+                np.hstack([p.alphas for p in parts]),
+                np.concatenate([p.rbf_consts for p in parts]),
+                np.hstack([p.rbf_inv_l2 for p in parts])))
+        group_indices.append(np.concatenate([i for _, i in merged['parts']]))
+
+    offsets = np.cumsum([0] + [fits.n_fits for fits in fits_list])
+    lin_fits = [(fits, off) for fits, off in zip(fits_list, offsets)
+        if len(fits.lin_indices) > 0]
+    lin_indices = np.array([], dtype=int)
+    lin_coefs = None
+    lin_intercepts = None
+    if len(lin_fits) > 0:
+        lin_indices = np.concatenate([fits.lin_indices + off
+            for fits, off in lin_fits])
+        lin_coefs = np.hstack([fits.lin_coefs for fits, _ in lin_fits])
+        lin_intercepts = np.concatenate([fits.lin_intercepts
+            for fits, _ in lin_fits])
+
+    return BatchedGPRFits(gpr_groups, group_indices,
+        np.concatenate([fits.y_train_std for fits in fits_list]),
+        np.concatenate([fits.y_train_mean for fits in fits_list]),
+        np.concatenate([fits.data_std for fits in fits_list]),
+        np.concatenate([fits.data_mean for fits in fits_list]),
+        lin_indices, lin_coefs, lin_intercepts)
+
+
+# Input maps of the Polyfit1D classes, see CompiledNodeFits
+POLYFIT_MAPS = {
+    Polyfit1D: 0,
+    MappedPolyFit1D_q10_q_to_nu: 1,
+    }
+
+
+def compile_node_functions(node_functions):
+    """
+    Converts node_functions, a list of NodeFunctions, into a dict of numpy
+    arrays from which CompiledNodeFits evaluates them, without any of the
+    fit objects. Supported are NRHybSur3dq8Fit GPR fits with kernels of the
+    form c*RBF (see _rbf_params), Polyfit1D and MappedPolyFit1D_q10_q_to_nu.
+    Returns None if some node function is not supported.
+    """
+    gpr_indices = []
+    poly_indices = []
+    for i, nf in enumerate(node_functions):
+        fit = nf.node_function
+        if _is_gpr_fit(fit):
+            gpr_indices.append(i)
+        elif type(fit) in POLYFIT_MAPS and np.ndim(fit.coefs) == 1 \
+                and np.asarray(fit.coefs).dtype.kind in 'iuf':
+            poly_indices.append(i)
+        else:
+            return None
+
+    arrays = {'n_nodes': np.array(len(node_functions)),
+        'gpr_indices': np.array(gpr_indices, dtype=int),
+        'poly_indices': np.array(poly_indices, dtype=int)}
+
+    if len(gpr_indices) > 0:
+        gpr_arrays = _batched_gpr_fits([node_functions[i].node_function.fit_data
+            for i in gpr_indices]).to_arrays()
+        if gpr_arrays is None:
+            return None
+        arrays.update(gpr_arrays)
+
+    if len(poly_indices) > 0:
+        fits = [node_functions[i].node_function for i in poly_indices]
+        n_coefs = np.array([len(fit.coefs) for fit in fits], dtype=int)
+        coefs = np.zeros((len(fits), max(n_coefs)))
+        for j, fit in enumerate(fits):
+            coefs[j, :n_coefs[j]] = fit.coefs
+        arrays['poly_function_names'] = np.array([fit.function_name
+            for fit in fits])
+        arrays['poly_maps'] = np.array([POLYFIT_MAPS[type(fit)]
+            for fit in fits], dtype=int)
+        arrays['poly_n_coefs'] = n_coefs
+        arrays['poly_coefs'] = coefs
+
+    return arrays
+
+
+class CompiledNodeFits(object):
+    """
+    Evaluates all node functions of a data piece from the arrays created by
+    compile_node_functions. Has the same interface as BatchedGPRFits.
+    """
+
+    def __init__(self, arrays):
+        """ arrays: A dict as returned by compile_node_functions. """
+        self.n_fits = int(arrays['n_nodes'])
+        self.gpr_indices = arrays['gpr_indices']
+        self.poly_indices = arrays['poly_indices']
+
+        self.gpr_fits = None
+        if len(self.gpr_indices) > 0:
+            n_groups = int(arrays['gpr_n_groups'])
+            groups = [_GPRGroup(arrays['gpr_%d_X_train'%i],
+                arrays['gpr_%d_alphas'%i], arrays['gpr_%d_rbf_consts'%i],
+                arrays['gpr_%d_rbf_inv_l2'%i]) for i in range(n_groups)]
+            group_indices = [arrays['gpr_%d_indices'%i]
+                for i in range(n_groups)]
+            self.gpr_fits = BatchedGPRFits(groups, group_indices,
+                arrays['gpr_y_train_std'], arrays['gpr_y_train_mean'],
+                arrays['gpr_data_std'], arrays['gpr_data_mean'],
+                arrays['gpr_lin_indices'], arrays.get('gpr_lin_coefs'),
+                arrays.get('gpr_lin_intercepts'))
+
+        if len(self.poly_indices) > 0:
+            self.poly_funcs = [parametric_funcs.function_dict[str(name)]
+                for name in arrays['poly_function_names']]
+            self.poly_maps = arrays['poly_maps']
+            self.poly_coefs = [coefs[:n] for coefs, n
+                in zip(arrays['poly_coefs'], arrays['poly_n_coefs'])]
+
+    def __call__(self, x):
+        """ Evaluates all node functions at x. """
+        return self.evaluate_batch(np.asarray(x, dtype=float)[np.newaxis])[0]
+
+    def evaluate_batch(self, xs):
+        """
+        Evaluates all node functions at each row of xs, which should have
+        shape (n_params, dim). Returns an array with shape
+        (n_params, n_nodes).
+        """
+        xs = np.asarray(xs, dtype=float)
+        res = np.empty((len(xs), self.n_fits))
+        if self.gpr_fits is not None:
+            res[:, self.gpr_indices] = self.gpr_fits.evaluate_batch(xs)
+        if len(self.poly_indices) > 0:
+            # Same as Polyfit1D and MappedPolyFit1D_q10_q_to_nu
+            mapped_xs = [xs[:, 0], 4*gwtools.q_to_nu(xs[:, 0])]
+            for i, func, input_map, coefs in zip(self.poly_indices,
+                    self.poly_funcs, self.poly_maps, self.poly_coefs):
+                res[:, i] = func(coefs, mapped_xs[input_map])
+        return res
+
+
 NODE_CLASSES = {
     "Dummy": DummyNodeFunction,
     "Polyfit1D": Polyfit1D,
@@ -12,11 +12,16 @@ NOTE: Many of these functions are borrowed from the NR7dq2 python package.
 
 import os
 import numpy as np
+from scipy import sparse
 import h5py
 from gwsurrogate.precessing_utils import _utils
 import warnings
-from gwtools.harmonics import sYlm
-from gwsurrogate.new.surrogate import _splinterp_Cwrapper
+from gwsurrogate.new.surrogate import _splinterp_Cwrapper, \
+    _splinterp_Cwrapper_many, _splinterp_cached, _basis_dtype
+from gwsurrogate.new.cache import array_key, copy_arrays
+from gwsurrogate.new import harmonics
+from gwsurrogate.new import multiband
+from gwsurrogate.new import profiling
 
 
 ###############################################################################
@@ -39,8 +44,61 @@ def quatInv(q):
 ###############################################################################
 # Functions related to frame transformations
 
-def _assemble_powers(thing, powers):
-    return np.array([thing**power for power in powers])
+# The coefficients of the Wigner-D matrices for each ellMax, see _wigner_tables
+_WIGNER_TABLES = {}
+
+def _wigner_tables(ellMax):
+    """
+The parts of the Wigner-D matrix elements for 2 <= ell <= ellMax that only
+depend on ellMax, see _wignerD_matrices. The elements (ell, m, mp) are
+flattened in the order of increasing ell, m and mp. Returns a dict with
+    size: The number of elements.
+    coefs: _utils.wigner_coef(ell, mp, m) for each element.
+    ra_idx, rb_idx, abs_idx: For each element, the exponents of ra and rb
+        plus 2*ellMax, and the exponent of abs(ra)**2.
+    poly: Array with shape (size, 2*ellMax+1), the coefficients of the
+        polynomial in abs(rb/ra)**2 of each element.
+    rho_min, rho_max: The range of nonzero coefficients in poly.
+    anti_idx, anti_sign, anti_pow: The elements with mp = -m, with the sign
+        and power of rb for the times where ra is small.
+    diag_idx, diag_pow: The elements with mp = m, with the power of ra for the
+        times where rb is small.
+The tables are computed once for each ellMax.
+    """
+    tables = _WIGNER_TABLES.get(ellMax)
+    if tables is not None:
+        return tables
+
+    elements = [(ell, m, mp) for ell in range(2, ellMax+1)
+        for m in range(-ell, ell+1) for mp in range(-ell, ell+1)]
+    ell, m, mp = np.array(elements).T
+    poly = np.zeros((len(elements), 2*ellMax+1))
+    rho_min = np.maximum(0, mp-m).astype(np.int64)
+    rho_max = np.minimum(ell+mp, ell-m).astype(np.int64)
+    for i, (ell_i, m_i, mp_i) in enumerate(elements):
+        for rho in range(rho_min[i], rho_max[i]+1):
+            poly[i, rho] = ((-1)**rho)*(_utils.binom(ell_i+mp_i, rho)*
+                                        _utils.binom(ell_i-mp_i, ell_i-rho-m_i))
+    anti = np.where(mp == -m)[0]
+    diag = np.where(mp == m)[0]
+    tables = {
+        'size': len(elements),
+        'coefs': np.array([_utils.wigner_coef(ell_i, mp_i, m_i)
+            for ell_i, m_i, mp_i in elements]),
+        'ra_idx': (2*ellMax + m + mp).astype(np.int64),
+        'rb_idx': (2*ellMax + m - mp).astype(np.int64),
+        'abs_idx': (ell - m).astype(np.int64),
+        'rho_min': rho_min,
+        'rho_max': rho_max,
+        'poly': poly,
+        'anti_idx': anti,
+        'anti_sign': np.where((ell[anti] + m[anti])%2 == 1, 1., -1.),
+        'anti_pow': 2*m[anti],
+        'diag_idx': diag,
+        'diag_pow': 2*m[diag],
+        }
+    _WIGNER_TABLES[ellMax] = tables
+    return tables
 
 def _wignerD_matrices(q, ellMax):
     """
@@ -56,6 +114,7 @@ https://github.com/moble/GWFrames
 written by Michael Boyle, based on his paper:
 http://arxiv.org/abs/1302.2919
     """
+    tables = _wigner_tables(ellMax)
     ra = q[0] + 1.j*q[3]
     rb = q[2] + 1.j*q[1]
     ra_small = (abs(ra) < 1.e-12)
@@ -64,45 +123,44 @@ http://arxiv.org/abs/1302.2919
     i2 = np.where(ra_small)[0]
     i3 = np.where((1 - ra_small)*rb_small)[0]
 
+    # All elements, flattened as in _wigner_tables
     n = len(ra)
-    lvals = range(2, ellMax+1)
-    matrices = [0.j*np.zeros((2*ell+1, 2*ell+1, n)) for ell in lvals]
+    if len(i1) == n:
+        elements = np.empty((tables['size'], n), dtype=complex)
+    else:
+        elements = np.zeros((tables['size'], n), dtype=complex)
 
     # Determine res at i2: it's 0 unless mp == -m
     # Determine res at i3: it's 0 unless mp == m
-    for i, ell in enumerate(lvals):
-        for m in range(-ell, ell+1):
-            if (ell+m)%2 == 1:
-                matrices[i][ell+m, ell-m, i2] = rb[i2]**(2*m)
-            else:
-                matrices[i][ell+m, ell-m, i2] = -1*rb[i2]**(2*m)
-            matrices[i][ell+m, ell+m, i3] = ra[i3]**(2*m)
-
-    # Determine res at i1, where we can safely divide by ra and rb
-    ra = ra[i1]
-    rb = rb[i1]
-    ra_pows = _assemble_powers(ra, range(-2*ellMax, 2*ellMax+1))
-    rb_pows = _assemble_powers(rb, range(-2*ellMax, 2*ellMax+1))
-    abs_raSqr_pows = _assemble_powers(abs(ra)**2, range(0, 2*ellMax+1))
-    absRRatioSquared = (abs(rb)/abs(ra))**2
-    ratio_pows = _assemble_powers(absRRatioSquared, range(0, 2*ellMax+1))
-
-    for i, ell in enumerate(lvals):
-        for m in range(-ell, ell+1):
-            for mp in range(-ell, ell+1):
-                factor = _utils.wigner_coef(ell, mp, m)
-                factor *= ra_pows[2*ellMax + m+mp]
-                factor *= rb_pows[2*ellMax + m-mp]
-                factor *= abs_raSqr_pows[ell-m]
-                rhoMin = max(0, mp-m)
-                rhoMax = min(ell+mp, ell-m)
-                s = 0.
-                for rho in range(rhoMin, rhoMax+1):
-                    c = ((-1)**rho)*(_utils.binom(ell+mp, rho)*
-                                     _utils.binom(ell-mp, ell-rho-m))
-                    s += c * ratio_pows[rho]
-                matrices[i][ell+m, ell+mp, i1] = factor*s
-
+    if len(i2) > 0:
+        elements[tables['anti_idx'][:, None], i2] = \
+            tables['anti_sign'][:, None]*rb[i2]**tables['anti_pow'][:, None]
+    if len(i3) > 0:
+        elements[tables['diag_idx'][:, None], i3] = \
+            ra[i3]**tables['diag_pow'][:, None]
+
+    # Determine res at i1, where we can safely divide by ra and rb. All
+    # elements at all these times are computed by a single C call.
+    if len(i1) > 0:
+        if len(i1) == n:
+            out = elements
+        else:
+            out = np.empty((tables['size'], len(i1)), dtype=complex)
+        _utils.wigner_d_elements(np.ascontiguousarray(ra[i1], dtype=complex),
+            np.ascontiguousarray(rb[i1], dtype=complex), tables['coefs'],
+            tables['ra_idx'], tables['rb_idx'], tables['abs_idx'],
+            tables['rho_min'], tables['rho_max'], tables['poly'], ellMax, out)
+        if out is not elements:
+            elements[:, i1] = out
+
+    # Views with shape (2*ell+1, 2*ell+1, n) for each ell
+    matrices = []
+    start = 0
+    for ell in range(2, ellMax+1):
+        size = (2*ell+1)**2
+        matrices.append(elements[start:start+size].reshape(2*ell+1, 2*ell+1,
+            n))
+        start += size
     return matrices
 
 def rotateWaveform(quat, h):
@@ -133,9 +191,9 @@ Returns: h_inertial, a similar array to h containing the inertial frame modes.
     res = 0.*h
     i=0
     for ell in range(2, ellMax+1):
-        for m in range(-ell, ell+1):
-            for mp in range(-ell, ell+1):
-                res[i+m+ell] += matrices[ell-2][ell+m, ell+mp]*h[i+mp+ell]
+        # res^{ell, m} = sum_mp W[ell, m, mp] h^{ell, mp}, at each time
+        res[i:i+2*ell+1] = np.einsum('ijt,jt->it', matrices[ell-2],
+            h[i:i+2*ell+1])
         i += 2*ell + 1
     return res
 
@@ -212,6 +270,148 @@ def _eval_vector_fit(fit_data, size, fit_params):
         val.append(_eval_scalar_fit(fit_data[i], fit_params))
     return np.array(val)
 
+def _pack_fits(fits):
+    """ Packs a list of fits, each a dict with 'bfOrders' and 'coefs', into
+        contiguous arrays for _eval_fits. Returns bf_orders, coefs, offsets,
+        where fit k uses the rows offsets[k]:offsets[k+1] of bf_orders and
+        coefs.
+    """
+    if len(fits) == 0:
+        return np.zeros((0, 7), dtype=np.int64), np.zeros(0), \
+            np.zeros(1, dtype=np.int64)
+    bf_orders = np.ascontiguousarray(np.concatenate(
+        [fit['bfOrders'] for fit in fits]), dtype=np.int64)
+    coefs = np.ascontiguousarray(np.concatenate(
+        [fit['coefs'] for fit in fits]), dtype=np.float64)
+    offsets = np.append(0, np.cumsum([len(fit['coefs'])
+        for fit in fits])).astype(np.int64)
+    return bf_orders, coefs, offsets
+
+def _eval_fits(packed_fits, fit_params):
+    """ Evaluates all fits packed by _pack_fits with a single call, which
+        computes the powers of fit_params only once. fit_params should come
+        from _get_fit_params, or can have shape (n_fits, 7) with one row per
+        fit. Returns an array with one value per fit.
+    """
+    q_fit_offset, q_fit_slope, q_max_bfOrder, chi_max_bfOrder \
+        = _get_fit_settings()
+    bf_orders, coefs, offsets = packed_fits
+    return _utils.eval_fits(bf_orders, coefs, offsets,
+        np.ascontiguousarray(fit_params, dtype=np.float64), q_fit_offset,
+        q_fit_slope, q_max_bfOrder, chi_max_bfOrder)
+
+def _get_fit_params_batch(x):
+    """ Same as _get_fit_params, for x with shape (N, 7). """
+    x = np.array(x, dtype=float)
+    q = x[:, 0]
+    chi1z = x[:, 3]
+    chi2z = x[:, 6]
+    eta = q/(1.+q)**2
+    chi_wtAvg = (q*chi1z+chi2z)/(1+q)
+    chiHat = (chi_wtAvg - 38.*eta/113.*(chi1z + chi2z)) \
+        /(1. - 76.*eta/113.)
+    chi_a = (chi1z - chi2z)/2.
+
+    x[:, 0] = np.log(q)
+    x[:, 3] = chiHat
+    x[:, 6] = chi_a
+    return x
+
+def _fit_powers_batch(fit_params):
+    """ The powers of the fit parameters that enter the basis functions,
+        with shape (N, q_max_bfOrder+1 + 6*(chi_max_bfOrder+1)), in the same
+        layout as in _utils.eval_fit.
+    """
+    q_fit_offset, q_fit_slope, q_max_bfOrder, chi_max_bfOrder \
+        = _get_fit_settings()
+    q_powers = (q_fit_offset + q_fit_slope*fit_params[:, :1]) \
+        **np.arange(q_max_bfOrder+1)
+    chi_powers = fit_params[:, 1:, None]**np.arange(chi_max_bfOrder+1)
+    return np.hstack([q_powers, chi_powers.reshape(len(fit_params), -1)])
+
+def _get_ds_fit_x_batch(y, q):
+    """ Same as _utils.get_ds_fit_x, for y with shape (N, 11) and q with
+        shape (N,).
+    """
+    x = np.empty((len(y), 7))
+    sp = np.sin(y[:, 4])
+    cp = np.cos(y[:, 4])
+    x[:, 0] = q
+    x[:, 1] = y[:, 5]*cp + y[:, 6]*sp
+    x[:, 2] = -1*y[:, 5]*sp + y[:, 6]*cp
+    x[:, 3] = y[:, 7]
+    x[:, 4] = y[:, 8]*cp + y[:, 9]*sp
+    x[:, 5] = -1*y[:, 8]*sp + y[:, 9]*cp
+    x[:, 6] = y[:, 10]
+    return x
+
+def _assemble_dydt_batch(y, ooxy, omega, cAdot, cBdot):
+    """ Same as _utils.assemble_dydt, for y with shape (N, 11). The other
+        arguments have an extra first axis of length N as well.
+    """
+    dydt = np.empty_like(y)
+    cp = np.cos(y[:, 4])
+    sp = np.sin(y[:, 4])
+    ooxy_x = ooxy[:, 0]*cp - ooxy[:, 1]*sp
+    ooxy_y = ooxy[:, 0]*sp + ooxy[:, 1]*cp
+    dydt[:, 0] = (-0.5)*y[:, 1]*ooxy_x - 0.5*y[:, 2]*ooxy_y
+    dydt[:, 1] = (-0.5)*y[:, 3]*ooxy_y + 0.5*y[:, 0]*ooxy_x
+    dydt[:, 2] = 0.5*y[:, 3]*ooxy_x + 0.5*y[:, 0]*ooxy_y
+    dydt[:, 3] = 0.5*y[:, 1]*ooxy_y - 0.5*y[:, 2]*ooxy_x
+    dydt[:, 4] = omega
+    dydt[:, 5] = cAdot[:, 0]*cp - cAdot[:, 1]*sp
+    dydt[:, 6] = cAdot[:, 0]*sp + cAdot[:, 1]*cp
+    dydt[:, 7] = cAdot[:, 2]
+    dydt[:, 8] = cBdot[:, 0]*cp - cBdot[:, 1]*sp
+    dydt[:, 9] = cBdot[:, 0]*sp + cBdot[:, 1]*cp
+    dydt[:, 10] = cBdot[:, 2]
+    return dydt
+
+def _normalize_y(y, normA, normB):
+    """ _utils.normalize_y, which also accepts y with shape (N, 11) and
+        normA, normB with shape (N,) for batch integration.
+    """
+    if np.ndim(y) == 1:
+        return _utils.normalize_y(y, normA, normB)
+    res = np.empty_like(y)
+    res[:, :4] = y[:, :4]/np.sqrt(np.sum(y[:, :4]**2, 1))[:, None]
+    res[:, 4] = y[:, 4]
+    res[:, 5:8] = y[:, 5:8]*normA[:, None] \
+        /np.sqrt(np.sum(y[:, 5:8]**2, 1))[:, None]
+    res[:, 8:] = y[:, 8:]*normB[:, None] \
+        /np.sqrt(np.sum(y[:, 8:]**2, 1))[:, None]
+    return res
+
+def _ab4_dy(k1, k2, k3, k4, dt1, dt2, dt3, dt4):
+    """ _utils.ab4_dy, which also accepts k1, ..., k4 with shape (N, 11) for
+        batch integration.
+    """
+    if np.ndim(k1) == 1:
+        return _utils.ab4_dy(k1, k2, k3, k4, dt1, dt2, dt3, dt4)
+    dt12 = dt1 + dt2
+    dt123 = dt12 + dt3
+    dt23 = dt2 + dt3
+
+    D1 = dt1 * dt12 * dt123
+    D2 = dt1 * dt2 * dt23
+    D3 = dt2 * dt12 * dt3
+
+    B41 = dt3 * dt23 / D1
+    B42 = -1 * dt3 * dt123 / D2
+    B43 = dt23 * dt123 / D3
+    B4 = B41 + B42 + B43
+
+    C41 = (dt23 + dt3) / D1
+    C42 = -1 * (dt123 + dt3) / D2
+    C43 = (dt123 + dt23) / D3
+    C4 = C41 + C42 + C43
+
+    A = k4
+    B = k4*B4 - k1*B41 - k2*B42 - k3*B43
+    C = k4*C4 - k1*C41 - k2*C42 - k3*C43
+    D = (k4-k1)/D1 - (k4-k2)/D2 + (k4-k3)/D3
+    return dt4 * (A + dt4 * (0.5*B + dt4*(C/3.0 + dt4*0.25*D)))
+
 ###############################################################################
 
 class DynamicsSurrogate:
@@ -240,8 +440,14 @@ prediction for:
 These time derivatives are given to the AB4 ODE solver.
     """
 
-    def __init__(self, h5file):
-        """h5file is a h5py.File containing the surrogate data"""
+    def __init__(self, h5file, use_c_integrator=True):
+        """
+h5file is a h5py.File containing the surrogate data.
+use_c_integrator: If True, the ODE is integrated with a single call to
+    _utils.integrate_dynamics, see _integrate_c. Otherwise the integration
+    is done in python, with calls to _utils for each fit and step. This can
+    also be changed later with the use_c_integrator attribute.
+        """
         self.t = h5file['t_ds'][()]
 
 
@@ -261,6 +467,22 @@ These time derivatives are given to the AB4 ODE solver.
         self.diff_t = np.diff(self.t)
         self.L = len(self.t)
 
+        # The fits of each node stacked for batch evaluation, built when
+        # first needed, see _get_batch_fits
+        self._batch_fits = [None]*self.L
+
+        # The fits of all nodes packed for _eval_fits and
+        # _utils.integrate_dynamics, in the order of _get_batch_fits for
+        # each node, see _node_fits. Older builds of _utils do not have the
+        # integrator, and fall back to python.
+        fits = []
+        for data in self.fit_data:
+            fits += data['omega_orb'] + [data['omega']] + data['chiA'] \
+                + data['chiB']
+        self.packed_fits = _pack_fits(fits)
+        self.use_c_integrator = use_c_integrator \
+            and hasattr(_utils, 'integrate_dynamics')
+
         # Validate time array
         for i in range(3):
             if not self.diff_t[2*i] == self.diff_t[2*i+1]:
@@ -286,21 +508,73 @@ These time derivatives are given to the AB4 ODE solver.
 
 
 
+    def _get_batch_fits(self, i0):
+        """
+        All 9 fits of node i0 (omega_orb, omega, chiA and chiB, in the order
+        of _eval_fits_batch), stacked as idx, coefs:
+            idx: Integer array with shape (n_coefs, 7), the indices of the
+                basis functions of each coefficient in the array of powers
+                from _fit_powers_batch.
+            coefs: Array with shape (n_coefs, 9), with the coefficients of
+                each fit in its column.
+        """
+        res = self._batch_fits[i0]
+        if res is None:
+            _, _, q_max_bfOrder, chi_max_bfOrder = _get_fit_settings()
+            offsets = np.append(0, q_max_bfOrder + 1
+                + (chi_max_bfOrder + 1)*np.arange(6))
+            data = self.fit_data[i0]
+            fits = data['omega_orb'] + [data['omega']] + data['chiA'] \
+                + data['chiB']
+            idx = np.concatenate([fit['bfOrders'] + offsets for fit in fits])
+            coefs = np.zeros((len(idx), len(fits)))
+            start = 0
+            for i, fit in enumerate(fits):
+                coefs[start:start+len(fit['coefs']), i] = fit['coefs']
+                start += len(fit['coefs'])
+            res = (idx, coefs)
+            self._batch_fits[i0] = res
+        return res
+
+    def _node_fits(self, i0):
+        """ The 9 fits of node i0 from self.packed_fits, for _eval_fits. The
+        offsets still refer to the full bf_orders and coefs arrays.
+        """
+        bf_orders, coefs, offsets = self.packed_fits
+        return bf_orders, coefs, offsets[9*i0:9*i0+10]
+
+    def _eval_fits_batch(self, i0, q, y):
+        """
+        Evaluates all fits of node i0 for y with shape (N, 11) and q with
+        shape (N,). Returns an array with shape (N, 9) with columns
+        omega_orb_x, omega_orb_y, omega, chiA_dot (3) and chiB_dot (3), in the
+        coorbital frame.
+        """
+        idx, coefs = self._get_batch_fits(i0)
+        fit_params = _get_fit_params_batch(_get_ds_fit_x_batch(y, q))
+        powers = _fit_powers_batch(fit_params)
+        return np.prod(powers[:, idx], axis=-1).dot(coefs)
+
     def get_time_deriv_from_index(self, i0, q, y):
+        """
+Evaluates dydt at the node i0. For batch integration, y can have shape
+(N, 11) with q of shape (N,), in which case dydt has shape (N, 11).
+        """
+        if np.ndim(y) == 2:
+            vals = self._eval_fits_batch(i0, q, y)
+            return _assemble_dydt_batch(y, vals[:, :2], vals[:, 2],
+                vals[:, 3:6], vals[:, 6:])
+
         # Setup fit variables
         x = _utils.get_ds_fit_x(y, q)
         fit_params = _get_fit_params(x)
 
-        # Evaluate fits
-        data = self.fit_data[i0]
-        ooxy_coorb = _eval_vector_fit(data['omega_orb'], 2, fit_params)
-        omega = _eval_scalar_fit(data['omega'], fit_params)
-        cAdot_coorb = _eval_vector_fit(data['chiA'], 3, fit_params)
-        cBdot_coorb = _eval_vector_fit(data['chiB'], 3, fit_params)
+        # Evaluate all fits of the node with a single call: omega_orb (2),
+        # omega, chiA_dot (3) and chiB_dot (3)
+        vals = _eval_fits(self._node_fits(i0), fit_params)
 
         # Do rotations to the coprecessing frame, find dqdt, and append
-        dydt = _utils.assemble_dydt(y, ooxy_coorb, omega,
-                cAdot_coorb, cBdot_coorb)
+        dydt = _utils.assemble_dydt(y, vals[:2], vals[2], vals[3:6], vals[6:])
 
         return dydt
 
@@ -308,7 +582,11 @@ These time derivatives are given to the AB4 ODE solver.
         """
 Evaluates dydt at a given time t by interpolating dydt at 4 nearby nodes with
 cubic interpolation. Use get_time_deriv_from_index when possible.
+For batch integration, y can have shape (N, 11) with q and t of shape (N,), or
+a scalar t.
         """
+        if np.ndim(y) == 2:
+            return self._get_time_deriv_batch(t, q, y)
         if t < self.t[0] or t > self.t[-1]:
             raise Exception("Cannot extrapolate time derivative!")
         i0 = np.argmin(abs(self.t - t))
@@ -327,12 +605,87 @@ cubic interpolation. Use get_time_deriv_from_index when possible.
 
         return dydt
 
+    def _get_time_deriv_batch(self, t, q, y):
+        """ get_time_deriv for y with shape (N, 11). Binaries using the same
+        4 nodes are done together.
+        """
+        t = np.broadcast_to(np.asarray(t, dtype=float), (len(y),))
+        if np.any(t < self.t[0]) or np.any(t > self.t[-1]):
+            raise Exception("Cannot extrapolate time derivative!")
+        i0 = np.argmin(abs(self.t[None, :] - t[:, None]), axis=1)
+        imin = np.where(t > self.t[i0], i0-1, i0-2)
+        imin = np.clip(imin, 0, len(self.t)-4)
+
+        dydt = np.zeros_like(y)
+        for i_start in np.unique(imin):
+            rows = imin == i_start
+            # The cubic interpolation is linear in dydt, so it is a weighted
+            # sum over the nodes, with the weights given by interpolating
+            # the unit vectors
+            ts = self.t[i_start:i_start+4]
+            weights = _splinterp_Cwrapper_many(t[rows], ts, np.eye(4))
+            for i in range(4):
+                dydt[rows] += weights[i][:, None] \
+                    *self.get_time_deriv_from_index(i_start+i, q[rows],
+                    y[rows])
+        return dydt
+
     def get_omega(self, i0, q, y):
         x = _utils.get_ds_fit_x(y, q)
         fit_params = _get_fit_params(x)
         omega = _eval_scalar_fit(self.fit_data[i0]['omega'], fit_params)
         return omega
 
+    def _get_t_from_omega_batch(self, omega_ref, q, y0):
+        """
+        _get_t_from_omega for many binaries, with initial data y0 with shape
+        (N, 11) and q of shape (N,). omega_ref can be a scalar or have shape
+        (N,).
+        """
+        omega_ref = np.broadcast_to(np.asarray(omega_ref, dtype=float),
+            (len(y0),))
+        if np.any(omega_ref > 0.201):
+            raise Exception("Got omega_ref = %0.4f > 0.2, too "
+                    "large for the NRSur7dq4 model!"%(omega_ref.max()))
+
+        omega0 = self._eval_fits_batch(0, q, y0)[:, 2]
+        if np.any(omega_ref < omega0):
+            i = np.argmax(omega_ref < omega0)
+            raise Exception("Got omega_ref = %0.4f < %0.4f = omega_0, "
+                    "too small!"%(omega_ref[i], omega0[i]))
+
+        # Same as _get_t_from_omega, the node index imax is increased for
+        # all binaries with omega_max <= omega_ref together
+        full_node_indices = list(range(len(self.t)))
+        full_node_indices.remove(1)
+        full_node_indices.remove(3)
+        full_node_indices.remove(5)
+
+        imax = np.ones(len(y0), dtype=int)
+        omega_min = omega0
+        omega_max = self._eval_fits_batch(full_node_indices[1], q, y0)[:, 2]
+        active = omega_max <= omega_ref
+        k = 1
+        while np.any(active):
+            k += 1
+            imax[active] = k
+            omega_min[active] = omega_max[active]
+            omega_max[active] = self._eval_fits_batch(full_node_indices[k],
+                q[active], y0[active])[:, 2]
+            active = omega_max <= omega_ref
+
+        node_indices = np.array(full_node_indices)
+        t_min = self.t[node_indices[imax-1]]
+        t_max = self.t[node_indices[imax]]
+        t_ref = (t_min * (omega_max - omega_ref)
+                + t_max * (omega_ref - omega_min)) / (omega_max - omega_min)
+
+        if np.any(t_ref < self.t[0]) or np.any(t_ref > self.t[-1]):
+            raise Exception("Somehow, t_ref ended up being outside of "
+                    "the time domain limits!")
+
+        return t_ref
+
     def _get_t_from_omega(self, omega_ref, q, chiA0, chiB0, init_orbphase,
             init_quat):
 
@@ -468,6 +821,119 @@ L = len(self.t), and these returned arrays are sampled at self.t
         y_of_t, i0 = self._initialize(q, chiA0, chiB0, init_quat,
                 init_orbphase, t_ref, normA, normB)
 
+        y_of_t = self._integrate(q, y_of_t, normA, normB, i0)
+
+        quat = y_of_t[:, :4].T
+        orbphase = y_of_t[:, 4]
+        chiA_copr = y_of_t[:, 5:8]
+        chiB_copr = y_of_t[:, 8:]
+
+        return quat, orbphase, chiA_copr, chiB_copr, t_low
+
+    def evaluate_batch(self, q, chiA0, chiB0, init_quat=None,
+            init_orbphase=0.0, t_ref=None, omega_ref=None, omega_low=None):
+        """
+Computes the modeled NR dynamics for many binaries at once. The binaries are
+integrated in lock-step over the time nodes, with all fits evaluated for all
+binaries together, which is much faster than calling __call__ for each of
+them. Binaries that start at different time nodes, for different t_ref, are
+integrated in separate groups.
+
+Arguments:
+=================
+q: Array of mass ratios with shape (N,).
+chiA0, chiB0: Arrays of spins with shape (N, 3).
+init_quat: None, a quaternion or an array of quaternions with shape (N, 4).
+init_orbphase: A float or an array with shape (N,).
+t_ref, omega_ref, omega_low: None, a float or an array with shape (N,).
+See __call__ for the meaning of these arguments.
+
+Returns:
+==================
+q_copr: Array with shape (N, 4, L)
+orbphase: Array with shape (N, L)
+chiA_copr: Array with shape (N, L, 3)
+chiB_copr: Array with shape (N, L, 3)
+t_low: Array with shape (N,), or None if omega_low is None.
+
+These agree with __call__ for each binary, up to round off errors.
+        """
+        if t_ref is not None and omega_ref is not None:
+            raise Exception("Specify at most one of t_ref, omega_ref.")
+
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        n = len(q)
+        chiA0 = np.asarray(chiA0, dtype=float).reshape(n, 3)
+        chiB0 = np.asarray(chiB0, dtype=float).reshape(n, 3)
+        init_orbphase = np.broadcast_to(np.asarray(init_orbphase,
+            dtype=float), (n,))
+
+        # See __call__
+        chiA0 = rotate_spin(chiA0, -1 * init_orbphase)
+        chiB0 = rotate_spin(chiB0, -1 * init_orbphase)
+
+        normA = np.sqrt(np.sum(chiA0**2, 1))
+        normB = np.sqrt(np.sum(chiB0**2, 1))
+        maxNorm = max(normA.max(), normB.max())
+        if maxNorm > 1.001:
+            raise Exception("Got a spin magnitude of %s > 1.0"%(maxNorm))
+
+        y0 = np.zeros((n, 11))
+        y0[:, 0] = 1.
+        y0[:, 4] = init_orbphase
+        y0[:, 5:8] = chiA0
+        y0[:, 8:] = chiB0
+        if init_quat is not None:
+            y0[:, :4] = init_quat
+
+        if omega_ref is not None:
+            t_ref = self._get_t_from_omega_batch(omega_ref, q, y0)
+
+        if omega_low is not None:
+            if omega_ref is not None and np.all(abs(np.asarray(omega_low)
+                    - np.asarray(omega_ref)) < 1e-10):
+                t_low = np.copy(t_ref)
+            else:
+                t_low = self._get_t_from_omega_batch(omega_low, q, y0)
+        else:
+            t_low = None
+
+        y_of_t = np.zeros((n, self.L-3, 11))
+        if t_ref is None:
+            i0 = np.zeros(n, dtype=int)
+            y_of_t[:, 0] = y0
+        else:
+            # Step to the closest time node using forward Euler, see
+            # _initialize
+            t_ref = np.broadcast_to(np.asarray(t_ref, dtype=float), (n,))
+            times = np.append(self.t[:6:2], self.t[6:])
+            i0 = np.argmin(abs(times[None, :] - t_ref[:, None]), axis=1)
+            dydt0 = self.get_time_deriv(t_ref, q, y0)
+            y_node = y0 + (times[i0] - t_ref)[:, None] * dydt0
+            y_of_t[np.arange(n), i0] = _normalize_y(y_node, normA, normB)
+
+        for i_start in np.unique(i0):
+            rows = np.where(i0 == i_start)[0]
+            y_of_t[rows] = self._integrate(q[rows], y_of_t[rows],
+                normA[rows], normB[rows], i_start)
+
+        quat = np.transpose(y_of_t[:, :, :4], (0, 2, 1))
+        orbphase = y_of_t[:, :, 4]
+        chiA_copr = y_of_t[:, :, 5:8]
+        chiB_copr = y_of_t[:, :, 8:]
+
+        return quat, orbphase, chiA_copr, chiB_copr, t_low
+
+    def _integrate(self, q, y_of_t, normA, normB, i0):
+        """
+Integrates the ODE starting from y_of_t[..., i0, :], forward and backward,
+filling in y_of_t. For batch integration, y_of_t has shape (N, L-3, 11), and
+q, normA and normB have shape (N,), and all binaries start at i0.
+For a single binary, uses _integrate_c if self.use_c_integrator is True.
+        """
+        if self.use_c_integrator and np.ndim(y_of_t) == 2:
+            return self._integrate_c(q, y_of_t, normA, normB, i0)
+
         if i0 == 0:
             # Just gonna send it!
             k_ab4, dt_ab4, y_of_t = self._initial_RK4(q, y_of_t, normA, normB)
@@ -486,7 +952,8 @@ L = len(self.t), and these returned arrays are sampled at self.t
             dt_ab4 = dt_array[i0-3:i0][::-1]
             self._integrate_backward(q, y_of_t, normA, normB, i0-3, k_ab4,
                 dt_ab4)
-            tmp_k = self.get_time_deriv_from_index(i0, q, y_of_t[i0-3])
+            tmp_k = self.get_time_deriv_from_index(i0, q,
+                y_of_t[..., i0-3, :])
             k_ab4 = [tmp_k, k_ab4[2], k_ab4[1]]
             dt_ab4 = dt_ab4[::-1]
             self._integrate_forward(q, y_of_t, normA, normB, i0, k_ab4, dt_ab4)
@@ -502,18 +969,33 @@ L = len(self.t), and these returned arrays are sampled at self.t
             dt_ab4 = dt_array[i0:i0+3]
             self._integrate_forward(q, y_of_t, normA, normB, i0+3, k_ab4,
                 dt_ab4)
-            tmp_k = self.get_time_deriv_from_index(i0+3, q, y_of_t[i0+3])
+            tmp_k = self.get_time_deriv_from_index(i0+3, q,
+                y_of_t[..., i0+3, :])
             k_ab4 = [tmp_k, k_ab4[2], k_ab4[1]]
             dt_ab4 = dt_ab4[::-1]
             self._integrate_backward(q, y_of_t, normA, normB, i0, k_ab4,
                 dt_ab4)
 
-        quat = y_of_t[:, :4].T
-        orbphase = y_of_t[:, 4]
-        chiA_copr = y_of_t[:, 5:8]
-        chiB_copr = y_of_t[:, 8:]
+        return y_of_t
 
-        return quat, orbphase, chiA_copr, chiB_copr, t_low
+    def _integrate_c(self, q, y_of_t, normA, normB, i0):
+        """
+Same as _integrate for a single binary, but the whole integration is done by
+_utils.integrate_dynamics with a single call, which follows the same steps as
+the python integrator, including the cubic interpolation of
+get_time_deriv. The floating point operations are the same, so the results
+are usually identical, and otherwise agree to round off level (relative
+differences below 1e-12), from e.g. the numpy and libm implementations of
+log, or contracted multiply-adds on some platforms.
+        """
+        q_fit_offset, q_fit_slope, q_max_bfOrder, chi_max_bfOrder \
+            = _get_fit_settings()
+        bf_orders, coefs, offsets = self.packed_fits
+        y_of_t = np.ascontiguousarray(y_of_t, dtype=np.float64)
+        return _utils.integrate_dynamics(
+            np.ascontiguousarray(self.t, dtype=np.float64), bf_orders, coefs,
+            offsets, y_of_t, float(q), float(normA), float(normB), int(i0),
+            q_fit_offset, q_fit_slope, q_max_bfOrder, chi_max_bfOrder)
 
     def _initialize(self, q, chiA0, chiB0, init_quat, init_orbphase, t_ref,
             normA, normB):
@@ -556,14 +1038,15 @@ the nearest time node.
         k_ab4 = []
         dt_ab4 = []
         for i, dt in enumerate(self.diff_t[:6:2]):
-            k1 = self.get_time_deriv_from_index(2*i, q, y_of_t[i])
+            y = y_of_t[..., i, :]
+            k1 = self.get_time_deriv_from_index(2*i, q, y)
             k_ab4.append(k1)
             dt_ab4.append(2*dt)
-            k2 = self.get_time_deriv_from_index(2*i+1, q, y_of_t[i] + dt*k1)
-            k3 = self.get_time_deriv_from_index(2*i+1, q, y_of_t[i] + dt*k2)
-            k4 = self.get_time_deriv_from_index(2*i+2, q, y_of_t[i] + 2*dt*k3)
-            ynext = y_of_t[i] + (dt/3.)*(k1 + 2*k2 + 2*k3 + k4)
-            y_of_t[i+1] = _utils.normalize_y(ynext, normA, normB)
+            k2 = self.get_time_deriv_from_index(2*i+1, q, y + dt*k1)
+            k3 = self.get_time_deriv_from_index(2*i+1, q, y + dt*k2)
+            k4 = self.get_time_deriv_from_index(2*i+2, q, y + 2*dt*k3)
+            ynext = y + (dt/3.)*(k1 + 2*k2 + 2*k3 + k4)
+            y_of_t[..., i+1, :] = _normalize_y(ynext, normA, normB)
 
         return k_ab4, dt_ab4, y_of_t
 
@@ -582,12 +1065,13 @@ the nearest time node.
             t2 = self.t[i_t + 2]
         half_dt = 0.5*(t2 - t1)
 
-        k1 = self.get_time_deriv(t1, q, y_of_t[i0])
-        k2 = self.get_time_deriv(t1 + half_dt, q, y_of_t[i0] + half_dt*k1)
-        k3 = self.get_time_deriv(t1 + half_dt, q, y_of_t[i0] + half_dt*k2)
-        k4 = self.get_time_deriv(t2, q, y_of_t[i0] + 2*half_dt*k3)
-        ynext = y_of_t[i0] + (half_dt/3.)*(k1 + 2*k2 + 2*k3 + k4)
-        y_of_t[i0+1] = _utils.normalize_y(ynext, normA, normB)
+        y = y_of_t[..., i0, :]
+        k1 = self.get_time_deriv(t1, q, y)
+        k2 = self.get_time_deriv(t1 + half_dt, q, y + half_dt*k1)
+        k3 = self.get_time_deriv(t1 + half_dt, q, y + half_dt*k2)
+        k4 = self.get_time_deriv(t2, q, y + 2*half_dt*k3)
+        ynext = y + (half_dt/3.)*(k1 + 2*k2 + 2*k3 + k4)
+        y_of_t[..., i0+1, :] = _normalize_y(ynext, normA, normB)
         return y_of_t, k1
 
     def _one_backward_RK4_step(self, q, y_of_t, normA, normB, i0):
@@ -606,12 +1090,13 @@ the nearest time node.
         half_dt = 0.5*(t2 - t1)
         quarter_dt = 0.5*half_dt
 
-        k1 = self.get_time_deriv(t1, q, y_of_t[i0])
-        k2 = self.get_time_deriv(t1 + half_dt, q, y_of_t[i0] + half_dt*k1)
-        k3 = self.get_time_deriv(t1 + half_dt, q, y_of_t[i0] + half_dt*k2)
-        k4 = self.get_time_deriv(t2, q, y_of_t[i0] + 2*half_dt*k3)
-        ynext = y_of_t[i0] + (half_dt/3.)*(k1 + 2*k2 + 2*k3 + k4)
-        y_of_t[i0-1] = _utils.normalize_y(ynext, normA, normB)
+        y = y_of_t[..., i0, :]
+        k1 = self.get_time_deriv(t1, q, y)
+        k2 = self.get_time_deriv(t1 + half_dt, q, y + half_dt*k1)
+        k3 = self.get_time_deriv(t1 + half_dt, q, y + half_dt*k2)
+        k4 = self.get_time_deriv(t2, q, y + 2*half_dt*k3)
+        ynext = y + (half_dt/3.)*(k1 + 2*k2 + 2*k3 + k4)
+        y_of_t[..., i0-1, :] = _normalize_y(ynext, normA, normB)
         return y_of_t, k1
 
     def _integrate_forward(self, q, y_of_t, normA, normB, i0, k_ab4, dt_ab4):
@@ -635,12 +1120,12 @@ fractional nodes.
         for i, dt4 in enumerate(self.diff_t[i0+3:]):
             i_output = i0+i
             k4 = self.get_time_deriv_from_index(i_output+3, q,
-                    y_of_t[i_output])
+                    y_of_t[..., i_output, :])
 
-            ynext = y_of_t[i_output] + _utils.ab4_dy(k1, k2, k3, k4, dt1,
+            ynext = y_of_t[..., i_output, :] + _ab4_dy(k1, k2, k3, k4, dt1,
                     dt2, dt3, dt4)
 
-            y_of_t[i_output+1] = _utils.normalize_y(ynext, normA, normB)
+            y_of_t[..., i_output+1, :] = _normalize_y(ynext, normA, normB)
 
             # Setup for next iteration
             k1, k2, k3 = k2, k3, k4
@@ -670,12 +1155,12 @@ dt_ab4 is [t(i0 + 3) - t(i0 + 2), t(i0 + 2) - t(i0 + 1), t(i0 + 1) - t(i0)]
                 node_index = 2 + 2*i_output
             dt4 = dt_array[i_output]
             k4 = self.get_time_deriv_from_index(node_index, q,
-                    y_of_t[i_output+1])
+                    y_of_t[..., i_output+1, :])
 
-            ynext = y_of_t[i_output+1] - _utils.ab4_dy(k1, k2, k3, k4,
+            ynext = y_of_t[..., i_output+1, :] - _ab4_dy(k1, k2, k3, k4,
                     dt1, dt2, dt3, dt4)
 
-            y_of_t[i_output] = _utils.normalize_y(ynext, normA, normB)
+            y_of_t[..., i_output, :] = _normalize_y(ynext, normA, normB)
 
             # Setup for next iteration
             k1, k2, k3 = k2, k3, k4
@@ -686,30 +1171,31 @@ dt_ab4 is [t(i0 + 3) - t(i0 + 2), t(i0 + 2) - t(i0 + 1), t(i0 + 1) - t(i0)]
 
 # Utility functions for the CoorbitalWaveformSurrogate:
 
-def _extract_component_data(h5_group):
+def _extract_component_data(h5_group, precision='double'):
     data = {}
     data['EI_basis'] = h5_group['EIBasis'][()]
+    data['EI_basis'] = data['EI_basis'].astype(
+        _basis_dtype(precision, data['EI_basis']), copy=False)
     data['nodeIndices'] = h5_group['nodeIndices'][()]
-    data['coefs'] = [h5_group['nodeModelers']['coefs_%s'%(i)][()]
-                     for i in range(len(data['nodeIndices']))]
-    data['orders'] = [h5_group['nodeModelers']['bfOrders_%s'%(i)][()]
-                      for i in range(len(data['nodeIndices']))]
+    # The fits of all EI nodes, packed for _eval_fits
+    data['fits'] = _pack_fits([{
+        'bfOrders': h5_group['nodeModelers']['bfOrders_%s'%(i)][()],
+        'coefs': h5_group['nodeModelers']['coefs_%s'%(i)][()],
+        } for i in range(len(data['nodeIndices']))])
     return data
 
 def _eval_comp(data, q, chiA, chiB):
-    nodes = []
-    for orders, coefs, ni in zip(data['orders'], data['coefs'],
-            data['nodeIndices']):
-
-        fit_data = {
-            'bfOrders': orders,
-            'coefs': coefs,
-            }
-        x = np.append(q, np.append(chiA[ni], chiB[ni]))
-        fit_params = _get_fit_params(x)
-        nodes.append(_eval_scalar_fit(fit_data, fit_params))
-
-    return np.array(nodes).dot(data['EI_basis'])
+    with profiling.stage('node_fits'):
+        # Each EI node is evaluated with the spins at its own time, and all
+        # node fits are evaluated with a single call
+        fit_params = np.array([_get_fit_params(np.append(q,
+            np.append(chiA[ni], chiB[ni]))) for ni in data['nodeIndices']]
+            ).reshape(-1, 7)
+        nodes = _eval_fits(data['fits'], fit_params)
+
+    with profiling.stage('ei_reconstruction'):
+        return nodes.astype(data['EI_basis'].dtype, copy=False).dot(
+            data['EI_basis'])
 
 def _assemble_mode_pair(rep, rem, imp, imm):
     hplus = rep + 1.j*imp
@@ -725,11 +1211,24 @@ def _assemble_mode_pair(rep, rem, imp, imm):
 class CoorbitalWaveformSurrogate:
     """This surrogate models the waveform in the coorbital frame."""
 
-    def __init__(self, h5file):
+    def __init__(self, h5file, ellMax=None, precision='double'):
+        """
+h5file: The h5py file containing the surrogate data.
+ellMax: If given, only load the modes with ell <= ellMax. Default: load all
+        modes in h5file.
+precision: 'double' or 'single'. With 'single' the EI bases are stored, and
+        the modes reconstructed, in single precision.
+        """
         self.ellMax = 2
         while 'hCoorb_%s_%s_Re+'%(self.ellMax+1, self.ellMax+1) in h5file.keys():
             self.ellMax += 1
 
+        if ellMax is not None:
+            if ellMax < 2 or ellMax > self.ellMax:
+                raise ValueError('ellMax should be between 2 and %s for this'
+                    ' model.'%self.ellMax)
+            self.ellMax = ellMax
+
         self.t = h5file['t_coorb'][()]
 
         self.data = {}
@@ -740,7 +1239,7 @@ class CoorbitalWaveformSurrogate:
             for reim in ['real', 'imag']:
                 group = h5file['hCoorb_%s_0_%s'%(ell, reim)]
                 self.data['%s_0_%s'%(ell, reim)] \
-                        = _extract_component_data(group)
+                        = _extract_component_data(group, precision)
 
             for m in range(1, ell+1):
                 self.mode_list.append( (ell,m) )
@@ -748,9 +1247,60 @@ class CoorbitalWaveformSurrogate:
                 for reim in ['Re', 'Im']:
                     for pm in ['+', '-']:
                         group = h5file['hCoorb_%s_%s_%s%s'%(ell, m, reim, pm)]
-                        tmp_data = _extract_component_data(group)
+                        tmp_data = _extract_component_data(group, precision)
                         self.data['%s_%s_%s%s'%(ell, m, reim, pm)] = tmp_data
 
+        self._stack_components()
+
+    def _stack_components(self):
+        """
+Stacks the data of all components for __call__, which evaluates the node
+fits of all components with a single call to _eval_fits and reconstructs
+all components with a single matrix product.
+
+The components are ordered by ell, so that the components with ell <= ellMax
+come first, followed by their nodes in the stacked arrays. For each ell the
+order is (ell, 0) real and imag, followed by Re+, Re-, Im+, Im- for each
+m > 0. The EI bases in self.data are replaced by views of the stacked basis.
+        """
+        keys = []
+        # Row of each component in the stacked components, for each ell
+        self._comp_rows = {}
+        for ell in range(2, self.ellMax+1):
+            rows = {}
+            for reim in ['real', 'imag']:
+                rows['0_%s'%reim] = len(keys)
+                keys.append('%s_0_%s'%(ell, reim))
+            for m in range(1, ell+1):
+                for comp in ['Re+', 'Re-', 'Im+', 'Im-']:
+                    rows['%s_%s'%(m, comp)] = len(keys)
+                    keys.append('%s_%s_%s'%(ell, m, comp))
+            self._comp_rows[ell] = rows
+
+        comps = [self.data[key] for key in keys]
+        num_nodes = [len(data['nodeIndices']) for data in comps]
+        self._node_offsets = np.append(0, np.cumsum(num_nodes))
+        # Number of components with ell' <= ell
+        self._num_comps = {ell: len([k for k in keys
+            if int(k.split('_')[0]) <= ell])
+            for ell in range(2, self.ellMax+1)}
+
+        # The fit parameters are only needed at the times of the nodes
+        node_indices = np.concatenate([data['nodeIndices'] for data in comps])
+        self._node_times, self._node_time_idx = np.unique(node_indices,
+            return_inverse=True)
+
+        bf_orders, coefs, offsets = zip(*[data['fits'] for data in comps])
+        starts = np.append(0, np.cumsum([len(c) for c in coefs]))
+        self._fits = (np.concatenate(bf_orders), np.concatenate(coefs),
+            np.concatenate([offsets[0][:1]] + [off[1:] + start for off, start
+            in zip(offsets, starts)]))
+
+        self._EI_basis = np.concatenate([data['EI_basis'] for data in comps])
+        for data, start, end in zip(comps, self._node_offsets[:-1],
+                self._node_offsets[1:]):
+            data['EI_basis'] = self._EI_basis[start:end]
+
 
     def __call__(self, q, chiA, chiB, ellMax=4):
         """
@@ -763,23 +1313,50 @@ ellMax: The maximum ell mode to evaluate.
         nmodes = ellMax*ellMax + 2*ellMax - 3
         modes = 1.j*np.zeros((nmodes, len(self.t)))
 
+        comps = self._eval_comps(q, chiA, chiB, ellMax)
         for ell in range(2, ellMax+1):
+            rows = self._comp_rows[ell]
             # m=0 is different
-            re = _eval_comp(self.data['%s_0_real'%(ell)], q, chiA, chiB)
-            im = _eval_comp(self.data['%s_0_imag'%(ell)], q, chiA, chiB)
-            modes[ell*(ell+1) - 4] = re + 1.j*im
+            modes[ell*(ell+1) - 4] = comps[rows['0_real']] \
+                + 1.j*comps[rows['0_imag']]
 
-            for m in range(1, ell+1):
-                rep = _eval_comp(self.data['%s_%s_Re+'%(ell, m)], q, chiA,chiB)
-                rem = _eval_comp(self.data['%s_%s_Re-'%(ell, m)], q, chiA,chiB)
-                imp = _eval_comp(self.data['%s_%s_Im+'%(ell, m)], q, chiA,chiB)
-                imm = _eval_comp(self.data['%s_%s_Im-'%(ell, m)], q, chiA,chiB)
-                h_posm, h_negm = _assemble_mode_pair(rep, rem, imp, imm)
-                modes[ell*(ell+1) - 4 + m] = h_posm
-                modes[ell*(ell+1) - 4 - m] = h_negm
+            m = np.arange(1, ell+1)
+            rep, rem, imp, imm = [comps[[rows['%s_%s'%(mm, comp)]
+                for mm in m]] for comp in ['Re+', 'Re-', 'Im+', 'Im-']]
+            h_posm, h_negm = _assemble_mode_pair(rep, rem, imp, imm)
+            modes[ell*(ell+1) - 4 + m] = h_posm
+            modes[ell*(ell+1) - 4 - m] = h_negm
 
         return modes
 
+    def _eval_comps(self, q, chiA, chiB, ellMax):
+        """
+Evaluates all components with ell <= ellMax, see _stack_components. Returns
+an array with shape (n_comps, len(self.t)), same as _eval_comp for each
+component.
+        """
+        n_comps = self._num_comps[ellMax]
+        n_nodes = self._node_offsets[n_comps]
+        with profiling.stage('node_fits'):
+            # Fit parameters at all node times in one step
+            x = np.empty((len(self._node_times), 7))
+            x[:, 0] = q
+            x[:, 1:4] = chiA[self._node_times]
+            x[:, 4:] = chiB[self._node_times]
+            fit_params = _get_fit_params_batch(x)
+            bf_orders, coefs, offsets = self._fits
+            nodes = _eval_fits((bf_orders, coefs, offsets[:n_nodes+1]),
+                fit_params[self._node_time_idx[:n_nodes]])
+
+        with profiling.stage('ei_reconstruction'):
+            # The components are a block diagonal matrix, with the nodes of
+            # each component in its row, times the stacked EI bases
+            basis = self._EI_basis[:n_nodes]
+            node_matrix = sparse.csr_matrix((nodes.astype(basis.dtype,
+                copy=False), np.arange(n_nodes),
+                self._node_offsets[:n_comps+1]), shape=(n_comps, n_nodes))
+            return node_matrix.dot(basis)
+
 ##############################################################################
 # Utility functions
 
@@ -806,15 +1383,12 @@ def inertial_waveform_modes(t, orbphase, quat, h_coorb):
     return h_inertial
 
 def splinterp_many(t_out, t_in, many_things):
-    return np.array([_splinterp_Cwrapper(t_out, t_in, thing) \
-            for thing in many_things])
+    return _splinterp_Cwrapper_many(t_out, t_in, many_things)
 
 def mode_sum(h_modes, ellMax, theta, phi):
-    coefs = []
-    for ell in range(2, ellMax+1):
-        for m in range(-ell, ell+1):
-            coefs.append(sYlm(-2, ell, m, theta, phi))
-    return np.array(coefs).dot(h_modes)
+    mode_list = [(ell, m) for ell in range(2, ellMax+1)
+                 for m in range(-ell, ell+1)]
+    return harmonics.mode_sum(h_modes, mode_list, theta, phi)
 
 def normalize_spin(chi, chi_norm):
     if chi_norm > 0.:
@@ -831,16 +1405,39 @@ A wrapper class for the precessing surrogate models.
 See the __call__ method on how to evaluate waveforms.
     """
 
-    def __init__(self, filename):
+    # Whether __call__ accepts multiband_opts, see evaluate_multiband
+    supports_multiband = True
+
+    def __init__(self, filename, mode_list=None, ellMax=None,
+            precision='double'):
         """
 Loads the surrogate model data.
 
 filename: The hdf5 file containing the surrogate data."
+mode_list: If given, only the waveform data needed for these modes is loaded.
+    All modes of a given ell are evaluated together for this model, so this
+    is the same as setting ellMax to the largest ell in mode_list.
+ellMax: If given, only the waveform data for modes with ell <= ellMax is
+    loaded.
+precision: 'double' or 'single'. With 'single' the coorbital waveform EI
+    bases are stored, and the coorbital modes reconstructed, in single
+    precision. The dynamics, including the orbital phase, are always
+    evaluated in double precision.
         """
+        if mode_list is not None:
+            ellMax_modes = max([mode[0] for mode in mode_list])
+            if ellMax is not None:
+                ellMax = min(ellMax, ellMax_modes)
+            else:
+                ellMax = ellMax_modes
+
         h5file = h5py.File(filename, 'r')
         self.dynamics_sur = DynamicsSurrogate(h5file)
-        self.coorb_sur = CoorbitalWaveformSurrogate(h5file)
+        self.coorb_sur = CoorbitalWaveformSurrogate(h5file, ellMax=ellMax,
+            precision=precision)
         self.t_coorb = self.coorb_sur.t
+        # The coefficients of the Wigner-D matrices for the waveform rotation
+        _wigner_tables(self.coorb_sur.ellMax)
         self.tds = np.append(self.dynamics_sur.t[0:6:2], \
             self.dynamics_sur.t[6:])
 
@@ -849,6 +1446,14 @@ filename: The hdf5 file containing the surrogate data."
 
         self.mode_list = self.coorb_sur.mode_list
 
+        # Optional LRUCache for the sparse domain evaluation, see
+        # _eval_sparse
+        self.sparse_cache = None
+
+        # Optional LRUCache for the SplineOperators that upsample the modes
+        # to the output times, see _splinterp_cached
+        self.interp_cache = None
+
 
     def _check_unused_opts(self, precessing_opts):
         """ Call this at the end of call module to check if all the
@@ -875,9 +1480,99 @@ filename: The hdf5 file containing the surrogate data."
         return quat_dyn, orbphase_dyn, chiA_copr_dyn, chiB_copr_dyn
 
 
+    def get_dynamics_batch(self, q, chiA0, chiB0, init_quat=None, \
+            init_orbphase=0.0, t_ref=None, omega_ref=None):
+        """
+        Wrapper for self.dynamics_sur.evaluate_batch(), the dynamics of many
+        binaries at once. q has shape (N,), and chiA0, chiB0 have shape
+        (N, 3). The returned arrays have an extra first axis of length N
+        compared to get_dynamics.
+        """
+        quat_dyn, orbphase_dyn, chiA_copr_dyn, chiB_copr_dyn, t0 \
+            = self.dynamics_sur.evaluate_batch(q, chiA0, chiB0,
+            init_orbphase=init_orbphase, init_quat=init_quat, t_ref=t_ref,
+            omega_ref=omega_ref)
+        return quat_dyn, orbphase_dyn, chiA_copr_dyn, chiB_copr_dyn
+
+
+    def _eval_sparse_nocache(self, q, chiA0, chiB0, init_orbphase, init_quat,
+            omega_ref, omega_low, ellMax):
+        """
+        Evaluates the dynamics and the inertial frame waveform modes on the
+        sparse coorbital time grid.
+
+        Returns:
+            h_inertial, t0, dyn_sparse, dyn_coorb
+            h_inertial: complex array of modes with shape (n_modes, n_times).
+            t0: start time of the waveform, see DynamicsSurrogate.
+            dyn_sparse: (quat, orbphase, chiA_copr, chiB_copr) at self.tds.
+            dyn_coorb: (quat, orbphase, chiA_copr, chiB_copr) at
+                self.t_coorb.
+        """
+        chiA_norm = np.sqrt(np.sum(chiA0**2))
+        chiB_norm = np.sqrt(np.sum(chiB0**2))
+
+        ## Get dynamics
+        with profiling.stage('dynamics_ode'):
+            quat_dyn, orbphase_dyn, chiA_copr_dyn, chiB_copr_dyn, t0 \
+                = self.dynamics_sur(q, chiA0, chiB0, \
+                init_orbphase=init_orbphase, init_quat=init_quat, \
+                t_ref=None, omega_ref=omega_ref, omega_low=omega_low)
+
+        # Interpolate to the coorbital time grid, and transform to coorb frame.
+        # Interpolate first since coorbital spins oscillate faster than
+        # coprecessing spins
+        chiA_copr = splinterp_many(self.t_coorb, self.tds, chiA_copr_dyn.T).T
+        chiB_copr = splinterp_many(self.t_coorb, self.tds, chiB_copr_dyn.T).T
+        chiA_copr = normalize_spin(chiA_copr, chiA_norm)
+        chiB_copr = normalize_spin(chiB_copr, chiB_norm)
+        orbphase = _splinterp_Cwrapper(self.t_coorb, self.tds, orbphase_dyn)
+
+        quat = splinterp_many(self.t_coorb, self.tds, quat_dyn)
+        quat = quat/np.sqrt(np.sum(abs(quat)**2, 0))
+        chiA_coorb, chiB_coorb = coorb_spins_from_copr_spins(
+                chiA_copr, chiB_copr, orbphase)
+
+
+        # Evaluate coorbital waveform surrogate
+        with profiling.stage('coorbital_surrogate'):
+            h_coorb = self.coorb_sur(q, chiA_coorb, chiB_coorb, \
+                    ellMax=ellMax)
+
+        # Transform the sparsely sampled waveform
+        with profiling.stage('wigner_rotation'):
+            h_inertial = inertial_waveform_modes(self.t_coorb, orbphase, quat,
+                    h_coorb)
+
+        return h_inertial, t0, \
+            (quat_dyn, orbphase_dyn, chiA_copr_dyn, chiB_copr_dyn), \
+            (quat, orbphase, chiA_copr, chiB_copr)
+
+    def _eval_sparse(self, q, chiA0, chiB0, init_orbphase, init_quat,
+            omega_ref, omega_low, ellMax):
+        """
+        Same as _eval_sparse_nocache, but if self.sparse_cache is set the
+        output is cached, keyed by the inputs. Copies of the cached arrays
+        are returned, so the caller can modify them.
+        """
+        if self.sparse_cache is None:
+            return self._eval_sparse_nocache(q, chiA0, chiB0, init_orbphase,
+                init_quat, omega_ref, omega_low, ellMax)
+
+        key = (q, array_key(chiA0), array_key(chiB0), init_orbphase,
+            array_key(init_quat), omega_ref, omega_low, ellMax)
+        res = self.sparse_cache.get(key)
+        if res is None:
+            res = self._eval_sparse_nocache(q, chiA0, chiB0, init_orbphase,
+                init_quat, omega_ref, omega_low, ellMax)
+            self.sparse_cache.put(key, res)
+        return copy_arrays(res)
+
+
     def __call__(self, x, fM_low=None, fM_ref=None, dtM=None,
             timesM=None, dfM=None, freqsM=None, mode_list=None, ellMax=None,
-            precessing_opts=None, tidal_opts=None, par_dict=None):
+            precessing_opts=None, tidal_opts=None, par_dict=None,
+            multiband_opts=None):
         """
 Evaluates a precessing surrogate model.
 
@@ -941,12 +1636,58 @@ Arguments:
                                     }
     tidal_opts: Should be None for this model.
     par_dict: Should be None for this model.
+    multiband_opts:
+                A dictionary, to return the results on a piecewise uniform
+                time grid with time step dtM at the merger, and larger time
+                steps chosen from the orbital frequency in the inspiral, see
+                gwsurrogate.new.multiband, and evaluate_multiband, which
+                also returns the bands. Requires dtM. Default: None.
+                Allowed keys are:
+                dt_max: The largest time step. Default: None, no limit.
+                samples_per_cycle: The minimum number of samples per cycle
+                    of the m=ellMax modes. Default: 4.
 
 
 Returns:
     domain, h, dynamics.
         """
+        return self._evaluate(x, fM_low, fM_ref, dtM, timesM, dfM, freqsM,
+            mode_list, ellMax, precessing_opts, tidal_opts, par_dict,
+            multiband_opts)[:3]
+
 
+    def evaluate_multiband(self, x, dtM=None, multiband_opts=None, **kwargs):
+        """
+Same as __call__ with multiband_opts, but also returns the bands.
+
+Arguments:
+    dtM:        The time step at the merger. Required.
+    multiband_opts:
+                See __call__. Default: None, same as {}.
+    kwargs:     All other arguments of __call__, except timesM.
+
+Returns:
+    domain, h, dynamics, band_edges.
+        band_edges are the indices of the starts of the bands in domain,
+        followed by len(domain), see gwsurrogate.new.multiband.split_bands.
+        The rest is the same as for __call__.
+        """
+        if multiband_opts is None:
+            multiband_opts = {}
+        if kwargs.get('timesM') is not None:
+            raise ValueError('timesM is not allowed for evaluate_multiband.')
+        return self._evaluate(x, dtM=dtM, multiband_opts=multiband_opts,
+            **kwargs)
+
+
+    def _evaluate(self, x, fM_low=None, fM_ref=None, dtM=None, timesM=None,
+            dfM=None, freqsM=None, mode_list=None, ellMax=None,
+            precessing_opts=None, tidal_opts=None, par_dict=None,
+            multiband_opts=None):
+        """
+Evaluates the model as described in __call__. Returns domain, h, dynamics,
+band_edges, where band_edges is None unless multiband_opts is given.
+        """
         if dfM is not None:
             raise ValueError('Expected dfM to be None for a Time domain model')
         if freqsM is not None:
@@ -956,6 +1697,9 @@ Returns:
         if par_dict is not None:
             raise ValueError('par_dict should be None for this model')
 
+        if multiband_opts is not None and dtM is None:
+            raise ValueError('dtM is required with multiband_opts.')
+
         if precessing_opts is None:
             precessing_opts = {}
 
@@ -966,9 +1710,12 @@ Returns:
         self._check_unused_opts(precessing_opts)
 
         if ellMax is None:
-            ellMax = 4
+            ellMax = self.coorb_sur.ellMax
         if ellMax > 4:
             raise ValueError("NRSur7dq4 only allows ellMax<=4.")
+        if ellMax > self.coorb_sur.ellMax:
+            raise ValueError("ellMax=%s is larger than the ellMax=%s used"
+                " when loading the model."%(ellMax, self.coorb_sur.ellMax))
 
         q, chiA0, chiB0 = x
 
@@ -988,11 +1735,10 @@ Returns:
         else:
             omega_low = fM_low * np.pi
 
-        ## Get dynamics
-        quat_dyn, orbphase_dyn, chiA_copr_dyn, chiB_copr_dyn, t0 \
-            = self.dynamics_sur(q, chiA0, chiB0, init_orbphase=init_orbphase, \
-            init_quat=init_quat, t_ref=None, omega_ref=omega_ref, \
-            omega_low=omega_low)
+        h_inertial, t0, dyn_sparse, dyn_coorb = self._eval_sparse(q, chiA0,
+            chiB0, init_orbphase, init_quat, omega_ref, omega_low, ellMax)
+        quat_dyn, orbphase_dyn, chiA_copr_dyn, chiB_copr_dyn = dyn_sparse
+        quat, orbphase, chiA_copr, chiB_copr = dyn_coorb
 
         # If init_orbphase != 0, chiA0 and chiB0 get transformed in
         # self.dynamics_sur. To avoid accidental usage without this
@@ -1000,29 +1746,6 @@ Returns:
         chiA0 = None
         chiB0 = None
 
-        # Interpolate to the coorbital time grid, and transform to coorb frame.
-        # Interpolate first since coorbital spins oscillate faster than
-        # coprecessing spins
-        chiA_copr = splinterp_many(self.t_coorb, self.tds, chiA_copr_dyn.T).T
-        chiB_copr = splinterp_many(self.t_coorb, self.tds, chiB_copr_dyn.T).T
-        chiA_copr = normalize_spin(chiA_copr, chiA_norm)
-        chiB_copr = normalize_spin(chiB_copr, chiB_norm)
-        orbphase = _splinterp_Cwrapper(self.t_coorb, self.tds, orbphase_dyn)
-
-        quat = splinterp_many(self.t_coorb, self.tds, quat_dyn)
-        quat = quat/np.sqrt(np.sum(abs(quat)**2, 0))
-        chiA_coorb, chiB_coorb = coorb_spins_from_copr_spins(
-                chiA_copr, chiB_copr, orbphase)
-
-
-        # Evaluate coorbital waveform surrogate
-        h_coorb = self.coorb_sur(q, chiA_coorb, chiB_coorb, \
-                ellMax=ellMax)
-
-        # Transform the sparsely sampled waveform
-        h_inertial = inertial_waveform_modes(self.t_coorb, orbphase, quat,
-                h_coorb)
-
         if timesM is not None:
             if timesM[-1] > self.t_coorb[-1] + 0.01:
                 raise Exception("'times' includes times larger than the"
@@ -1032,6 +1755,7 @@ Returns:
                     " increasing initial value of times or reducing f_low.")
 
         return_times = True
+        band_edges = None
         if dtM is None and timesM is None:
             # Use the sparse domain. Python normally copies numpy arrays by
             # reference, so we do a deep copy so as to not overwrite
@@ -1047,16 +1771,27 @@ Returns:
                 if t0 is None:
                     t0 = self.t_coorb[0]
                 tf = self.t_coorb[-1]
-                num_times = int(np.ceil((tf - t0)/dtM));
-                timesM = t0 + dtM*np.arange(num_times)
+                if multiband_opts is None:
+                    num_times = int(np.ceil((tf - t0)/dtM));
+                    timesM = t0 + dtM*np.arange(num_times)
+                    times_key = (t0, dtM, num_times)
+                else:
+                    dt_max, samples_per_cycle = \
+                        multiband.get_multiband_opts(multiband_opts)
+                    # The (2, 2) mode frequency is about twice the orbital
+                    # frequency, in the coprecessing frame
+                    omega22 = 2*np.diff(orbphase_dyn)/np.diff(self.tds)
+                    timesM, band_edges, times_key = \
+                        multiband.multiband_times(t0, tf, self.tds[:-1],
+                        omega22, dtM, ellMax, dt_max, samples_per_cycle)
             else:
                 return_times = False
+                times_key = None
 
 
         if do_interp:
-            hre = splinterp_many(timesM, self.t_coorb, np.real(h_inertial))
-            him = splinterp_many(timesM, self.t_coorb, np.imag(h_inertial))
-            h_inertial = hre + 1.j*him
+            h_inertial = _splinterp_cached(timesM, self.t_coorb, h_inertial,
+                self.interp_cache, times_key)
 
         # Make mode dict
         h = {}
@@ -1092,4 +1827,51 @@ Returns:
         else:
             dynamics = None
 
-        return timesM, h, dynamics
+        return timesM, h, dynamics, band_edges
+
+
+    def evaluate_batch(self, xs, fM_low=None, fM_ref=None, dtM=None,
+            timesM=None, dfM=None, freqsM=None, mode_list=None, ellMax=None,
+            precessing_opts=None, tidal_opts=None, par_dict=None):
+        """
+Evaluates the precessing surrogate for many parameters at once.
+
+Arguments:
+    xs: A list of parameters [q, chiA0, chiB0], one for each binary, see
+        __call__.
+    All other arguments are the same as for __call__, except that
+    return_dynamics is not allowed in precessing_opts.
+
+    The waveforms are stacked, so they need a common time array. So either
+    fM_low should be 0 or timesM should be given.
+
+Returns:
+    domain, h, mode_list
+        domain: time array in units of M.
+        h: complex array with shape (n_params, len(mode_list), len(domain)).
+        mode_list: The (ell, m) modes along the second axis of h.
+        """
+        if precessing_opts is None:
+            precessing_opts = {}
+        if precessing_opts.get('return_dynamics', False):
+            raise ValueError('return_dynamics is not supported for batch'
+                ' evaluation.')
+        if not (fM_low is None or fM_low == 0) and timesM is None:
+            raise ValueError('Batch evaluation needs a common time array for'
+                ' all parameters. Either set fM_low=0 or specify timesM.')
+
+        h = None
+        for idx, x in enumerate(xs):
+            domain, h_dict, _ = self(x, fM_low=fM_low, fM_ref=fM_ref,
+                dtM=dtM, timesM=timesM, dfM=dfM, freqsM=freqsM,
+                mode_list=mode_list, ellMax=ellMax,
+                precessing_opts=dict(precessing_opts), tidal_opts=tidal_opts,
+                par_dict=par_dict)
+            if h is None:
+                modes = list(h_dict.keys())
+                h = np.zeros((len(xs), len(modes), len(domain)),
+                    dtype=complex)
+            for i, mode in enumerate(modes):
+                h[idx, i] = h_dict[mode]
+
+        return domain, h, modes
@@ -0,0 +1,179 @@
+"""Opt-in timing of the stages of a surrogate evaluation"""
+
+from __future__ import division  # for py2
+
+__copyright__ = "Copyright (C) 2014 Scott Field and Chad Galley"
+__email__     = "sfield@astro.cornell.edu, crgalley@tapir.caltech.edu"
+__status__    = "testing"
+__author__    = "Jonathan Blackman, Scott Field, Chad Galley, Vijay Varma"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import functools
+import json
+import time
+from collections import OrderedDict
+
+
+# The StageProfiler recording the current evaluation, see activate. None when
+# profiling is off, in which case stage() costs a single function call.
+_ACTIVE = None
+
+
+class _NullStage(object):
+    """ Does nothing, used by stage() when profiling is off. """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage(object):
+    """ Times a single stage for a StageProfiler. """
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class StageProfiler(object):
+    """
+    Records the total wall time and the number of calls of each named stage
+    of a surrogate evaluation.
+
+    Stages can be nested, in which case the time of the inner stage is also
+    included in the outer stage. For example, 'spline_upsampling' is part of
+    'coorbital_to_inertial' for the aligned spin models.
+    """
+
+    def __init__(self):
+        self.totals = OrderedDict()
+        self.counts = OrderedDict()
+
+    def stage(self, name):
+        """ Context manager that times the enclosed code as stage name. """
+        return _Stage(self, name)
+
+    def record(self, name, seconds):
+        """ Adds a call of stage name that took seconds. """
+        if name not in self.totals:
+            self.totals[name] = 0.
+            self.counts[name] = 0
+        self.totals[name] += seconds
+        self.counts[name] += 1
+
+    def reset(self):
+        """ Removes all recorded timings. """
+        self.totals.clear()
+        self.counts.clear()
+
+    def info(self):
+        """
+        Returns a dict with stage names as keys, in the order the stages were
+        first seen. The values are dicts with the number of 'calls', and
+        the 'total' and 'mean' wall time in seconds.
+        """
+        return OrderedDict((name, {
+            'calls': self.counts[name],
+            'total': self.totals[name],
+            'mean': self.totals[name]/self.counts[name],
+            }) for name in self.totals)
+
+    def to_json(self, filename=None):
+        """
+        Returns info() as a JSON string. If filename is given, also writes
+        it to that file.
+        """
+        res = json.dumps(self.info(), indent=2)
+        if filename is not None:
+            with open(filename, 'w') as f:
+                f.write(res)
+        return res
+
+    def __str__(self):
+        lines = ['%-24s %8s %12s %12s'%('stage', 'calls', 'total [ms]',
+            'mean [ms]')]
+        for name, d in self.info().items():
+            lines.append('%-24s %8d %12.3f %12.3f'%(name, d['calls'],
+                1e3*d['total'], 1e3*d['mean']))
+        return '\n'.join(lines)
+
+
+def stage(name):
+    """
+    Context manager that times the enclosed code as stage name in the active
+    StageProfiler, if any.
+    """
+    if _ACTIVE is None:
+        return _NULL_STAGE
+    return _ACTIVE.stage(name)
+
+
+class activate(object):
+    """
+    Context manager that makes profiler the active StageProfiler, so that
+    all stages inside are recorded in it.
+    """
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def __enter__(self):
+        global _ACTIVE
+        self.previous = _ACTIVE
+        _ACTIVE = self.profiler
+        return self.profiler
+
+    def __exit__(self, *args):
+        global _ACTIVE
+        _ACTIVE = self.previous
+        return False
+
+
+def profiled(method):
+    """
+    Decorator for methods of classes with a _profiler attribute. If
+    _profiler is not None, the stages of the call are recorded in it, along
+    with the 'total' time of the call. A profiled method called from another
+    one, with the same profiler active, only adds to the stages of the outer
+    call.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        profiler = self._profiler
+        if profiler is None or profiler is _ACTIVE:
+            return method(self, *args, **kwargs)
+        with activate(profiler):
+            with profiler.stage('total'):
+                return method(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,133 @@
+"""
+Natural cubic spline interpolation as a cached linear operator.
+
+Interpolating data sampled on fixed knots onto a fixed output grid is linear
+in the data. When the same knots and output grid are used repeatedly, as for
+the upsampling of the surrogate data to the output times, the samples need
+to be located and the spline weights computed only once.
+"""
+
+from __future__ import division  # for py2
+
+__copyright__ = "Copyright (C) 2014 Scott Field and Chad Galley"
+__email__     = "sfield@astro.cornell.edu, crgalley@tapir.caltech.edu"
+__status__    = "testing"
+__author__    = "Jonathan Blackman, Scott Field, Chad Galley, Vijay Varma"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import numpy as np
+from scipy import sparse
+from scipy.linalg import solve_banded
+
+
+class SplineOperator(object):
+    """
+    Natural cubic spline interpolation from the knots x onto the samples
+    xnew, with the same boundary conditions as spline_interp_Cwrapper.
+
+    On the interval [x_j, x_j+1] the spline is
+        a y_j + b y_j+1 + c M_j + d M_j+1,
+    where M are the second derivatives at the knots, which solve a
+    tridiagonal system with a right hand side that is linear in y. The
+    weights a, b, c, d of all samples are stored as a sparse matrix with
+    shape (len(xnew), 2*len(x)) and four entries per row, which acts on the
+    stacked [y, M].
+    """
+
+    def __init__(self, xnew, x):
+        """
+        xnew: 1d array of samples in [x[0], x[-1]].
+        x:    1d array of increasing knots, at least 3.
+        """
+        x = np.ascontiguousarray(x, dtype=np.float64)
+        xnew = np.ascontiguousarray(xnew, dtype=np.float64)
+        if x.ndim != 1 or len(x) < 3:
+            raise ValueError('Expected at least 3 knots.')
+        if xnew.shape[0] > 0 and (xnew.min() < x[0] or xnew.max() > x[-1]):
+            raise Exception('Extrapolation not allowed')
+
+        n = len(x)
+        self.n_in = n
+        self.n_out = len(xnew)
+        h = np.diff(x)
+
+        # Interpolation weights of each sample
+        idx = np.clip(np.searchsorted(x, xnew, side='right') - 1, 0, n - 2)
+        h_idx = h[idx]
+        t = xnew - x[idx]
+        s = x[idx + 1] - xnew
+        weights = np.column_stack([s/h_idx, t/h_idx,
+            (s**3/h_idx - s*h_idx)/6., (t**3/h_idx - t*h_idx)/6.])
+        columns = np.column_stack([idx, idx + 1, n + idx, n + idx + 1])
+        indptr = 4*np.arange(self.n_out + 1)
+        self.matrix = sparse.csr_matrix((weights.ravel(),
+            columns.ravel(), indptr), shape=(self.n_out, 2*n))
+
+        # The system for the interior second derivatives, in the banded
+        # form used by solve_banded. M_0 = M_n-1 = 0.
+        self._banded = np.zeros((3, n - 2))
+        self._banded[0, 1:] = h[1:-1]
+        self._banded[1] = 2*(h[:-1] + h[1:])
+        self._banded[2, :-1] = h[1:-1]
+        self._rhs = sparse.diags([6./h[:-1], -6./h[:-1] - 6./h[1:], 6./h[1:]],
+            [0, 1, 2], shape=(n - 2, n), format='csr')
+
+    @property
+    def nbytes(self):
+        """ Memory used by the operator in bytes. """
+        return sum(arr.nbytes for arr in [self.matrix.data,
+            self.matrix.indices, self.matrix.indptr, self._banded,
+            self._rhs.data, self._rhs.indices, self._rhs.indptr])
+
+    def apply(self, ys, out=None):
+        """
+        Interpolates each row of ys.
+
+        ys:  Array with shape (n_cols, len(x)), real or complex.
+        out: Optional array with shape (n_cols, len(xnew)), float64 for real
+             ys and complex128 for complex ys, for the result. A new array is
+             created if not given.
+
+        Returns out.
+        """
+        ys = np.asarray(ys)
+        if ys.ndim != 2 or ys.shape[1] != self.n_in:
+            raise ValueError('ys should have shape (n_cols, %d).'%self.n_in)
+        dtype = np.complex128 if np.iscomplexobj(ys) else np.float64
+        shape = (ys.shape[0], self.n_out)
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        elif not isinstance(out, np.ndarray) or out.dtype != dtype \
+                or out.shape != shape:
+            raise ValueError('out should be a %s array with shape %s.'%(
+                np.dtype(dtype).name, shape))
+
+        if ys.shape[0] == 0:
+            return out
+
+        n = self.n_in
+        stacked = np.zeros((2*n, ys.shape[0]), dtype=dtype)
+        stacked[:n] = ys.T
+        stacked[n+1:2*n-1] = solve_banded((1, 1), self._banded,
+            self._rhs.dot(stacked[:n]), check_finite=False)
+        out[...] = self.matrix.dot(stacked).T
+        return out
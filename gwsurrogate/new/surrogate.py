@@ -31,7 +31,6 @@ THE SOFTWARE.
 # so they won't show up in gws' tab completion
 import numpy as np
 from scipy.interpolate import InterpolatedUnivariateSpline as _iuspline
-from gwtools.harmonics import sYlm as _sYlm
 
 if __package__ is "" or "None": # py2 and py3 compatible
   print("setting __package__ to gwsurrogate.new so relative imports work")
@@ -41,7 +40,15 @@ if __package__ is "" or "None": # py2 and py3 compatible
 from .saveH5Object import SimpleH5Object
 from .saveH5Object import H5ObjectList
 from .saveH5Object import H5ObjectDict
-from .nodeFunction import NodeFunction
+from .nodeFunction import NodeFunction, get_batched_node_evaluator, \
+    compile_node_functions, CompiledNodeFits, as_batched_gpr_fits, \
+    merge_gpr_fits
+from . import fit_sidecar
+from . import harmonics
+from . import multiband
+from . import profiling
+from .cache import array_key
+from .spline_operator import SplineOperator
 from .spline_evaluation import TensorSplineGrid, fast_complex_tensor_spline_eval
 from gwsurrogate import spline_interp_Cwrapper
 from .tidal_functions import UniversalRelationLambda2ToI, \
@@ -67,11 +74,65 @@ RECOMBINATION_FUNCS = {
         }
 
 
+# Floating point types for the stored empirical interpolation bases, see
+# _basis_dtype.
+PRECISION_DTYPES = {
+    'double': np.float64,
+    'single': np.float32,
+    }
+
+
+def _basis_dtype(precision, basis):
+    """ Returns the dtype in which to store basis for the given precision
+    ('double' or 'single'). Complex bases get the complex type of the same
+    precision.
+    """
+    if precision not in PRECISION_DTYPES:
+        raise ValueError('precision should be one of %s, got %s.'%(
+            list(PRECISION_DTYPES.keys()), precision))
+    dtype = PRECISION_DTYPES[precision]
+    if np.iscomplexobj(basis):
+        dtype = np.result_type(dtype, np.complex64)
+    return np.dtype(dtype)
+
+
+# Number of multiplications by the base phasor after which the phasor is
+# renormalized to unit modulus, see _multiply_orbital_phasors.
+PHASOR_RENORM_INTERVAL = 4
+
+
+def _multiply_orbital_phasors(modes, phi_22):
+    """
+    Multiplies each complex array h of modes, a list of (h, m) pairs, in place
+    by exp(-1j*m*phi_22/2).
+
+    Only the base phasor exp(-1j*phi_22/2) is computed with a complex
+    exponential. The phasor for m is obtained from the one for m-1 by a
+    multiplication, and is renormalized to unit modulus every
+    PHASOR_RENORM_INTERVAL steps to avoid the accumulation of round off
+    errors. Each phasor is multiplied into all arrays with that |m| as soon as
+    it is available. Negative m use the complex conjugate.
+    """
+    m_max = max([abs(m) for _, m in modes] + [0])
+    if m_max == 0:
+        return
+    base = np.exp(-0.5j*phi_22)
+    phasor = np.copy(base)
+    for m in range(1, m_max + 1):
+        if m > 1:
+            phasor *= base
+            if m % PHASOR_RENORM_INTERVAL == 0:
+                phasor /= np.abs(phasor)
+        for h, h_m in modes:
+            if h_m == m:
+                h *= phasor
+            elif h_m == -m:
+                h *= phasor.conj()
+
+
 def _mode_sum(modes, theta, phi):
-    h = 0.
-    for (ell, m), h_mode in modes.items(): # inefficient in py2
-        h += _sYlm(-2, ell, m, theta, phi) * h_mode
-    return h
+    mode_list, h = harmonics.stack_modes(modes)
+    return harmonics.mode_sum(h, mode_list, theta, phi)
 
 
 def _splinterp(xout, xin, yin, k=3, ext='const'):
@@ -89,12 +150,48 @@ def _splinterp_Cwrapper(xout, xin, yin):
     like InterpolatedUnivariateSpline."""
     if len(xin) != len(yin):
         raise Exception('Expected x and y input lengths to match.')
-    if np.iscomplexobj(yin):
-        re = _splinterp_Cwrapper(xout, xin, np.real(yin))
-        im = _splinterp_Cwrapper(xout, xin, np.imag(yin))
-        return re + 1.j*im
-    else:
-        return spline_interp_Cwrapper.interpolate(xout, xin, yin)
+    with profiling.stage('spline_upsampling'):
+        if np.iscomplexobj(yin):
+            # Real and imaginary parts in a single call
+            return spline_interp_Cwrapper.interpolate_many(xout, xin,
+                np.asarray(yin)[np.newaxis])[0]
+        else:
+            return spline_interp_Cwrapper.interpolate(xout, xin, yin)
+
+def _splinterp_Cwrapper_many(xout, xin, ys, out=None):
+    """Same as _splinterp_Cwrapper, but for ys with shape (n_cols, len(xin)).
+    All columns are interpolated with a single call to the C library, which
+    sets up the spline system and locates xout only once.
+
+    Returns an array with shape (n_cols, len(xout)), or out if given."""
+    if np.shape(ys)[-1] != len(xin):
+        raise Exception('Expected x and y input lengths to match.')
+    with profiling.stage('spline_upsampling'):
+        return spline_interp_Cwrapper.interpolate_many(xout, xin, ys, out=out)
+
+def _splinterp_cached(xout, xin, ys, interp_cache, xout_key=None):
+    """Same as _splinterp_Cwrapper_many, but if interp_cache is an LRUCache
+    the interpolation is done with a SplineOperator, which is cached keyed by
+    xin and xout. Repeated calls with the same grids then only need a sparse
+    matrix product for all columns.
+
+    xout_key: Optional hashable key identifying xout, for example
+              (t0, dt, n) for a uniform grid. This avoids hashing the data of
+              xout, which can be long.
+    """
+    if interp_cache is None:
+        return _splinterp_Cwrapper_many(xout, xin, ys)
+    if np.shape(ys)[-1] != len(xin):
+        raise Exception('Expected x and y input lengths to match.')
+    if xout_key is None:
+        xout_key = array_key(xout)
+    key = (array_key(xin), xout_key)
+    with profiling.stage('spline_upsampling'):
+        operator = interp_cache.get(key)
+        if operator is None:
+            operator = SplineOperator(xout, xin)
+            interp_cache.put(key, operator)
+        return operator.apply(ys)
 
 
 class ParamDim(SimpleH5Object):
@@ -256,24 +353,105 @@ class _SingleFunctionSurrogate_NoChecks(SimpleH5Object):
         self.n_nodes = len(node_functions)
         self.node_functions = H5ObjectList(node_functions)
 
+        # dtype of the nodes in the reconstruction, see set_precision
+        self._nodes_dtype = None
+
+        # Evaluates all node functions together if possible, see _eval_nodes
+        self._node_evaluator = get_batched_node_evaluator(node_functions)
+
     def __str__(self):
         return self.name
 
     def __repr__(self):
         return self.name
 
-    def __call__(self, x):
+    def __call__(self, x, columns=None):
         """
         Evaluates the surrogate at x, returning the result.
+
+        columns: Optional slice of the domain. If given, only these columns
+                 of the ei_basis are used, and the result is the surrogate on
+                 domain[columns].
+        """
+        with profiling.stage('node_fits'):
+            nodes = self._eval_nodes(x)
+        with profiling.stage('ei_reconstruction'):
+            if columns is None:
+                return nodes.dot(self.ei_basis)
+            return nodes.dot(self.ei_basis[:, columns])
+
+    def evaluate_batch(self, xs):
+        """
+        Evaluates the surrogate at each row of xs, which should have shape
+        (n_params, dim). Returns an array with shape (n_params, len(domain)).
+        The empirical interpolant is reconstructed with a single
+        matrix-matrix product.
         """
-        nodes = np.array([nf(x) for nf in self.node_functions])
-        return nodes.dot(self.ei_basis)
+        with profiling.stage('node_fits'):
+            nodes = self._eval_nodes_batch(xs)
+        with profiling.stage('ei_reconstruction'):
+            return nodes.dot(self.ei_basis)
+
+    def _eval_nodes(self, x):
+        """ Evaluates all node functions at x. """
+        if self._node_evaluator is not None:
+            nodes = self._node_evaluator(x)
+            return nodes.astype(self._nodes_dtype, copy=False) \
+                if self._nodes_dtype is not None else nodes
+        return np.array([nf(x) for nf in self.node_functions],
+            dtype=self._nodes_dtype)
+
+    def _eval_nodes_batch(self, xs):
+        """ Evaluates all node functions at each row of xs. """
+        if self._node_evaluator is not None:
+            nodes = self._node_evaluator.evaluate_batch(xs)
+            return nodes.astype(self._nodes_dtype, copy=False) \
+                if self._nodes_dtype is not None else nodes
+        return np.array([[nf(x) for nf in self.node_functions] for x in xs],
+            dtype=self._nodes_dtype)
+
+    def set_precision(self, precision):
+        """
+        Stores the ei_basis in 'double' or 'single' precision. The
+        reconstruction nodes.dot(ei_basis) is then done in the same precision.
+        """
+        self.ei_basis = self.ei_basis.astype(
+            _basis_dtype(precision, self.ei_basis), copy=False)
+        self._nodes_dtype = PRECISION_DTYPES[precision]
 
     def h5_prepare_subs(self):
         """Setup NodeFunctions before loading them"""
         tmp_nodes = [NodeFunction() for _ in range(self.n_nodes)]
         self.node_functions = H5ObjectList(tmp_nodes)
 
+    def _read_h5(self, f):
+        """
+        When loading with compiled node fits (see fit_sidecar.loading), the
+        node functions are evaluated from the arrays in the sidecar file and
+        the node function objects are neither read nor created. In this case
+        self.node_functions is None.
+        """
+        loader = fit_sidecar.active_loader()
+        arrays = None if loader is None else loader.get(f.name)
+        if arrays is not None:
+            self._read_data(f, self._h5_data_keys)
+            self.h5_prepare_subs()
+            for k in self._h5_subordinate_keys:
+                if k != 'node_functions':
+                    getattr(self, k)._read_h5(f[k])
+            self.node_functions = None
+            self._node_evaluator = CompiledNodeFits(arrays)
+            return
+
+        super(_SingleFunctionSurrogate_NoChecks, self)._read_h5(f)
+        self._node_evaluator = get_batched_node_evaluator(
+            self.node_functions)
+        if loader is not None:
+            arrays = compile_node_functions(self.node_functions)
+            if arrays is not None:
+                loader.add(f.name, arrays)
+                self._node_evaluator = CompiledNodeFits(arrays)
+
 
 class SingleFunctionSurrogate(_SingleFunctionSurrogate_NoChecks):
     """
@@ -392,12 +570,26 @@ class _ManyFunctionSurrogate_NoChecks(SimpleH5Object):
         sur_evals = {k: sur(x) for k, sur in self.sur_subs.iteritems()} # inefficient in py2
         return RECOMBINATION_FUNCS[self.combine_func](func_evals, sur_evals)
 
+    def evaluate_batch(self, xs):
+        """
+        Same as __call__, but for an array xs of parameters with shape
+        (n_params, dim). Each data piece gains a leading n_params axis.
+        """
+        func_evals = {k: sur.evaluate_batch(xs)
+                      for k, sur in self.func_subs.iteritems()}
+        sur_evals = {k: sur.evaluate_batch(xs)
+                     for k, sur in self.sur_subs.iteritems()}
+        return RECOMBINATION_FUNCS[self.combine_func](func_evals, sur_evals)
+
     def _eval_func(self, x, key):
         return self.func_subs[key](x)
 
     def _eval_sur(self, x, key):
         return self.sur_subs[key](x)
 
+    def _eval_sur_batch(self, xs, key):
+        return self.sur_subs[key].evaluate_batch(xs)
+
 
 class ManyFunctionSurrogate(_ManyFunctionSurrogate_NoChecks):
     """
@@ -479,6 +671,23 @@ class FastTensorSplineSurrogate(SimpleH5Object):
         self.cim = [mode_data[k][2] for k in modes]
         self.ts_grid = TensorSplineGrid(knot_vecs)
 
+    def load(self, filename, precision='double'):
+        """
+        Load data from h5 file.
+
+        precision: 'double' or 'single'. With 'single', the empirical
+                   interpolation bases and the tensor spline coefficients are
+                   stored in single precision, halving their memory, and the
+                   empirical interpolant is reconstructed in single precision.
+        """
+        super(FastTensorSplineSurrogate, self).load(filename)
+        self.ei = [ei.astype(_basis_dtype(precision, ei), copy=False)
+                   for ei in self.ei]
+        self.cre = [c.astype(_basis_dtype(precision, c), copy=False)
+                    for c in self.cre]
+        self.cim = [c.astype(_basis_dtype(precision, c), copy=False)
+                    for c in self.cim]
+
     def __call__(self, x, theta=None, phi=None, modes=None):
         """
         Return surrogate evaluation.
@@ -509,7 +718,8 @@ class FastTensorSplineSurrogate(SimpleH5Object):
             h_eim = fast_complex_tensor_spline_eval(x,self.ts_grid,self.cre[i],self.cim[i])
 
             # Evaluate the empirical interpolant
-            h_modes[k] = h_eim.dot(self.ei[i])
+            h_modes[k] = h_eim.astype(self.ei[i].dtype, copy=False).dot(
+                self.ei[i])
 
         if theta is not None:
             return _mode_sum(h_modes, theta, phi)
@@ -597,6 +807,140 @@ class MultiModalSurrogate(ManyFunctionSurrogate):
         return h_modes
 
 
+class _ReconstructionPlan(object):
+    """
+    Evaluates many data pieces (_SingleFunctionSurrogate_NoChecks on the same
+    domain) together, without going through the surrogate hierarchy.
+
+    The nodes of all pieces are evaluated into a single node matrix. The GPR
+    fits of all pieces are merged into one BatchedGPRFits (see
+    nodeFunction.merge_gpr_fits), so fits sharing their training points are
+    evaluated with one kernel evaluation. The EI bases are copied into a few
+    contiguous blocks with shape (n_pieces, n_nodes, len(domain)), and all
+    pieces of a block are reconstructed with one stacked matrix product.
+    Pieces with fewer nodes than the block are padded with zero rows. The
+    ei_basis of each piece is replaced by a view into its block, so the bases
+    are not duplicated.
+    """
+
+    # A block only takes pieces with at least this fraction of the nodes of
+    # its largest piece, which bounds the memory used by the zero padding.
+    MIN_NODES_FRACTION = 0.75
+
+    def __init__(self, pieces):
+        """ pieces: A list of (key, _SingleFunctionSurrogate_NoChecks). """
+        self.keys = [key for key, _ in pieces]
+        surs = [sur for _, sur in pieces]
+        n_nodes = [sur.n_nodes for sur in surs]
+        offsets = np.cumsum([0] + n_nodes)
+        self.node_slices = [slice(offsets[i], offsets[i+1])
+            for i in range(len(surs))]
+        self.n_total_nodes = offsets[-1]
+
+        # Merge the GPR fits of all pieces, the other pieces evaluate their
+        # own nodes
+        gpr_fits = [as_batched_gpr_fits(sur._node_evaluator) for sur in surs]
+        gpr_idx = [i for i, fits in enumerate(gpr_fits) if fits is not None]
+        self.gpr_fits = None
+        if len(gpr_idx) > 0:
+            self.gpr_fits = merge_gpr_fits([gpr_fits[i] for i in gpr_idx])
+            self.gpr_columns = np.concatenate([
+                np.arange(offsets[i], offsets[i+1]) for i in gpr_idx])
+        self.other_pieces = [(self.node_slices[i], sur)
+            for i, sur in enumerate(surs) if gpr_fits[i] is None]
+
+        # The blocks, per dtype of the bases. gather holds the column of the
+        # node matrix of each row of the block, or n_total_nodes (a column of
+        # zeros) for the padding.
+        self.blocks = []
+        n_domain = surs[0].ei_basis.shape[1]
+        dtypes = []
+        for sur in surs:
+            if sur.ei_basis.dtype not in dtypes:
+                dtypes.append(sur.ei_basis.dtype)
+        for dtype in dtypes:
+            remaining = sorted([i for i, sur in enumerate(surs)
+                if sur.ei_basis.dtype == dtype], key=lambda i: -n_nodes[i])
+            while len(remaining) > 0:
+                n_block = n_nodes[remaining[0]]
+                members = [i for i in remaining
+                    if n_nodes[i] >= self.MIN_NODES_FRACTION*n_block]
+                remaining = remaining[len(members):]
+
+                block = np.zeros((len(members), n_block, n_domain),
+                    dtype=dtype)
+                gather = np.full((len(members), n_block), self.n_total_nodes)
+                for j, i in enumerate(members):
+                    block[j, :n_nodes[i]] = surs[i].ei_basis
+                    surs[i].ei_basis = block[j, :n_nodes[i]]
+                    gather[j, :n_nodes[i]] = np.arange(offsets[i],
+                        offsets[i+1])
+                self.blocks.append((members, gather, block))
+
+    def evaluate_batch(self, xs):
+        """
+        Evaluates all data pieces at each row of xs, which should have shape
+        (n_params, dim). Returns a dict with the data piece of each key, with
+        shape (n_params, len(domain)).
+        """
+        return self.reconstruct(self.evaluate_nodes(xs))
+
+    def evaluate_nodes(self, xs):
+        """
+        Evaluates the nodes of all data pieces at each row of xs. Returns the
+        node matrix with shape (n_params, n_total_nodes + 1), to be passed to
+        reconstruct.
+        """
+        with profiling.stage('node_fits'):
+            nodes = np.zeros((len(xs), self.n_total_nodes + 1))
+            if self.gpr_fits is not None:
+                nodes[:, self.gpr_columns] = self.gpr_fits.evaluate_batch(xs)
+            for node_slice, sur in self.other_pieces:
+                nodes[:, node_slice] = sur._eval_nodes_batch(xs)
+        return nodes
+
+    def reconstruct(self, nodes, keys=None, columns=None):
+        """
+        Reconstructs data pieces from the node matrix returned by
+        evaluate_nodes.
+
+        keys:    Optional list of the keys of the data pieces to reconstruct.
+                 Default: all data pieces.
+        columns: Optional slice of the domain. If given, only these columns
+                 of the EI bases are used.
+
+        Returns a dict with the data piece of each key, with shape
+        (n_params, len(domain[columns])).
+        """
+        if columns is None:
+            columns = slice(None)
+        selected = None if keys is None else set(keys)
+        res = {}
+        with profiling.stage('ei_reconstruction'):
+            for members, gather, block in self.blocks:
+                if selected is None:
+                    used = list(range(len(members)))
+                else:
+                    used = [j for j, i in enumerate(members)
+                        if self.keys[i] in selected]
+                if len(used) < len(members):
+                    # Only some pieces of the block, one product each
+                    for j in used:
+                        piece_nodes = nodes[:, gather[j]].astype(block.dtype,
+                            copy=False)
+                        res[self.keys[members[j]]] = piece_nodes.dot(
+                            block[j, :, columns])
+                    continue
+
+                # Shape (len(members), n_params, n_nodes of the block)
+                block_nodes = nodes[:, gather].transpose(1, 0, 2).astype(
+                    block.dtype, copy=False)
+                h = np.matmul(block_nodes, block[:, :, columns])
+                for j, i in enumerate(members):
+                    res[self.keys[i]] = h[j]
+        return res
+
+
 class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
     """
     A surrogate for coorbital frame multimodal waveforms, where each waveform
@@ -607,6 +951,13 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
     Real and imaginary parts of coorbital frame waveform for other modes.
     """
 
+    # Whether __call__ accepts output_format='amp_phase' and 'coorbital'
+    supports_output_format = True
+    # Whether __call__ accepts t_window
+    supports_t_window = True
+    # Whether __call__ accepts multiband_opts, see evaluate_multiband
+    supports_multiband = True
+
     def __init__(self, name=None, domain=None, param_space=None, \
             phaseAlignIdx=None, TaylorT3_t_ref=None, \
             coorb_mode_data={(2, 2): {}}
@@ -683,6 +1034,23 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
         self.TaylorT3_t_ref = TaylorT3_t_ref
         self.TaylorT3_factor_without_eta = None
 
+        # Optional LRUCache for the sparse domain data pieces, see
+        # _eval_coorb. Not saved to the h5 file.
+        self.sparse_cache = None
+
+        # Optional LRUCache for the SplineOperators that upsample the sparse
+        # domain data to the output times, see _splinterp_cached. Not saved
+        # to the h5 file.
+        self.interp_cache = None
+
+        # Modes to load from the h5 file, see load
+        self._load_mode_list = None
+        self._load_ellMax = None
+
+        # Evaluates the data pieces of all modes together, see
+        # _get_reconstruction_plan
+        self._reconstruction_plan = None
+
         super(AlignedSpinCoOrbitalFrameSurrogate, self).__init__(name,
                 domain, param_space, {}, many_function_components,
                 self.mode_type)
@@ -692,6 +1060,106 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
         self._h5_data_keys.append('phaseAlignIdx')
         self._h5_data_keys.append('TaylorT3_t_ref')
 
+    def load(self, filename, mode_list=None, ellMax=None, precision='double',
+            compiled_fits=False):
+        """
+        Load data from h5 file.
+
+        mode_list: If given, only the data for these modes is loaded. The
+                   (2,2) mode is always loaded, as the other modes need it
+                   for the transformation to the inertial frame.
+        ellMax:    If given, only the data for modes with ell <= ellMax is
+                   loaded.
+        precision: 'double' or 'single'. With 'single', the empirical
+                   interpolation bases are stored in single precision, which
+                   halves their memory, and the bases are reconstructed
+                   in single precision. The basis of the (2,2) phase is kept
+                   in double precision, as are the TaylorT3 phase and all
+                   the later phase computations.
+        compiled_fits: If True, the node fits are loaded from a sidecar file
+                   next to filename, in which they are stored as plain numpy
+                   arrays (see fit_sidecar). This skips reading the fits from
+                   the h5 file and building the GPR objects, which is most of
+                   the load time. The sidecar file is created on the first
+                   load with compiled_fits=True, and recreated if filename
+                   changes. The node function objects are not available in
+                   this case.
+
+        Modes that are not loaded cannot be evaluated later.
+        """
+        self._load_mode_list = mode_list
+        self._load_ellMax = ellMax
+        if compiled_fits:
+            with fit_sidecar.loading(filename):
+                super(AlignedSpinCoOrbitalFrameSurrogate, self).load(filename)
+        else:
+            super(AlignedSpinCoOrbitalFrameSurrogate, self).load(filename)
+        self._set_precision(precision)
+        self._get_reconstruction_plan()
+
+    def _set_precision(self, precision):
+        """ Sets the precision of all data pieces except the (2,2) phase. """
+        for mode in self.mode_list:
+            for key, sur in self.sur_subs[mode].func_subs.iteritems():
+                if mode == tuple([2, 2]) and key == 'phase':
+                    continue
+                sur.set_precision(precision)
+        # The bases were replaced
+        self._reconstruction_plan = None
+
+    def _get_reconstruction_plan(self):
+        """
+        Returns the _ReconstructionPlan for the data pieces of all loaded
+        modes, creating it on the first call.
+        """
+        if self._reconstruction_plan is None:
+            pieces = [((mode, key), sur) for mode in self.mode_list
+                for key, sur in self.sur_subs[mode].func_subs.iteritems()]
+            self._reconstruction_plan = _ReconstructionPlan(pieces)
+        return self._reconstruction_plan
+
+    def _eval_pieces_fused(self, xs, mode_list):
+        """
+        Evaluates the data pieces of all modes with the reconstruction plan,
+        returning them in the format of _eval_coorb_batch. Only used when all
+        loaded modes are needed; for fewer modes, evaluating the data pieces
+        separately is cheaper.
+        """
+        if len(set(mode_list) | set([tuple([2, 2])])) != len(self.mode_list):
+            return None
+        pieces = self._get_reconstruction_plan().evaluate_batch(xs)
+        h = {}
+        for (mode, key), piece in pieces.items():
+            h.setdefault(mode, ({}, {}))[0][key] = piece
+        h_22 = h.pop(tuple([2, 2]))
+        return h_22, h
+
+    def h5_prepare_subs(self):
+        """
+        At this point the mode_list has been read from the h5 file. Drop the
+        modes that were not requested in load, so that their subordinate
+        surrogates are never created or read.
+        """
+        mode_list = self._load_mode_list
+        ellMax = self._load_ellMax
+        keep_modes = self.mode_list
+        if mode_list is not None:
+            for mode in mode_list:
+                if tuple(mode) not in self.mode_list:
+                    raise ValueError('Mode %s is not available in this'
+                        ' model.'%(tuple(mode),))
+            mode_list = [tuple(mode) for mode in mode_list]
+            keep_modes = [mode for mode in keep_modes \
+                if mode == tuple([2, 2]) or tuple(mode) in mode_list]
+        if ellMax is not None:
+            if ellMax < 2:
+                raise ValueError('ellMax should be at least 2.')
+            keep_modes = [mode for mode in keep_modes if mode[0] <= ellMax]
+
+        self.mode_list = keep_modes
+        self.sur_keys = [k for k in self.sur_keys if k in keep_modes]
+        super(AlignedSpinCoOrbitalFrameSurrogate, self).h5_prepare_subs()
+
     def _search_omega(self, omega22, omega_val):
         """ Find closest index such taht omega22[index] = omega_val
         """
@@ -703,7 +1171,8 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
         return idx
 
     def _coorbital_to_inertial_frame(self, h_coorb, h_22, mode_list, dtM,
-        timesM, fM_low, fM_ref, do_not_align):
+        timesM, fM_low, fM_ref, do_not_align, t_window=None,
+        multiband_opts=None, output_format='modes'):
         """ Transforms a dict from Coorbital frame to inertial frame.
 
             The surrogate data is sparsely sampled, so upsamples to time
@@ -713,6 +1182,24 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
             If fM_low is given, only part of the waveform where frequency of
             the (2, 2) mode is greater than fM_low is retained.
 
+            If t_window = (t1, t2) is given, only the part of the waveform
+            with t1 <= t <= t2 is returned. The (2, 2) mode is still
+            processed as without t_window, so that the alignment is not
+            affected, but the other modes are only reconstructed and
+            upsampled around the window.
+
+            If multiband_opts is given, the upsampling is done to a piecewise
+            uniform time grid instead, see gwsurrogate.new.multiband, whose
+            time step is dtM at the merger.
+
+            output_format is 'modes', 'amp_phase' or 'coorbital', see
+            __call__. For the last two the modes are not rotated to the
+            inertial frame.
+
+            Returns timesM, h, dynamics, band_edges, where band_edges are the
+            indices of the starts of the bands in timesM, followed by
+            len(timesM), if multiband_opts is given, and None otherwise.
+
             if do_not_align = False:
                 Aligns the 22 mode phase to be 0 at fM_ref. This means
                 that at this reference frequency, the heavier BH is roughly on
@@ -781,6 +1268,7 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
                 raise Exception("'times' starts before start of domain. Try"
                     " increasing initial value of times or reducing f_low.")
 
+        band_edges = None
         if dtM is None and timesM is None:
             # Use the sparse domain
             timesM = domain
@@ -792,15 +1280,28 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
             if dtM is not None:
                 t0 = domain[0]
                 tf = domain[-1]
-                num_times = int(np.ceil((tf - t0)/dtM));
-                timesM = t0 + dtM*np.arange(num_times)
+                if multiband_opts is None:
+                    num_times = int(np.ceil((tf - t0)/dtM));
+                    timesM = t0 + dtM*np.arange(num_times)
+                    times_key = (t0, dtM, num_times)
+                else:
+                    # Bands with time steps chosen from the sparse omega22,
+                    # dtM is the time step at the merger
+                    dt_max, samples_per_cycle = \
+                        multiband.get_multiband_opts(multiband_opts)
+                    m_max = max(abs(mode[1]) for mode in mode_list)
+                    timesM, band_edges, times_key = \
+                        multiband.multiband_times(t0, tf,
+                        self.domain[:len(omega22_sparse)], omega22_sparse,
+                        dtM, m_max, dt_max, samples_per_cycle)
             else:
                 if timesM[0] < domain[0] or timesM[-1] > domain[-1]:
                     raise Exception('Trying to evaluate at times outside the'
                         ' domain.')
+                times_key = None
 
-            Amp_22 = _splinterp_Cwrapper(timesM, domain, Amp_22)
-            phi_22 = _splinterp_Cwrapper(timesM, domain, phi_22)
+            Amp_22, phi_22 = _splinterp_cached(timesM, domain,
+                np.array([Amp_22, phi_22]), self.interp_cache, times_key)
 
             # now recompute omega22 with the dense data, but retain only data
             # upto the peak to avoid the noisy part
@@ -820,6 +1321,9 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
                 phi_22 = phi_22[startIdx:]
                 omega22 = omega22[startIdx:]
                 timesM = timesM[startIdx:]
+                times_key += (startIdx,)
+                if band_edges is not None:
+                    band_edges = multiband.slice_edges(band_edges, startIdx)
 
 
         # Get reference index where waveform needs to be aligned.
@@ -850,25 +1354,100 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
             # frequency is 0.
             phi_22 += -phi_22[refIdx]
 
+        # The part of the sparse domain needed for the other modes
+        sparseStartIdx = initIdx
+        sparseEndIdx = len(self.domain)
+        if t_window is not None:
+            winStartIdx = np.searchsorted(timesM, t_window[0], side='left')
+            winEndIdx = np.searchsorted(timesM, t_window[1], side='right')
+            if winStartIdx >= winEndIdx:
+                raise ValueError('t_window does not overlap with the'
+                    ' waveform.')
+            Amp_22 = Amp_22[winStartIdx:winEndIdx]
+            phi_22 = phi_22[winStartIdx:winEndIdx]
+            timesM = timesM[winStartIdx:winEndIdx]
+            if band_edges is not None:
+                band_edges = multiband.slice_edges(band_edges, winStartIdx,
+                    winEndIdx)
+            if do_interp:
+                # As for initIdx, keep 5 more sparse samples on each side of
+                # the window for the interpolation
+                sparseStartIdx = max(initIdx, np.searchsorted(self.domain,
+                    timesM[0], side='right') - 6)
+                sparseEndIdx = min(len(self.domain), np.searchsorted(
+                    self.domain, timesM[-1], side='left') + 6)
+                if times_key is not None:
+                    times_key += (winStartIdx, winEndIdx)
+            else:
+                sparseStartIdx = initIdx + winStartIdx
+                sparseEndIdx = initIdx + winEndIdx
+
+        # Stack the coorbital frame modes other than the (2, 2) mode, so that
+        # they are all interpolated with a single spline call
+        coorb_modes = [mode for mode in mode_list if mode != tuple([2, 2])]
+        h_coorb_stack = self._stack_coorb_modes(h_coorb, coorb_modes,
+            sparseStartIdx, sparseEndIdx)
+        if do_interp:
+            h_coorb_stack = _splinterp_cached(timesM,
+                self.domain[sparseStartIdx:sparseEndIdx], h_coorb_stack,
+                self.interp_cache, times_key)
+
+        if output_format == 'coorbital':
+            h_dict = {}
+            for mode in mode_list:
+                if mode == tuple([2, 2]):
+                    h_dict[mode] = Amp_22.astype(complex)
+                else:
+                    h_dict[mode] = h_coorb_stack[coorb_modes.index(mode)]
+            return timesM, h_dict, {'orbphase': 0.5*phi_22}, band_edges
+        elif output_format == 'amp_phase':
+            # The inertial frame phase of a mode is that of the coorbital
+            # frame mode minus m times the orbital phase
+            h_dict = {}
+            for mode in mode_list:
+                if mode == tuple([2, 2]):
+                    h_dict[mode] = (Amp_22, -phi_22)
+                else:
+                    h = h_coorb_stack[coorb_modes.index(mode)]
+                    h_dict[mode] = (np.abs(h), np.unwrap(np.angle(h))
+                        - 0.5*mode[1]*phi_22)
+            return timesM, h_dict, None, band_edges
+
+        # Rotate all modes to the inertial frame, in place
         h_dict = {}
         for mode in mode_list:
             if mode == tuple([2, 2]):
-                h_dict[mode] = Amp_22 * np.exp(-1j*phi_22)
+                h_dict[mode] = Amp_22.astype(complex)
             else:
-                l,m = mode
-                h_coorb_lm = 0
-                if 're' in h_coorb[mode][0].keys():
-                    h_coorb_lm += h_coorb[mode][0]['re'] + 1j * 0
-                if 'im' in h_coorb[mode][0].keys():
-                    h_coorb_lm += 1j*h_coorb[mode][0]['im']
-
-                h_coorb_lm = h_coorb_lm[initIdx:]
-                if do_interp:
-                    h_coorb_lm = _splinterp_Cwrapper(timesM,domain,h_coorb_lm)
-
-                h_dict[mode] = h_coorb_lm * np.exp(-1j*m*phi_22/2.)
-
-        return timesM, h_dict, None     # None is for dynamics
+                h_dict[mode] = h_coorb_stack[coorb_modes.index(mode)]
+        _multiply_orbital_phasors([(h_dict[mode], mode[1])
+            for mode in mode_list], phi_22)
+
+        # None is for dynamics
+        return timesM, h_dict, None, band_edges
+
+    def _stack_coorb_modes(self, h_coorb, coorb_modes, startIdx,
+            endIdx=None):
+        """ Returns the coorbital frame modes coorb_modes from h_coorb,
+        restricted to the indices startIdx:endIdx of the domain, as a complex
+        array with shape (len(coorb_modes), len(self.domain[startIdx:endIdx])).
+
+        h_coorb is either a dict of data pieces on the full domain, or a
+        function of a slice of the domain as returned by
+        _eval_coorb_deferred, in which case only the data pieces on
+        startIdx:endIdx are reconstructed.
+        """
+        n_times = len(self.domain[startIdx:endIdx])
+        if callable(h_coorb):
+            h_coorb = h_coorb(slice(startIdx, endIdx))
+            startIdx, endIdx = 0, None
+        h_coorb_stack = np.zeros((len(coorb_modes), n_times), dtype=complex)
+        for i, mode in enumerate(coorb_modes):
+            if 're' in h_coorb[mode][0].keys():
+                h_coorb_stack[i].real = h_coorb[mode][0]['re'][startIdx:endIdx]
+            if 'im' in h_coorb[mode][0].keys():
+                h_coorb_stack[i].imag = h_coorb[mode][0]['im'][startIdx:endIdx]
+        return h_coorb_stack
 
     def _set_TaylorT3_factor(self):
         """ Sets a term used in the 0 PN TaylorT3 phase. See Eq.43 of
@@ -885,24 +1464,159 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
 
     def _TaylorT3_phase_22(self, x):
         """ 0 PN TaylorT3 phase. See Eq.43 of arxiv.1812.07865
+
+        x can also be an array of parameters with shape (n_params, 3), in
+        which case the phase has shape (n_params, len(self.domain)).
         """
 
-        q, chi1z, chi2z = x
+        q = np.asarray(x, dtype=float)[..., 0]
         eta = q/(1.+q)**2
 
         # 0PN TaylorT3 phase
-        phi22_T3 = 1./eta**(3./8) * self.TaylorT3_factor_without_eta
+        phi22_T3 = np.multiply.outer(1./eta**(3./8),
+            self.TaylorT3_factor_without_eta)
 
         # Align at phaseAlignIdx
-        phi22_T3 -= phi22_T3[self.phaseAlignIdx]
+        phi22_T3 -= phi22_T3[..., [self.phaseAlignIdx]]
 
         return phi22_T3
 
+    def _get_mode_list(self, mode_list, ellMax):
+        """ Returns the modes to evaluate given the mode_list/ellMax inputs.
+        """
+        if mode_list is None:
+            mode_list = self.mode_list
+        else:
+            for mode in mode_list:
+                if tuple(mode) not in self.mode_list:
+                    raise ValueError('Mode %s is not available, it is either'
+                        ' not part of this model or was not loaded.'
+                        %(tuple(mode),))
+        if ellMax is not None:
+            if ellMax > np.max(np.array(self.mode_list).T[0]):
+                raise ValueError('ellMax is greater than max allowed ell.')
+            include_modes = np.array(self.mode_list).T[0] <= ellMax
+            mode_list = [self.mode_list[idx]
+                    for idx in range(len(self.mode_list))
+                    if include_modes[idx]]
+        return mode_list
+
+    def _eval_coorb_modes(self, x, mode_list):
+        """ Evaluates the (2,2) amplitude and phase, and the coorbital frame
+        data pieces of all other modes in mode_list, on the sparse domain.
+        """
+        h_22, h_coorb = self._eval_coorb_deferred(x, mode_list)
+        return h_22, h_coorb(slice(None))
+
+    def _eval_coorb_deferred(self, x, mode_list):
+        """ Same as _eval_coorb_modes, but only the (2,2) amplitude and phase
+        are reconstructed here. The data pieces of the other modes are
+        returned as a function of a slice of the sparse domain, which
+        reconstructs them using only those columns of the EI bases. This way,
+        once the (2,2) mode has fixed the part of the domain that is needed,
+        the other modes are not reconstructed over the full domain. See
+        _stack_coorb_modes.
+        """
+        # always evaluate the (2,2) mode, the other modes neeed this
+        # for transformation from coorbital to inertial frame
+
+        # At this stage the phase of the (2,2) mode is the residual after
+        # removing the TaylorT3 part (see. Eq.44 of arxiv.1812.07865)
+        coorb_modes = [k for k in mode_list if k != tuple([2, 2])]
+        if len(set(mode_list) | set([tuple([2, 2])])) == len(self.mode_list):
+            # All loaded modes are needed, evaluate all nodes together
+            plan = self._get_reconstruction_plan()
+            nodes = plan.evaluate_nodes(
+                np.asarray(x, dtype=float)[np.newaxis])
+            keys_22 = [key for key in plan.keys if key[0] == tuple([2, 2])]
+            pieces = plan.reconstruct(nodes, keys_22)
+            h_22 = ({key: piece[0] for (_, key), piece in pieces.items()},
+                {})
+
+            def h_coorb(columns):
+                pieces = plan.reconstruct(nodes, [key for key in plan.keys
+                    if key[0] != tuple([2, 2])], columns)
+                h = {}
+                for (mode, key), piece in pieces.items():
+                    h.setdefault(mode, ({}, {}))[0][key] = piece[0]
+                return h
+        else:
+            h_22 = self._eval_sur(x, tuple([2, 2]))
+
+            def h_coorb(columns):
+                return {mode: ({key: sur(x, columns) for key, sur
+                    in self.sur_subs[mode].func_subs.iteritems()}, {})
+                    for mode in coorb_modes}
+
+        # Get the TaylorT3 part and add to get the actual phase
+        self._set_TaylorT3_factor()
+        with profiling.stage('TaylorT3'):
+            h_22[0]['phase'] += self._TaylorT3_phase_22(x)
+
+        return h_22, h_coorb
+
+    def _eval_coorb(self, x, mode_list):
+        """ Same as _eval_coorb_deferred, but if self.sparse_cache is set the
+        data pieces of all modes are evaluated once and cached, keyed by x.
+        In that case h_coorb is a dict, as for _eval_coorb_modes.
+        """
+        if self.sparse_cache is None:
+            return self._eval_coorb_deferred(x, mode_list)
+
+        key = tuple(np.asarray(x, dtype=float))
+        res = self.sparse_cache.get(key)
+        if res is None:
+            res = self._eval_coorb_modes(x, self.mode_list)
+            self.sparse_cache.put(key, res)
+        h_22, h_coorb = res
+
+        # _coorbital_to_inertial_frame can modify the (2,2) phase in place,
+        # so don't hand out the cached arrays
+        h_22 = ({k: np.copy(v) for k, v in h_22[0].items()}, h_22[1])
+        h_coorb = {k: h_coorb[k] for k in mode_list if k != tuple([2,2])}
+        return h_22, h_coorb
+
+    def _eval_coorb_batch(self, xs, mode_list):
+        """ Evaluates the (2,2) amplitude/phase and the coorbital frame data
+        pieces of all other modes in mode_list for an array of parameters xs
+        with shape (n_params, 3). Every data piece has shape
+        (n_params, len(self.domain)).
+        """
+        res = self._eval_pieces_fused(xs, mode_list)
+        if res is not None:
+            h_22, h_coorb = res
+        else:
+            h_22 = self._eval_sur_batch(xs, tuple([2, 2]))
+            h_coorb = {k: self._eval_sur_batch(xs, k) for k in mode_list \
+                            if k != tuple([2,2])}
+        self._set_TaylorT3_factor()
+        with profiling.stage('TaylorT3'):
+            h_22[0]['phase'] += self._TaylorT3_phase_22(xs)
+        return h_22, h_coorb
+
+    def _select_batch_index(self, h_22, h_coorb, idx):
+        """ Picks out the data pieces of the idx-th parameter from the output
+        of _eval_coorb_batch, in the format used by __call__.
+        """
+        h_22_idx = ({k: v[idx] for k, v in h_22[0].items()}, {})
+        h_coorb_idx = {mode: ({k: v[idx] for k, v in h[0].items()}, {})
+                       for mode, h in h_coorb.items()}
+        return h_22_idx, h_coorb_idx
+
+    def _check_batch_domain(self, fM_low, timesM):
+        """ Batch evaluation stacks waveforms, so all of them need a common
+        time array.
+        """
+        if fM_low != 0 and timesM is None:
+            raise ValueError('Batch evaluation needs a common time array for'
+                ' all parameters. Either set fM_low=0 or specify timesM.')
+
 
     def __call__(self, x, fM_low=None, fM_ref=None, dtM=None,
             timesM=None, dfM=None, freqsM=None, mode_list=None, ellMax=None,
             precessing_opts=None, tidal_opts=None, par_dict=None,
-            return_dynamics=False, do_not_align=False):
+            return_dynamics=False, do_not_align=False, t_window=None,
+            multiband_opts=None, output_format='modes'):
         """
     Return dimensionless surrogate modes.
     Arguments:
@@ -953,12 +1667,52 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
                     gwsurrogate format as we may want to do some checks that
                     the waveform has not been modified.
 
+    t_window:       (t1, t2) in units of M. If given, only the part of the
+                    waveform with t1 <= t <= t2 is returned, for example to
+                    evaluate only around the merger. The modes other than the
+                    (2,2) mode are then only reconstructed and upsampled
+                    around the window. The result agrees with the full
+                    waveform restricted to the window, up to the small
+                    dependence of the upsampling on the length of the sparse
+                    data (see fM_low). Cannot be used with timesM.
+                    Default None.
+
+    multiband_opts: A dict, to return the waveform on a piecewise uniform
+                    time grid rather than with a uniform time step dtM. The
+                    grid is a sequence of bands, each with a uniform time
+                    step, which is chosen from the frequency of the (2,2)
+                    mode, from dtM at the merger to larger steps in the early
+                    inspiral. This is much cheaper for long waveforms. Use
+                    evaluate_multiband to also get the bands. Requires dtM.
+                    Allowed keys are:
+                    dt_max: The largest time step in units of M.
+                        Default: None, no limit.
+                    samples_per_cycle: The minimum number of samples per
+                        cycle of the highest mode in mode_list. Default: 4.
+                    Default None.
+
+    output_format:  How the modes are returned, one of:
+                    'modes': Complex modes in the inertial frame.
+                    'amp_phase': Each mode as a tuple (amplitude, phase) of
+                        smooth real arrays, with h_lm = amplitude *
+                        exp(1j*phase). The phase of each mode is unwrapped
+                        along timesM.
+                    'coorbital': The slowly varying coorbital frame modes,
+                        with h_lm = h_coorb_lm * exp(-1j*m*orbphase), where
+                        the orbital phase orbphase = phi_22/2 is returned
+                        as dynamics['orbphase'].
+                    The last two are meant for likelihoods that interpolate
+                    the waveform between a few times, like relative binning,
+                    and are best used with timesM.
+                    Default 'modes'.
+
     Returns
     timesM, h, dynamics:
         timesM : time array in units of M.
         h : A dictionary of waveform modes sampled at timesM with
             (ell, m) keys.
-        dynamics: None, since this is a nonprecessing model.
+        dynamics: None, since this is a nonprecessing model, except for
+            output_format='coorbital', see above.
 
 
     IMPORTANT NOTES:
@@ -970,6 +1724,40 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
         the reference epoch is along the +ve x-axis. The y-axis completes the
         right-handed triad. The reference epoch is set using f_ref.
         """
+        return self._evaluate(x, fM_low, fM_ref, dtM, timesM, dfM, freqsM,
+            mode_list, ellMax, par_dict, do_not_align, t_window,
+            multiband_opts, output_format)[:3]
+
+    def evaluate_multiband(self, x, dtM=None, multiband_opts=None, **kwargs):
+        """
+    Same as __call__ with multiband_opts, but also returns the bands.
+
+    dtM:            The time step at the merger, in units of M. Required.
+    multiband_opts: See __call__. Default: None, same as {}.
+    kwargs:         All other arguments of __call__, except timesM.
+
+    Returns
+    timesM, h, dynamics, band_edges:
+        band_edges : The indices of the starts of the bands in timesM,
+            followed by len(timesM), see
+            gwsurrogate.new.multiband.split_bands.
+        The rest are the same as for __call__.
+        """
+        if multiband_opts is None:
+            multiband_opts = {}
+        if kwargs.get('timesM') is not None:
+            raise ValueError('timesM is not allowed for evaluate_multiband.')
+        for key in ['precessing_opts', 'tidal_opts', 'return_dynamics']:
+            kwargs.pop(key, None)
+        return self._evaluate(x, dtM=dtM, multiband_opts=multiband_opts,
+            **kwargs)
+
+    def _evaluate(self, x, fM_low=None, fM_ref=None, dtM=None, timesM=None,
+            dfM=None, freqsM=None, mode_list=None, ellMax=None,
+            par_dict=None, do_not_align=False, t_window=None,
+            multiband_opts=None, output_format='modes'):
+        """ Evaluates the model as described in __call__. Returns timesM, h,
+        dynamics, band_edges, see _coorbital_to_inertial_frame. """
 
         if dfM is not None:
             raise ValueError('Expected dfM to be None for a Time domain model')
@@ -977,35 +1765,79 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
             raise ValueError('Expected freqsM to be None for a Time domain'
                 ' model')
 
-        if mode_list is None:
-            mode_list = self.mode_list
-        if ellMax is not None:
-            if ellMax > np.max(np.array(self.mode_list).T[0]):
-                raise ValueError('ellMax is greater than max allowed ell.')
-            include_modes = np.array(self.mode_list).T[0] <= ellMax
-            mode_list = [self.mode_list[idx]
-                    for idx in range(len(self.mode_list))
-                    if include_modes[idx]]
+        mode_list = self._get_mode_list(mode_list, ellMax)
 
         if par_dict is not None:
             raise ValueError('par_dict should be None for this model')
 
-        # always evaluate the (2,2) mode, the other modes neeed this
-        # for transformation from coorbital to inertial frame
+        if t_window is not None:
+            if timesM is not None:
+                raise ValueError('Cannot specify both timesM and t_window.')
+            if len(t_window) != 2 or t_window[0] >= t_window[1]:
+                raise ValueError('t_window should be (t1, t2) with t1 < t2.')
+        if multiband_opts is not None and dtM is None:
+            raise ValueError('dtM is required with multiband_opts.')
+        if output_format not in ['modes', 'amp_phase', 'coorbital']:
+            raise ValueError('Invalid output_format: %s'%output_format)
+
+        h_22, h_coorb = self._eval_coorb(x, mode_list)
+
+        with profiling.stage('coorbital_to_inertial'):
+            return self._coorbital_to_inertial_frame(h_coorb, h_22, \
+                mode_list, dtM, timesM, fM_low, fM_ref, do_not_align,
+                t_window, multiband_opts, output_format)
+
+    def evaluate_batch(self, xs, fM_low=None, fM_ref=None, dtM=None,
+            timesM=None, dfM=None, freqsM=None, mode_list=None, ellMax=None,
+            precessing_opts=None, tidal_opts=None, par_dict=None):
+        """
+    Return dimensionless surrogate modes for many parameters at once.
 
-        # At this stage the phase of the (2,2) mode is the residual after
-        # removing the TaylorT3 part (see. Eq.44 of arxiv.1812.07865)
-        h_22 = self._eval_sur(x, tuple([2, 2]))
+    xs is an array of intrinsic parameters with shape (n_params, 3). All other
+    arguments are the same as for __call__. The node functions and the
+    empirical interpolant reconstruction are evaluated for all parameters
+    together, the latter as a single matrix-matrix product per data piece.
 
-        # Get the TaylorT3 part and add to get the actual phase
-        self._set_TaylorT3_factor()
-        h_22[0]['phase'] += self._TaylorT3_phase_22(x)
+    Since the waveforms are stacked, they need a common time array. So either
+    fM_low should be 0 or timesM should be given.
 
-        h_coorb = {k: self._eval_sur(x, k) for k in mode_list \
-                        if k != tuple([2,2])}
+    Returns
+    timesM, h, mode_list:
+        timesM : time array in units of M.
+        h : complex array with shape (n_params, len(mode_list), len(timesM)).
+        mode_list : The (ell, m) modes along the second axis of h.
+        """
 
-        return self._coorbital_to_inertial_frame(h_coorb, h_22, \
-            mode_list, dtM, timesM, fM_low, fM_ref, do_not_align)
+        if dfM is not None:
+            raise ValueError('Expected dfM to be None for a Time domain model')
+        if freqsM is not None:
+            raise ValueError('Expected freqsM to be None for a Time domain'
+                ' model')
+        if par_dict is not None:
+            raise ValueError('par_dict should be None for this model')
+        self._check_batch_domain(fM_low, timesM)
+
+        mode_list = self._get_mode_list(mode_list, ellMax)
+        xs = np.atleast_2d(np.asarray(xs, dtype=float))
+
+        h_22, h_coorb = self._eval_coorb_batch(xs, mode_list)
+
+        h = None
+        for idx in range(len(xs)):
+            h_22_idx, h_coorb_idx = self._select_batch_index(h_22, h_coorb,
+                idx)
+            with profiling.stage('coorbital_to_inertial'):
+                times_idx, h_dict, _, _ = self._coorbital_to_inertial_frame(
+                    h_coorb_idx, h_22_idx, mode_list, dtM, timesM, fM_low,
+                    fM_ref, False)
+            if h is None:
+                domain = times_idx
+                h = np.zeros((len(xs), len(mode_list), len(domain)),
+                    dtype=complex)
+            for i, mode in enumerate(mode_list):
+                h[idx, i] = h_dict[mode]
+
+        return domain, h, mode_list
 
 class AlignedSpinCoOrbitalFrameSurrogateTidal(AlignedSpinCoOrbitalFrameSurrogate):
     """
@@ -1030,6 +1862,10 @@ class AlignedSpinCoOrbitalFrameSurrogateTidal(AlignedSpinCoOrbitalFrameSurrogate
     and NOT the peak of the tidally spliced waveform
     """
 
+    supports_output_format = False
+    supports_t_window = False
+    supports_multiband = False
+
     def _coorbital_to_inertial_frame(self, h_coorb, h_22, mode_list, dtM,
         timesM, fM_low, fM_ref, do_not_align, x):
         """ Transforms a dict from Coorbital frame to inertial frame.
@@ -1141,8 +1977,8 @@ class AlignedSpinCoOrbitalFrameSurrogateTidal(AlignedSpinCoOrbitalFrameSurrogate
                 num_times = int(np.ceil((tf - t0)/min_dt));
                 timesM_tmp = t0 + min_dt*np.arange(num_times)
 
-            Amp_22 = _splinterp_Cwrapper(timesM_tmp, domain, Amp_22)
-            phi_22 = _splinterp_Cwrapper(timesM_tmp, domain, phi_22)
+            Amp_22, phi_22 = _splinterp_Cwrapper_many(timesM_tmp, domain,
+                np.array([Amp_22, phi_22]))
 
             # now recompute omega22 with the dense data, but retain only data
             # upto the peak to avoid the noisy part
@@ -1277,8 +2113,8 @@ class AlignedSpinCoOrbitalFrameSurrogateTidal(AlignedSpinCoOrbitalFrameSurrogate
         # quantities are defined
         v_uniform = _splinterp_Cwrapper(timesM, timesM_tmp, v[:find])
 
-        Amp_22 = _splinterp_Cwrapper(v_uniform, v[:find], Amp_22[:find])
-        phi_22 = _splinterp_Cwrapper(v_uniform, v[:find], phi_22)
+        Amp_22, phi_22 = _splinterp_Cwrapper_many(v_uniform, v[:find],
+            np.array([Amp_22[:find], phi_22]))
         freq_orbital = np.power(v_uniform,3.)
 
         # Dynamical Tidal deformability stuff on final array for strain
@@ -1324,30 +2160,37 @@ class AlignedSpinCoOrbitalFrameSurrogateTidal(AlignedSpinCoOrbitalFrameSurrogate
             phi_22 += -phi_22[refIdx]
 
 
+        # Stack the coorbital frame modes other than the (2, 2) mode, so that
+        # they are all interpolated with a single spline call
+        coorb_modes = [mode for mode in mode_list if mode != tuple([2, 2])]
+        h_coorb_stack = self._stack_coorb_modes(h_coorb, coorb_modes,
+            initIdx, peak22Idx)
+        h_coorb_stack = _splinterp_Cwrapper_many(v_uniform, v_domain,
+            h_coorb_stack)
+
         h_dict = {}
         for mode in mode_list:
             if mode == tuple([2, 2]):
                 h_dict[mode] = (Amp_22+StrainTidalEnhancementFactor(2,2, \
                       qqq,(lambda2A*ell2Adiss),(lambda2B*ell2Bdiss),v_uniform)) \
-                      * np.exp(-1j*phi_22)
+                      .astype(complex)
             else:
                 l,m = mode
-                h_coorb_lm = 0
-                if 're' in h_coorb[mode][0].keys():
-                    h_coorb_lm += h_coorb[mode][0]['re'] + 1j * 0
-                if 'im' in h_coorb[mode][0].keys():
-                    h_coorb_lm += 1j*h_coorb[mode][0]['im']
-
-                h_coorb_lm = h_coorb_lm[initIdx:peak22Idx]
-
-                h_coorb_lm = _splinterp_Cwrapper(v_uniform,v_domain,h_coorb_lm)
+                h_coorb_lm = h_coorb_stack[coorb_modes.index(mode)]
 
+                # exp(1j*phase) of the coorbital mode, 1 where it vanishes
                 h_coorb_lm_amp = np.abs(h_coorb_lm)
-                h_coorb_lm_phase = np.unwrap(np.angle(h_coorb_lm))
                 h_coorb_lm_tid = StrainTidalEnhancementFactor(l,m,qqq, \
                         (lambda2A*ell2Adiss),(lambda2B*ell2Bdiss),v_uniform)
-                h_dict[mode] = (h_coorb_lm_amp + h_coorb_lm_tid) \
-                        * np.exp((-1j*m/2.)*phi_22+1j*h_coorb_lm_phase)
+                h_lm = np.ones(h_coorb_lm.shape, dtype=complex)
+                np.divide(h_coorb_lm, h_coorb_lm_amp, out=h_lm,
+                    where=h_coorb_lm_amp > 0)
+                h_lm *= h_coorb_lm_amp + h_coorb_lm_tid
+                h_dict[mode] = h_lm
+
+        # Rotate all modes to the inertial frame, in place
+        _multiply_orbital_phasors([(h_dict[mode], mode[1])
+            for mode in mode_list], phi_22)
 
         return timesM, h_dict, None     # None is for dynamics
 
@@ -1431,36 +2274,65 @@ class AlignedSpinCoOrbitalFrameSurrogateTidal(AlignedSpinCoOrbitalFrameSurrogate
             raise ValueError('Expected freqsM to be None for a Time domain'
                 ' model')
 
-        if mode_list is None:
-            mode_list = self.mode_list
-        if ellMax is not None:
-            if ellMax > np.max(np.array(self.mode_list).T[0]):
-                raise ValueError('ellMax is greater than max allowed ell.')
-            include_modes = np.array(self.mode_list).T[0] <= ellMax
-            mode_list = [self.mode_list[idx]
-                    for idx in range(len(self.mode_list))
-                    if include_modes[idx]]
+        mode_list = self._get_mode_list(mode_list, ellMax)
 
         # The last to parameters are the tidal parameters and are not a part of
         # the base surrogate model
         x_sur = x[:-2]
 
-        # always evaluate the (2,2) mode, the other modes neeed this
-        # for transformation from coorbital to inertial frame
+        h_22, h_coorb = self._eval_coorb(x_sur, mode_list)
 
-        # At this stage the phase of the (2,2) mode is the residual after
-        # removing the TaylorT3 part (see. Eq.44 of arxiv.1812.07865)
-        h_22 = self._eval_sur(x_sur, tuple([2, 2]))
+        with profiling.stage('coorbital_to_inertial'):
+            return self._coorbital_to_inertial_frame(h_coorb, h_22, \
+                mode_list, dtM, timesM, fM_low, fM_ref, do_not_align, x)
 
-        # Get the TaylorT3 part and add to get the actual phase
-        self._set_TaylorT3_factor()
-        h_22[0]['phase'] += self._TaylorT3_phase_22(x_sur)
+    def evaluate_batch(self, xs, fM_low=None, fM_ref=None, dtM=None,
+            timesM=None, dfM=None, freqsM=None, mode_list=None, ellMax=None,
+            precessing_opts=None, tidal_opts=None, par_dict=None):
+        """
+    Return dimensionless surrogate modes for many parameters at once.
+
+    xs is an array of intrinsic parameters with shape (n_params, 5), see
+    __call__. Tidal splicing shifts the time array differently for each
+    parameter, so timesM must be given.
 
-        h_coorb = {k: self._eval_sur(x_sur, k) for k in mode_list \
-                        if k != tuple([2,2])}
+    Returns
+    timesM, h, mode_list:
+        timesM : time array in units of M.
+        h : complex array with shape (n_params, len(mode_list), len(timesM)).
+        mode_list : The (ell, m) modes along the second axis of h.
+        """
 
-        return self._coorbital_to_inertial_frame(h_coorb, h_22, \
-            mode_list, dtM, timesM, fM_low, fM_ref, do_not_align, x)
+        if par_dict is not None:
+            raise ValueError('Expected par_dict to be None.')
+        if dfM is not None:
+            raise ValueError('Expected dfM to be None for a Time domain model')
+        if freqsM is not None:
+            raise ValueError('Expected freqsM to be None for a Time domain'
+                ' model')
+        if timesM is None:
+            raise ValueError('Batch evaluation needs a common time array for'
+                ' all parameters, timesM must be specified for this model.')
+
+        mode_list = self._get_mode_list(mode_list, ellMax)
+        xs = np.atleast_2d(np.asarray(xs, dtype=float))
+
+        # The last two parameters are the tidal parameters and are not a
+        # part of the base surrogate model
+        h_22, h_coorb = self._eval_coorb_batch(xs[:, :-2], mode_list)
+
+        h = np.zeros((len(xs), len(mode_list), len(timesM)), dtype=complex)
+        for idx in range(len(xs)):
+            h_22_idx, h_coorb_idx = self._select_batch_index(h_22, h_coorb,
+                idx)
+            with profiling.stage('coorbital_to_inertial'):
+                _, h_dict, _ = self._coorbital_to_inertial_frame(h_coorb_idx,
+                    h_22_idx, mode_list, dtM, timesM, fM_low, fM_ref, False,
+                    xs[idx])
+            for i, mode in enumerate(mode_list):
+                h[idx, i] = h_dict[mode]
+
+        return timesM, h, mode_list
 
 
 
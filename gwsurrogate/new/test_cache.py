@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+import numpy as np
+import unittest
+
+from gwsurrogate.new.cache import LRUCache, array_key, copy_arrays
+
+
+class LRUCacheTester(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(3*800)
+        for i in range(3):
+            cache.put(i, np.zeros(100))
+        self.assertEqual(cache.nbytes, 3*800)
+
+        # Access 0, so that 1 is the least recently used
+        self.assertIsNotNone(cache.get(0))
+        cache.put(3, {'a': np.zeros(50), 'b': (np.zeros(50),)})
+        self.assertNotIn(1, cache)
+        self.assertIn(0, cache)
+        self.assertIsNone(cache.get(1))
+
+        info = cache.info()
+        self.assertEqual(info['entries'], 3)
+        self.assertEqual(info['nbytes'], 3*800)
+        self.assertEqual(info['hits'], 1)
+        self.assertEqual(info['misses'], 1)
+        self.assertEqual(info['evictions'], 1)
+
+        # Too large to be stored
+        cache.put(4, np.zeros(1000))
+        self.assertNotIn(4, cache)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.nbytes, 0)
+
+    def test_helpers(self):
+        t = np.linspace(0, 1, 1000)
+        self.assertEqual(array_key(t), array_key(np.copy(t)))
+        self.assertNotEqual(array_key(t), array_key(t[:-1]))
+        self.assertEqual(array_key([1, 2]), (1., 2.))
+        self.assertIsNone(array_key(None))
+
+        obj = {'a': (t, [t]), 'b': 1}
+        obj_copy = copy_arrays(obj)
+        obj_copy['a'][1][0][0] = 5
+        self.assertEqual(t[0], 0)
+        self.assertEqual(obj_copy['b'], 1)
+        self.assertIsInstance(obj_copy['a'], tuple)
+
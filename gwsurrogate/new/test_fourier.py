@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+import numpy as np
+import unittest
+
+from gwsurrogate.new import fourier
+
+
+class FourierTester(unittest.TestCase):
+
+    def test_planck_window(self):
+        window = fourier.planck_window(100, 20, 10)
+        self.assertEqual(window[0], 0)
+        self.assertEqual(window[-1], 0)
+        np.testing.assert_array_equal(window[19:91], 1)
+        self.assertTrue(np.all(np.diff(window[:20]) > 0))
+        self.assertTrue(np.all(np.diff(window[-10:]) < 0))
+        # The cached window is returned
+        self.assertIs(fourier.planck_window(100, 20, 10), window)
+        np.testing.assert_array_equal(fourier.planck_window(10, 0, 0), 1)
+
+        with self.assertRaises(ValueError):
+            fourier.planck_window(10, 8, 8)
+
+    def test_resample(self):
+        # A chirp like spectrum, with a rapidly varying phase
+        freqs = np.linspace(0.01, 0.1, 2000)
+        amp = freqs**(-7./6)
+        phase = 0.01/freqs**(5./3)
+        htilde = np.array([amp*np.exp(1j*phase), 2*amp*np.exp(-1j*phase)])
+        freqs_out = np.linspace(0.02, 0.09, 333)
+        res = fourier.resample(freqs_out, freqs, htilde)
+        self.assertEqual(res.shape, (2, len(freqs_out)))
+        expected = freqs_out**(-7./6)*np.exp(1j*0.01/freqs_out**(5./3))
+        np.testing.assert_allclose(res[0], expected, rtol=1e-5)
+        np.testing.assert_allclose(res[1], 2*expected.conj(), rtol=1e-5)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+import numpy as np
+import unittest
+
+from gwtools.harmonics import sYlm
+from gwsurrogate.new import harmonics
+
+
+class HarmonicsTester(unittest.TestCase):
+
+    def test_sYlm(self):
+        thetas = np.array([0., 0.3, 1.7, np.pi])
+        phis = np.array([0., 1.2, 4., 0.5])
+        for ell in range(2, 6):
+            for m in range(-ell, ell+1):
+                res = harmonics.sYlm(-2, ell, m, thetas, phis)
+                for th, ph, r in zip(thetas, phis, res):
+                    self.assertAlmostEqual(r, sYlm(-2, ell, m, th, ph),
+                                           places=14)
+
+    def test_mode_sum(self):
+        mode_list = [(2, 2), (2, 1), (2, 0), (3, 3)]
+        h_modes = {mode: np.random.randn(20) + 1.j*np.random.randn(20)
+                   for mode in mode_list}
+        theta, phi = 0.7, 1.3
+
+        expected = 0.
+        for (ell, m), h_mode in h_modes.items():
+            expected += sYlm(-2, ell, m, theta, phi) * h_mode
+            if m > 0:
+                expected += sYlm(-2, ell, -m, theta, phi) \
+                    * (-1)**ell * h_mode.conjugate()
+
+        mode_list, h = harmonics.stack_modes(h_modes)
+        res = harmonics.mode_sum(h, mode_list, theta, phi,
+                                 fake_neg_modes=True)
+        np.testing.assert_allclose(res, expected, rtol=1e-13, atol=1e-15)
+
+        # Again, using the cached table
+        res = harmonics.mode_sum(h, mode_list, theta, phi,
+                                 fake_neg_modes=True)
+        np.testing.assert_allclose(res, expected, rtol=1e-13, atol=1e-15)
+
+        with self.assertRaises(Exception):
+            harmonics.mode_sum(h, [(2, -2)] + mode_list[1:], theta, phi,
+                               fake_neg_modes=True)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import numpy as np
+import unittest
+
+from gwsurrogate.new import multiband
+
+
+class MultibandTester(unittest.TestCase):
+
+    def setUp(self):
+        # A chirping frequency on a sparse grid, up to the peak at t=0
+        self.times = np.linspace(-5000., 0., 300)
+        self.omega22 = 0.3*(1 - self.times/10.)**(-3./8)
+
+    def test_multiband_times(self):
+        times, edges, key = multiband.multiband_times(-4999.3, 80.,
+            self.times, self.omega22, 0.1, 4, samples_per_cycle=5)
+        self.assertEqual(times[0], -4999.3)
+        self.assertLess(times[-1], 80.)
+        self.assertGreater(times[-1], 80. - 0.1)
+
+        # The key is hashable and fixes the grid
+        times_2, _, key_2 = multiband.multiband_times(-4999.3, 80.,
+            self.times, self.omega22, 0.1, 4, samples_per_cycle=5)
+        self.assertEqual(hash(key), hash(key_2))
+        np.testing.assert_array_equal(times, times_2)
+
+        # Each band has at least samples_per_cycle samples per cycle of the
+        # m=4 mode at the sparse times
+        self.assertEqual(edges[-1], len(times))
+        self.assertTrue(np.all(np.diff(edges) >= 2))
+        np.testing.assert_array_equal(multiband.band_edges(times), edges)
+        for t_band in multiband.split_bands(edges, times):
+            dt = t_band[1] - t_band[0]
+            np.testing.assert_allclose(np.diff(t_band), dt, rtol=1e-9)
+            level = np.log2(dt/0.1)
+            self.assertAlmostEqual(level, np.round(level))
+            in_band = (self.times >= t_band[0]) & (self.times <= t_band[-1])
+            omega = 4*self.omega22[in_band]/2
+            self.assertTrue(np.all(dt <= 2*np.pi/(5*omega)))
+        self.assertAlmostEqual(np.diff(times[-2:])[0], 0.1)
+
+        times_max, _, _ = multiband.multiband_times(-4999.3, 80., self.times,
+            self.omega22, 0.1, 4, dt_max=0.4)
+        self.assertLessEqual(np.diff(times_max).max(), 0.4 + 1e-9)
+        self.assertLess(len(times), len(times_max))
+
+    def test_split_bands(self):
+        times = np.concatenate([np.arange(5)*4., 20 + np.arange(3)*2.,
+            [26.], 27 + np.arange(4)*0.5])
+        edges = multiband.band_edges(times)
+        np.testing.assert_array_equal(edges, [0, 5, 8, 9, 13])
+        h = {(2, 2): np.exp(1j*times), (3, 3): np.exp(1.5j*times)}
+        h_bands = multiband.split_bands(edges, h)
+        self.assertEqual(len(h_bands), 4)
+        np.testing.assert_array_equal(h_bands[2][(3, 3)], h[(3, 3)][8:9])
+
+        np.testing.assert_array_equal(multiband.slice_edges(edges, 3),
+            [0, 2, 5, 6, 10])
+        np.testing.assert_array_equal(multiband.slice_edges(edges, 5, 10),
+            [0, 3, 4, 5])
+
+    def test_multiband_opts(self):
+        self.assertEqual(multiband.get_multiband_opts({}), (None, 4))
+        self.assertEqual(multiband.get_multiband_opts({'dt_max': 2.,
+            'samples_per_cycle': 8}), (2., 8))
+        with self.assertRaises(ValueError):
+            multiband.get_multiband_opts({'dt_min': 2.})
+        with self.assertRaises(ValueError):
+            multiband.get_multiband_opts({'samples_per_cycle': 2})
@@ -3,11 +3,16 @@
 import numpy as np
 import os
 import unittest
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import RBF, ConstantKernel, \
+    WhiteKernel, Matern
 
 if __package__ is "" or "None": # py2 and py3 compatible 
   print("setting __package__ to gwsurrogate.new so relative imports work")
   __package__="gwsurrogate.new"
-from .nodeFunction import DummyNodeFunction, Polyfit1D
+from .nodeFunction import DummyNodeFunction, Polyfit1D, NodeFunction, \
+    NRHybSur3dq8Fit, MappedPolyFit1D_q10_q_to_nu, get_batched_node_evaluator, \
+    compile_node_functions, CompiledNodeFits, merge_gpr_fits
 from gwsurrogate import parametric_funcs as pf
 
 TEST_FILE = 'test.h5' # Gets created and deleted
@@ -90,3 +95,122 @@ class Polyfit1DTester(BaseTest):
         self._test(inputs, 4, 'ampfitfn4_1d')
         self._test(inputs, 5, 'nuSingularPlusPolynomial')
         self._test(inputs, 5, 'nuSingular2TermsPlusPolynomial')
+
+
+def _kernel_params(kernel):
+    params = {'name': kernel.__class__.__name__}
+    for key, val in kernel.get_params(deep=False).items():
+        params[key] = _kernel_params(val) if hasattr(val, 'get_params') \
+            else val
+    return params
+
+
+class BatchedGPRFitsTester(unittest.TestCase):
+
+    # The batched sums are done in a different order than in sklearn, so
+    # the results only agree to round-off. Over 5000 random data sets the
+    # differences were below 1e-9 relative plus 4e-12 absolute.
+    RTOL = 1e-9
+    ATOL = 1e-11
+
+    def setUp(self):
+        # Fixed data, without changing the global random state
+        self.rng = np.random.RandomState(0)
+
+    def _fit_data(self, X, kernel, with_linear_model=False):
+        y = np.sin(X[:, 0]) + X[:, 1]**2 - 0.5*X[:, 2] \
+            + 0.1*self.rng.random_sample(len(X))
+        gp = GaussianProcessRegressor(kernel=kernel, optimizer=None,
+            normalize_y=True).fit(X, (y - 0.3)/2.)
+        gp_params = {'kernel_': _kernel_params(gp.kernel_)}
+        for attr in ['X_train_', 'alpha_', '_y_train_mean', '_y_train_std',
+                     'L_']:
+            gp_params[attr] = getattr(gp, attr)
+        lin_reg_params = None
+        if with_linear_model:
+            lin_reg_params = {'coef_': self.rng.random_sample(3),
+                'intercept_': self.rng.random_sample()}
+        return {'fitType': 'GPR', 'data_mean': 0.3, 'data_std': 2.,
+            'GPR_params': gp_params, 'lin_reg_params': lin_reg_params}
+
+    def test_batched_gpr_fits(self):
+        X1 = self.rng.random_sample((20, 3))
+        X2 = self.rng.random_sample((15, 3))
+        fit_data = [
+            self._fit_data(X1, ConstantKernel(1.3)*RBF([0.5, 1., 2.]) \
+                + WhiteKernel(1e-4)),
+            self._fit_data(X1, ConstantKernel(0.7)*RBF([1., 0.3, 1.]) \
+                + WhiteKernel(1e-4), with_linear_model=True),
+            self._fit_data(X2, RBF(0.8)),
+            self._fit_data(X1, Matern(length_scale=0.5, nu=1.5)),
+            self._fit_data(X1, Matern(length_scale=0.5, nu=1.5)),
+            ]
+        node_functions = [NodeFunction('node_%d'%i,
+            NRHybSur3dq8Fit('fit_%d'%i, fd)) for i, fd in enumerate(fit_data)]
+        evaluator = get_batched_node_evaluator(node_functions)
+        self.assertEqual(len(evaluator.groups), 3)
+
+        xs = np.array([[1.5, 0.3, -0.2], [4.2, -0.6, 0.5], [1., 0., 0.]])
+        expected = np.array([[nf(x) for nf in node_functions] for x in xs])
+        np.testing.assert_allclose(evaluator.evaluate_batch(xs), expected,
+            rtol=self.RTOL, atol=self.ATOL)
+        for x, res in zip(xs, expected):
+            np.testing.assert_allclose(evaluator(x), res, rtol=self.RTOL,
+                atol=self.ATOL)
+
+        # Not batched unless all nodes are GPR fits
+        node_functions.append(NodeFunction('dummy', DummyNodeFunction()))
+        self.assertIsNone(get_batched_node_evaluator(node_functions))
+
+    def test_compiled_node_fits(self):
+        X = self.rng.random_sample((20, 3))
+        fits = [
+            NRHybSur3dq8Fit('gpr_0', self._fit_data(X,
+                ConstantKernel(1.3)*RBF([0.5, 1., 2.]) + WhiteKernel(1e-4))),
+            Polyfit1D('polyval_1d', self.rng.random_sample(4)),
+            NRHybSur3dq8Fit('gpr_1', self._fit_data(X, RBF(0.8),
+                with_linear_model=True)),
+            MappedPolyFit1D_q10_q_to_nu('ampfitfn1_1d',
+                self.rng.random_sample(3)),
+            ]
+        node_functions = [NodeFunction('node_%d'%i, fit)
+            for i, fit in enumerate(fits)]
+        compiled = CompiledNodeFits(compile_node_functions(node_functions))
+
+        xs = np.array([[1.5, 0.3, -0.2], [4.2, -0.6, 0.5], [1., 0., 0.]])
+        expected = np.array([[nf(x) for nf in node_functions] for x in xs])
+        np.testing.assert_allclose(compiled.evaluate_batch(xs), expected,
+            rtol=self.RTOL, atol=self.ATOL)
+        np.testing.assert_allclose(compiled(xs[0]), expected[0],
+            rtol=self.RTOL, atol=self.ATOL)
+
+        # Kernels other than c*RBF cannot be compiled
+        node_functions.append(NodeFunction('matern', NRHybSur3dq8Fit('matern',
+            self._fit_data(X, Matern(length_scale=0.5, nu=1.5)))))
+        self.assertIsNone(compile_node_functions(node_functions))
+
+    def test_merge_gpr_fits(self):
+        X1 = self.rng.random_sample((20, 3))
+        X2 = self.rng.random_sample((15, 3))
+        pieces = [
+            [self._fit_data(X1, ConstantKernel(1.3)*RBF([0.5, 1., 2.])),
+             self._fit_data(X2, RBF(0.8), with_linear_model=True)],
+            [self._fit_data(X1, RBF(0.3), with_linear_model=True),
+             self._fit_data(X1, Matern(length_scale=0.5, nu=1.5))],
+            [self._fit_data(X2, RBF(1.2))],
+            ]
+        evaluators = []
+        node_functions = []
+        for i, piece in enumerate(pieces):
+            nfs = [NodeFunction('node_%d'%j, NRHybSur3dq8Fit('fit_%d'%j, fd))
+                for j, fd in enumerate(piece)]
+            evaluators.append(get_batched_node_evaluator(nfs))
+            node_functions += nfs
+        merged = merge_gpr_fits(evaluators)
+        self.assertEqual(len(merged.groups), 3)
+
+        xs = np.array([[1.5, 0.3, -0.2], [4.2, -0.6, 0.5]])
+        expected = np.array([[nf(x) for nf in node_functions] for x in xs])
+        np.testing.assert_allclose(merged.evaluate_batch(xs), expected,
+            rtol=self.RTOL, atol=self.ATOL)
+
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+
+import h5py
+import numpy as np
+import os
+import unittest
+from scipy.special import binom
+
+from gwsurrogate.new import precessing_surrogate
+
+TEST_FILE = 'test_dynamics.h5' # Gets created and deleted
+COORB_TEST_FILE = 'test_coorbital.h5' # Gets created and deleted
+
+
+def _make_dynamics_file(filename):
+    """Data for a small DynamicsSurrogate, with polynomial fits"""
+    rng = np.random.RandomState(0)
+    # Three pairs of half steps at the start, for the initial RK4 steps
+    t = np.append(np.arange(7.), 6. + 2*np.arange(1, 40)) - 90.
+    bfOrders = np.array([[0, 0, 0, 0, 0, 0, 0],
+                         [1, 0, 0, 0, 0, 0, 0],
+                         [0, 1, 0, 1, 0, 0, 0],
+                         [2, 0, 0, 0, 0, 2, 1],
+                         [0, 0, 0, 2, 1, 0, 0]])
+
+    with h5py.File(filename, 'w') as f:
+        f.create_dataset('t_ds', data=t)
+        for i in range(len(t)):
+            group = f.create_group('ds_node_%d'%i)
+
+            def add_fit(key, value, scale):
+                coefs = np.append(value, scale*rng.randn(len(bfOrders)-1))
+                group.create_dataset('%s_coefs'%key, data=coefs)
+                group.create_dataset('%s_bfOrders'%key, data=bfOrders)
+
+            # An increasing orbital frequency, and slow precession
+            add_fit('omega', 0.02 + 0.001*i, 1e-3)
+            for j in range(2):
+                add_fit('omega_orb_%d'%j, 1e-3*rng.randn(), 1e-4)
+            for key in ['chiA', 'chiB']:
+                for j in range(3):
+                    add_fit('%s_%d'%(key, j), 1e-3*rng.randn(), 1e-4)
+
+
+def _make_coorbital_file(filename, ellMax=4, num_times=40):
+    """Data for a small CoorbitalWaveformSurrogate, with random EI bases and
+    polynomial fits"""
+    rng = np.random.RandomState(3)
+    bfOrders = np.array([[0, 0, 0, 0, 0, 0, 0],
+                         [1, 0, 0, 0, 0, 0, 0],
+                         [0, 1, 0, 1, 0, 0, 0],
+                         [0, 0, 0, 2, 1, 0, 1]])
+
+    with h5py.File(filename, 'w') as f:
+        f.create_dataset('t_coorb', data=np.linspace(-100., 50., num_times))
+
+        def add_component(key):
+            group = f.create_group(key)
+            num_nodes = rng.randint(3, 9)
+            group.create_dataset('EIBasis',
+                data=rng.randn(num_nodes, num_times))
+            group.create_dataset('nodeIndices', data=np.sort(
+                rng.choice(num_times, num_nodes, replace=False)))
+            modelers = group.create_group('nodeModelers')
+            for i in range(num_nodes):
+                modelers.create_dataset('coefs_%d'%i,
+                    data=rng.randn(len(bfOrders)))
+                modelers.create_dataset('bfOrders_%d'%i, data=bfOrders)
+
+        for ell in range(2, ellMax+1):
+            for reim in ['real', 'imag']:
+                add_component('hCoorb_%s_0_%s'%(ell, reim))
+            for m in range(1, ell+1):
+                for reim in ['Re', 'Im']:
+                    for pm in ['+', '-']:
+                        add_component('hCoorb_%s_%s_%s%s'%(ell, m, reim, pm))
+
+
+def _wignerD_reference(q, ellMax):
+    """ The Wigner-D matrices from the explicit sums over rho, see
+    precessing_surrogate._wignerD_matrices """
+    ra = q[0] + 1.j*q[3]
+    rb = q[2] + 1.j*q[1]
+    ra_small = abs(ra) < 1.e-12
+    rb_small = abs(rb) < 1.e-12
+    matrices = [np.zeros((2*ell+1, 2*ell+1, len(ra)), dtype=complex)
+        for ell in range(2, ellMax+1)]
+    for i, ell in enumerate(range(2, ellMax+1)):
+        for m in range(-ell, ell+1):
+            for mp in range(-ell, ell+1):
+                for j in range(len(ra)):
+                    if ra_small[j]:
+                        if mp == -m:
+                            sign = 1 if (ell+m)%2 == 1 else -1
+                            matrices[i][ell+m, ell+mp, j] = sign*rb[j]**(2*m)
+                        continue
+                    if rb_small[j]:
+                        if mp == m:
+                            matrices[i][ell+m, ell+mp, j] = ra[j]**(2*m)
+                        continue
+                    ratio = (abs(rb[j])/abs(ra[j]))**2
+                    s = sum(((-1)**rho)*binom(ell+mp, rho)
+                        *binom(ell-mp, ell-rho-m)*ratio**rho
+                        for rho in range(max(0, mp-m), min(ell+mp, ell-m)+1))
+                    matrices[i][ell+m, ell+mp, j] = s \
+                        *precessing_surrogate._utils.wigner_coef(ell, mp, m) \
+                        *ra[j]**(m+mp)*rb[j]**(m-mp)*abs(ra[j])**(2*(ell-m))
+    return matrices
+
+
+class WignerDTester(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(5)
+        self.quat = rng.randn(4, 150)
+        self.quat /= np.sqrt(np.sum(self.quat**2, 0))
+        # Times where ra or rb vanish
+        self.quat[:, 3] = [0., 1., 0., 0.]
+        self.quat[:, 7] = [0., 0.6, 0.8, 0.]
+        self.quat[:, 11] = [0.6, 0., 0., 0.8]
+        self.quat[:, 12] = [1., 0., 0., 0.]
+
+    def test_wignerD_matrices(self):
+        for ellMax in [2, 4, 5]:
+            matrices = precessing_surrogate._wignerD_matrices(self.quat,
+                ellMax)
+            expected = _wignerD_reference(self.quat, ellMax)
+            self.assertEqual(len(matrices), len(expected))
+            for mat, exp in zip(matrices, expected):
+                self.assertEqual(mat.shape, exp.shape)
+                np.testing.assert_allclose(mat, exp, rtol=1e-12, atol=1e-13)
+
+    def test_rotateWaveform(self):
+        rng = np.random.RandomState(6)
+        h = rng.randn(21, 150) + 1.j*rng.randn(21, 150)
+        res = precessing_surrogate.rotateWaveform(self.quat, h)
+        matrices = precessing_surrogate._wignerD_matrices(
+            precessing_surrogate.quatInv(self.quat), 4)
+        i = 0
+        for ell in range(2, 5):
+            for m in range(-ell, ell+1):
+                expected = sum(matrices[ell-2][ell+m, ell+mp]*h[i+mp+ell]
+                    for mp in range(-ell, ell+1))
+                np.testing.assert_allclose(res[i+m+ell], expected,
+                    rtol=1e-12, atol=1e-13)
+            i += 2*ell + 1
+
+
+class CoorbitalWaveformSurrogateTester(unittest.TestCase):
+
+    def setUp(self):
+        _make_coorbital_file(COORB_TEST_FILE)
+        rng = np.random.RandomState(4)
+        self.q = 2.3
+        self.chiA = 0.3*rng.randn(40, 3)
+        self.chiB = 0.3*rng.randn(40, 3)
+
+    def tearDown(self):
+        if os.path.isfile(COORB_TEST_FILE):
+            os.remove(COORB_TEST_FILE)
+
+    def _modes_per_component(self, sur, ellMax):
+        """ The modes from _eval_comp for each component """
+        modes = 1.j*np.zeros((ellMax*ellMax + 2*ellMax - 3, len(sur.t)))
+        for ell in range(2, ellMax+1):
+            re, im = [precessing_surrogate._eval_comp(
+                sur.data['%s_0_%s'%(ell, reim)], self.q, self.chiA,
+                self.chiB) for reim in ['real', 'imag']]
+            modes[ell*(ell+1) - 4] = re + 1.j*im
+            for m in range(1, ell+1):
+                comps = [precessing_surrogate._eval_comp(
+                    sur.data['%s_%s_%s'%(ell, m, comp)], self.q, self.chiA,
+                    self.chiB) for comp in ['Re+', 'Re-', 'Im+', 'Im-']]
+                h_posm, h_negm = precessing_surrogate._assemble_mode_pair(
+                    *comps)
+                modes[ell*(ell+1) - 4 + m] = h_posm
+                modes[ell*(ell+1) - 4 - m] = h_negm
+        return modes
+
+    def test_call(self):
+        for precision, rtol in [('double', 1e-12), ('single', 1e-5)]:
+            for ellMax_load in [None, 3]:
+                with h5py.File(COORB_TEST_FILE, 'r') as f:
+                    sur = precessing_surrogate.CoorbitalWaveformSurrogate(f,
+                        ellMax=ellMax_load, precision=precision)
+                for ellMax in range(2, sur.ellMax+1):
+                    modes = sur(self.q, self.chiA, self.chiB, ellMax=ellMax)
+                    expected = self._modes_per_component(sur, ellMax)
+                    self.assertEqual(modes.shape, expected.shape)
+                    np.testing.assert_allclose(modes, expected, rtol=rtol,
+                        atol=rtol*np.max(abs(expected)))
+
+
+class DynamicsSurrogateTester(unittest.TestCase):
+
+    def setUp(self):
+        _make_dynamics_file(TEST_FILE)
+        with h5py.File(TEST_FILE, 'r') as f:
+            self.sur = precessing_surrogate.DynamicsSurrogate(f)
+        self.q = np.array([1.2, 2.5, 3.7, 1.9])
+        self.chiA0 = np.array([[0.1, 0.3, 0.4], [0.5, 0., -0.2],
+                               [0., 0., 0.8], [-0.3, 0.2, 0.1]])
+        self.chiB0 = np.array([[0., 0.2, -0.1], [0.3, 0.3, 0.3],
+                               [-0.6, 0., 0.], [0.1, -0.4, 0.2]])
+
+    def tearDown(self):
+        if os.path.isfile(TEST_FILE):
+            os.remove(TEST_FILE)
+
+    def _check_batch(self, **kwargs):
+        """ Compares evaluate_batch with __call__ for each binary. kwargs
+        are arrays with one value per binary. """
+        res = self.sur.evaluate_batch(self.q, self.chiA0, self.chiB0,
+            init_orbphase=0.3, **kwargs)
+        for i in range(len(self.q)):
+            kwargs_i = {k: v[i] for k, v in kwargs.items()}
+            expected = self.sur(self.q[i], self.chiA0[i], self.chiB0[i],
+                init_orbphase=0.3, **kwargs_i)
+            for batch_val, val in zip(res[:4], expected[:4]):
+                np.testing.assert_allclose(batch_val[i], val, rtol=1e-9,
+                    atol=1e-11)
+            if res[4] is not None:
+                self.assertAlmostEqual(res[4][i], expected[4], places=10)
+        return res
+
+    def test_evaluate_batch(self):
+        quat, orbphase, chiA, chiB, t_low = self._check_batch()
+        L = len(self.sur.t) - 3
+        self.assertEqual(quat.shape, (4, 4, L))
+        self.assertEqual(orbphase.shape, (4, L))
+        self.assertEqual(chiA.shape, (4, L, 3))
+        self.assertIsNone(t_low)
+
+        # Binaries starting at different nodes, integrated forward and
+        # backward in separate groups
+        self._check_batch(t_ref=np.array([-87.3, -60.2, -60.9, -20.1]))
+        self._check_batch(omega_ref=np.array([0.025, 0.04, 0.05, 0.04]),
+            omega_low=np.array([0.025, 0.03, 0.035, 0.04]))
+
+    def test_batch_kernels(self):
+        rng = np.random.RandomState(1)
+        y = rng.randn(5, 11)
+        q = 1 + 3*rng.rand(5)
+        for i in [0, 7, 20]:
+            dydt = self.sur.get_time_deriv_from_index(i, q, y)
+            for j in range(len(y)):
+                np.testing.assert_allclose(dydt[j],
+                    self.sur.get_time_deriv_from_index(i, q[j], y[j]),
+                    rtol=1e-12, atol=1e-15)
+
+        normA, normB = rng.rand(5), rng.rand(5)
+        y_norm = precessing_surrogate._normalize_y(y, normA, normB)
+        k = rng.randn(4, 5, 11)
+        dy = precessing_surrogate._ab4_dy(k[0], k[1], k[2], k[3], 1., 1.,
+            2., 2.)
+        for j in range(len(y)):
+            np.testing.assert_allclose(y_norm[j],
+                precessing_surrogate._normalize_y(y[j], normA[j], normB[j]),
+                rtol=1e-14)
+            np.testing.assert_allclose(dy[j],
+                precessing_surrogate._ab4_dy(k[0][j], k[1][j], k[2][j],
+                k[3][j], 1., 1., 2., 2.), rtol=1e-12, atol=1e-14)
+
+    def test_c_integrator(self):
+        self.assertTrue(self.sur.use_c_integrator)
+        # Starting at the first node, at nodes 1 and 2 (forward RK4 steps)
+        # and later nodes (backward RK4 steps)
+        for t_ref in [None, -88.1, -85.8, -83.6, -60.2, -20.1]:
+            for i in range(len(self.q)):
+                args = (self.q[i], self.chiA0[i], self.chiB0[i])
+                kwargs = dict(init_orbphase=0.3, t_ref=t_ref)
+                self.sur.use_c_integrator = True
+                res_c = self.sur(*args, **kwargs)
+                self.sur.use_c_integrator = False
+                res_py = self.sur(*args, **kwargs)
+                # The same steps, up to round off errors
+                for val_c, val_py in zip(res_c[:4], res_py[:4]):
+                    np.testing.assert_allclose(val_c, val_py, rtol=1e-12,
+                        atol=1e-14)
+
+    def test_eval_fits(self):
+        rng = np.random.RandomState(2)
+        x = np.append(1 + 3*rng.rand(), 0.5*rng.randn(6))
+        fit_params = precessing_surrogate._get_fit_params(x)
+        data = self.sur.fit_data[5]
+        fits = data['omega_orb'] + [data['omega']] + data['chiA'] \
+            + data['chiB']
+        expected = [precessing_surrogate._eval_scalar_fit(fit, fit_params)
+            for fit in fits]
+        packed = precessing_surrogate._pack_fits(fits)
+        np.testing.assert_array_equal(
+            precessing_surrogate._eval_fits(packed, fit_params), expected)
+        np.testing.assert_array_equal(
+            precessing_surrogate._eval_fits(self.sur._node_fits(5),
+            fit_params), expected)
+
+        # One row of parameters per fit
+        xs = np.column_stack([1 + 3*rng.rand(len(fits)),
+            0.5*rng.randn(len(fits), 6)])
+        fit_params = [precessing_surrogate._get_fit_params(x) for x in xs]
+        expected = [precessing_surrogate._eval_scalar_fit(fit, params)
+            for fit, params in zip(fits, fit_params)]
+        np.testing.assert_array_equal(
+            precessing_surrogate._eval_fits(packed, fit_params), expected)
+
+    def test_array_checks(self):
+        # The C functions read the arrays through plain pointers, so arrays
+        # of the wrong type, layout or size should raise a ValueError
+        utils = precessing_surrogate._utils
+        settings = precessing_surrogate._get_fit_settings()
+        bf_orders, coefs, offsets = self.sur.packed_fits
+        x = np.append(2., np.zeros(6))
+        bad_packed_fits = [
+            (bf_orders.astype(np.int32), coefs, offsets),
+            (bf_orders, coefs.astype(np.float32), offsets),
+            (bf_orders, coefs, offsets.astype(np.float64)),
+            (np.asfortranarray(bf_orders), coefs, offsets),
+            (bf_orders, np.repeat(coefs, 2)[::2], offsets),
+            (bf_orders[:-1], coefs, offsets),
+            (bf_orders, coefs, offsets + 1),
+            (bf_orders, coefs, offsets[::-1].copy()),
+            ]
+        for packed_fits in bad_packed_fits:
+            with self.assertRaises(ValueError):
+                utils.eval_fits(*packed_fits, x, *settings)
+        for bad_x in [np.repeat(x, 2)[::2], x.astype(np.float32)]:
+            with self.assertRaises(ValueError):
+                utils.eval_fits(bf_orders, coefs, offsets, bad_x, *settings)
+
+        t = self.sur.t
+        y_of_t = np.zeros((len(t) - 3, 11))
+        args = (1.5, 1., 1., 0) + tuple(settings)
+        for packed_fits in bad_packed_fits:
+            with self.assertRaises(ValueError):
+                utils.integrate_dynamics(t, *packed_fits, y_of_t, *args)
+        for bad_t in [np.repeat(t, 2)[::2], t.astype(np.float32)]:
+            with self.assertRaises(ValueError):
+                utils.integrate_dynamics(bad_t, bf_orders, coefs, offsets,
+                    y_of_t, *args)
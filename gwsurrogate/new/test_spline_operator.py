@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+import numpy as np
+import unittest
+
+from gwsurrogate import spline_interp_Cwrapper
+from gwsurrogate.new.cache import LRUCache
+from gwsurrogate.new.spline_operator import SplineOperator
+
+
+class SplineOperatorTester(unittest.TestCase):
+
+    def setUp(self):
+        # Non uniform knots, like the sparse surrogate domains
+        self.x = np.cumsum(np.linspace(0.5, 0.05, 60))
+        self.x -= self.x[0]
+        self.xnew = np.linspace(self.x[0], self.x[-1], 1001)
+
+    def test_apply(self):
+        op = SplineOperator(self.xnew, self.x)
+        ys = np.array([np.sin(self.x), np.cos(3*self.x), self.x**2])
+        res = op.apply(ys)
+        self.assertEqual(res.shape, (3, len(self.xnew)))
+        for y, r in zip(ys, res):
+            expected = spline_interp_Cwrapper.interpolate(self.xnew, self.x,
+                y)
+            np.testing.assert_allclose(r, expected, rtol=0, atol=1e-13)
+
+        # Complex columns, read from a transposed array, into a given output
+        ys = np.exp(1.j*np.outer(self.x, np.arange(1, 4)))
+        out = np.zeros((3, len(self.xnew)), dtype=complex)
+        self.assertIs(op.apply(ys.T, out=out), out)
+        expected = spline_interp_Cwrapper.interpolate_many(self.xnew, self.x,
+            ys.T)
+        np.testing.assert_allclose(out, expected, rtol=0, atol=1e-13)
+
+        with self.assertRaises(ValueError):
+            op.apply(ys.T, out=np.zeros((3, len(self.xnew))))
+        with self.assertRaises(ValueError):
+            op.apply(ys)
+        with self.assertRaises(Exception):
+            SplineOperator(self.xnew + 1, self.x)
+
+    def test_cache_size(self):
+        op = SplineOperator(self.xnew, self.x)
+        self.assertGreater(op.nbytes, op.matrix.data.nbytes)
+        cache = LRUCache(op.nbytes)
+        cache.put('op', op)
+        self.assertEqual(cache.info()['nbytes'], op.nbytes)
+
@@ -56,6 +56,50 @@ class SplinterpTester(BaseTest):
         y_interp = surrogate._splinterp(self.x_dense, self.x_sparse, y_sparse)
         self.assertLess(np.max(abs(y_interp - y_dense)), self.abs_tol)
 
+    def test_Cwrapper_many(self):
+        # Several complex columns, read from a transposed array, should give
+        # the same result as interpolating each column on its own
+        k = np.arange(1, 5)
+        y_sparse = np.exp(1.j*np.outer(self.x_sparse, k)/4.)
+        y_many = surrogate._splinterp_Cwrapper_many(self.x_dense,
+            self.x_sparse, y_sparse.T)
+        self.assertEqual(y_many.shape, (len(k), len(self.x_dense)))
+        for i in range(len(k)):
+            y_interp = surrogate._splinterp_Cwrapper(self.x_dense,
+                self.x_sparse, np.copy(y_sparse[:, i]))
+            np.testing.assert_allclose(y_many[i], y_interp, rtol=0,
+                atol=1e-13)
+
+        # Real columns, written into a given output array, at unsorted
+        # samples
+        x_out = self.x_dense[::-1]
+        out = np.zeros((2, len(x_out)))
+        y_sparse = np.array([np.sin(self.x_sparse), np.cos(self.x_sparse)])
+        res = surrogate._splinterp_Cwrapper_many(x_out, self.x_sparse,
+            y_sparse, out=out)
+        self.assertIs(res, out)
+        for i in range(2):
+            np.testing.assert_allclose(out[i], surrogate._splinterp_Cwrapper(
+                x_out, self.x_sparse, y_sparse[i]), rtol=0, atol=1e-13)
+
+        # Rows read in reverse order, with negative strides
+        y_rev = surrogate._splinterp_Cwrapper_many(x_out, self.x_sparse,
+            y_sparse[::-1])
+        np.testing.assert_array_equal(y_rev, out[::-1])
+
+        with self.assertRaises(ValueError):
+            surrogate._splinterp_Cwrapper_many(x_out, self.x_sparse,
+                y_sparse, out=np.zeros((2, len(x_out)), dtype=complex))
+
+        # Fewer than 3 knots, or knots that are not strictly increasing
+        for x in [[0.], [0., 1.]]:
+            with self.assertRaises(ValueError):
+                surrogate._splinterp_Cwrapper_many([0.], x,
+                    np.ones((2, len(x))))
+        with self.assertRaises(ValueError):
+            surrogate._splinterp_Cwrapper_many([0.5], [0., 1., 1., 2.],
+                np.ones((2, 4)))
+
 class ParamSpaceTester(BaseTest):
 
     def _test_ParamDim_nudge(self, tol, xmin, xmax):
@@ -213,3 +257,611 @@ class SingleFunctionSurrogateTester(BaseTest):
         sfs2.load(TEST_FILE)
 
         check_cases(sfs2)
+
+
+def _make_aligned_surrogate():
+    """A small AlignedSpinCoOrbitalFrameSurrogate with polynomial fits"""
+    t = np.linspace(-2000., 50., 400)
+    amp = 0.4*(1 + (t/10.)**2)**(-1./8)
+
+    def data_piece(basis, coefs):
+        ei = np.array([basis, basis*np.cos(t/500.)])/2.
+        nf = [nodeFunction.NodeFunction('node_%s'%(i),
+                node_function=nodeFunction.Polyfit1D('polyval_1d', c))
+              for i, c in enumerate(coefs)]
+        return (ei, nf)
+
+    coorb_mode_data = {
+        (2, 2): {'amp': data_piece(amp, [[0.1, 1.], [0.05, 0.9]]),
+                 'phase': data_piece(np.cos(t/2000.), [[0.05, 0.], [0.1, 0.]])},
+        (2, 1): {'re': data_piece(0.05*amp, [[0.2, 1.], [0.1, 0.5]]),
+                 'im': data_piece(0.01*amp, [[0.2, 0.5], [0.1, 1.]])},
+        (3, 3): {'re': data_piece(0.03*amp, [[0.2, 1.], [0.1, 0.5]]),
+                 'im': data_piece(0.01*amp, [[0.2, 0.5], [0.1, 1.]])},
+        }
+    params = [surrogate.ParamDim('q', 0.98, 10.02),
+              surrogate.ParamDim('chi1', -1.01, 1.01),
+              surrogate.ParamDim('chi2', -1.01, 1.01)]
+    ps = surrogate.ParamSpace('aligned', params)
+    return surrogate.AlignedSpinCoOrbitalFrameSurrogate('aligned', t, ps,
+        phaseAlignIdx=200, TaylorT3_t_ref=60.,
+        coorb_mode_data=coorb_mode_data)
+
+
+class AlignedSpinCoOrbitalFrameSurrogateTester(BaseTest):
+
+    def test_evaluate_batch(self):
+        sur = _make_aligned_surrogate()
+        xs = np.array([[1.5, 0.3, -0.2], [2.3, -0.1, 0.1], [4., 0.5, 0.]])
+
+        for kwargs in [{'fM_low': 0, 'fM_ref': 0},
+                       {'fM_low': 0, 'fM_ref': 0,
+                        'timesM': np.linspace(-1500, 40, 300)}]:
+            t, h, mode_list = sur.evaluate_batch(xs, **kwargs)
+            self.assertEqual(h.shape, (len(xs), len(mode_list), len(t)))
+            for x, h_x in zip(xs, h):
+                t_x, h_dict, _ = sur(x, **kwargs)
+                np.testing.assert_array_equal(t, t_x)
+                for mode, h_mode in zip(mode_list, h_x):
+                    np.testing.assert_allclose(h_mode, h_dict[mode],
+                                               rtol=1e-12, atol=1e-14)
+
+        with self.assertRaises(ValueError):
+            sur.evaluate_batch(xs, fM_low=1.e-3, fM_ref=1.e-3)
+
+
+    def test_load_modes(self):
+        sur = _make_aligned_surrogate()
+        sur.save(TEST_FILE)
+        x = [2.3, -0.1, 0.1]
+        _, h, _ = sur(x, fM_low=0, fM_ref=0)
+
+        for kwargs, modes in [({'mode_list': [(3, 3)]}, [(2, 2), (3, 3)]),
+                              ({'ellMax': 2}, [(2, 2), (2, 1)])]:
+            sur2 = surrogate.AlignedSpinCoOrbitalFrameSurrogate()
+            sur2.load(TEST_FILE, **kwargs)
+            self.assertEqual(sur2.mode_list, modes)
+            self.assertEqual(sorted(sur2.sur_subs.object_dict.keys()),
+                             sorted(modes))
+            _, h2, _ = sur2(x, fM_low=0, fM_ref=0)
+            self.assertEqual(sorted(h2.keys()), sorted(modes))
+            for mode in modes:
+                np.testing.assert_array_equal(h2[mode], h[mode])
+
+        with self.assertRaises(ValueError):
+            sur2(x, fM_low=0, fM_ref=0, mode_list=[(3, 3)])
+
+    def test_orbital_phasors(self):
+        # A long, rapidly growing phase as for long inspirals
+        phi_22 = np.linspace(0, 2.e5, 10001)**1.1
+        m_values = [2, 1, 0, 5, 3, -2, 4]
+        modes = [(np.ones(len(phi_22), dtype=complex), m) for m in m_values]
+        surrogate._multiply_orbital_phasors(modes, phi_22)
+        for h, m in modes:
+            np.testing.assert_allclose(h, np.exp(-1j*m*phi_22/2.), rtol=0,
+                                       atol=1e-8)
+            np.testing.assert_allclose(abs(h), 1, rtol=0, atol=1e-14)
+
+    def test_t_window(self):
+        sur = _make_aligned_surrogate()
+        x = [2.3, -0.1, 0.1]
+        t_window = (-1000., -500.)
+
+        # The other modes are reconstructed only on part of the domain
+        h_22, h_coorb = sur._eval_coorb_deferred(x, sur.mode_list)
+        h_22_full, h_coorb_full = sur._eval_coorb_modes(x, sur.mode_list)
+        h_coorb = h_coorb(slice(100, 150))
+        for mode in [(2, 1), (3, 3)]:
+            for key in ['re', 'im']:
+                np.testing.assert_allclose(h_coorb[mode][0][key],
+                    h_coorb_full[mode][0][key][100:150], rtol=1e-13,
+                    atol=1e-15)
+
+        # On the sparse domain the window just picks out samples, with
+        # upsampling the other modes differ very slightly because less
+        # sparse data is used
+        for kwargs, tol in [({}, 1e-12), ({'dtM': 0.5}, 1e-6)]:
+            t, h, _ = sur(x, fM_low=0, fM_ref=0, **kwargs)
+            t_w, h_w, _ = sur(x, fM_low=0, fM_ref=0, t_window=t_window,
+                              **kwargs)
+            in_window = (t >= t_window[0]) & (t <= t_window[1])
+            np.testing.assert_array_equal(t_w, t[in_window])
+            for mode in h.keys():
+                np.testing.assert_allclose(h_w[mode], h[mode][in_window],
+                                           rtol=tol, atol=1e-9)
+
+        with self.assertRaises(ValueError):
+            sur(x, fM_low=0, fM_ref=0, t_window=(-500., -1000.))
+        with self.assertRaises(ValueError):
+            sur(x, fM_low=0, fM_ref=0, t_window=(100., 200.))
+        with self.assertRaises(ValueError):
+            sur(x, fM_low=0, fM_ref=0, timesM=np.linspace(-1500, 40, 300),
+                t_window=t_window)
+
+    def test_multiband(self):
+        from gwsurrogate.new import multiband
+
+        sur = _make_aligned_surrogate()
+        x = [2.3, -0.1, 0.1]
+        t, h, _ = sur(x, fM_low=0, fM_ref=0, dtM=0.5)
+        t_mb, h_mb, dynamics = sur(x, fM_low=0, fM_ref=0, dtM=0.5,
+            multiband_opts={'dt_max': 8.})
+        self.assertLess(len(t_mb), len(t)/2)
+        self.assertIsNone(dynamics)
+
+        # evaluate_multiband gives the same waveform, and the bands
+        t_e, h_e, dynamics, edges = sur.evaluate_multiband(x, fM_low=0,
+            fM_ref=0, dtM=0.5, multiband_opts={'dt_max': 8.})
+        self.assertIsNone(dynamics)
+        np.testing.assert_array_equal(t_e, t_mb)
+        for mode in h_mb.keys():
+            np.testing.assert_array_equal(h_e[mode], h_mb[mode])
+
+        # Each band is uniformly sampled, the last one with dtM
+        self.assertGreater(len(edges), 2)
+        self.assertEqual(edges[-1], len(t_mb))
+        steps = []
+        for t_band in multiband.split_bands(edges, t_mb):
+            dt = np.diff(t_band)
+            np.testing.assert_allclose(dt, dt[0], rtol=1e-9)
+            steps.append(dt[0])
+        self.assertTrue(np.all(np.diff(steps) < 0))
+        self.assertAlmostEqual(steps[-1], 0.5)
+        self.assertLessEqual(steps[0], 8.)
+
+        # The bands are on the uniform grid, where the waveform is the same
+        idx = np.rint((t_mb - t[0])/0.5).astype(int)
+        np.testing.assert_allclose(t[idx], t_mb, rtol=0, atol=1e-9)
+        for mode in h.keys():
+            np.testing.assert_allclose(h_mb[mode], h[mode][idx], rtol=1e-9,
+                atol=1e-12)
+
+        with self.assertRaises(ValueError):
+            sur(x, fM_low=0, fM_ref=0, multiband_opts={})
+        with self.assertRaises(ValueError):
+            sur(x, fM_low=0, fM_ref=0, dtM=0.5, multiband_opts={'dt': 1})
+
+    def test_output_format(self):
+        sur = _make_aligned_surrogate()
+        x = [2.3, -0.1, 0.1]
+        times = np.linspace(-1500., 40., 200)
+        _, h, _ = sur(x, fM_low=0, fM_ref=0, timesM=times)
+        _, h_ap, dyn = sur(x, fM_low=0, fM_ref=0, timesM=times,
+            output_format='amp_phase')
+        self.assertIsNone(dyn)
+        _, h_coorb, dyn = sur(x, fM_low=0, fM_ref=0, timesM=times,
+            output_format='coorbital')
+        for mode in h.keys():
+            amp, phase = h_ap[mode]
+            np.testing.assert_allclose(amp*np.exp(1j*phase), h[mode],
+                rtol=1e-10, atol=1e-14)
+            np.testing.assert_allclose(h_coorb[mode]*np.exp(
+                -1j*mode[1]*dyn['orbphase']), h[mode], rtol=1e-10,
+                atol=1e-14)
+
+        with self.assertRaises(ValueError):
+            sur(x, fM_low=0, fM_ref=0, timesM=times, output_format='re_im')
+
+    def test_reconstruction_plan(self):
+        sur = _make_aligned_surrogate()
+        x = [2.3, -0.1, 0.1]
+        xs = np.array([x, [1.5, 0.3, -0.2]])
+        h_22, h_coorb = sur._eval_coorb_modes(x, sur.mode_list)
+        h_22_batch, h_coorb_batch = sur._eval_coorb_batch(xs, sur.mode_list)
+        self.assertIsNotNone(sur._reconstruction_plan)
+
+        # Compare with evaluating each data piece separately
+        T3_phase = sur._TaylorT3_phase_22(xs)
+        for key in ['amp', 'phase']:
+            expected = sur._eval_sur_batch(xs, (2, 2))[0][key]
+            if key == 'phase':
+                expected += T3_phase
+            np.testing.assert_allclose(h_22_batch[0][key], expected,
+                                       rtol=1e-13, atol=1e-15)
+            np.testing.assert_allclose(h_22[0][key], expected[0],
+                                       rtol=1e-13, atol=1e-15)
+        for mode in [(2, 1), (3, 3)]:
+            for key in ['re', 'im']:
+                expected = sur._eval_sur(x, mode)[0][key]
+                np.testing.assert_allclose(h_coorb[mode][0][key], expected,
+                                           rtol=1e-13, atol=1e-15)
+                np.testing.assert_allclose(h_coorb_batch[mode][0][key][0],
+                                           expected, rtol=1e-13, atol=1e-15)
+
+    def test_reconstruction_plan_padding(self):
+        # Data pieces with different numbers of nodes share padded blocks
+        domain = np.linspace(0, 1, 50)
+        pieces = []
+        for n_nodes in [4, 3, 1]:
+            ei = np.random.random((n_nodes, len(domain)))
+            nf = [nodeFunction.NodeFunction('node_%d'%i,
+                    nodeFunction.Polyfit1D('polyval_1d', np.random.random(3)))
+                  for i in range(n_nodes)]
+            pieces.append((n_nodes,
+                surrogate._SingleFunctionSurrogate_NoChecks('f', ei, nf)))
+        xs = np.array([[0.2], [0.7]])
+        expected = {k: sur.evaluate_batch(xs) for k, sur in pieces}
+
+        plan = surrogate._ReconstructionPlan(pieces)
+        self.assertEqual([sorted(b[0]) for b in plan.blocks], [[0, 1], [2]])
+        res = plan.evaluate_batch(xs)
+        for k, sur in pieces:
+            self.assertEqual(sur.ei_basis.shape, (k, len(domain)))
+            np.testing.assert_allclose(res[k], expected[k], rtol=1e-13)
+            np.testing.assert_allclose(sur.evaluate_batch(xs), expected[k],
+                                       rtol=1e-13)
+
+        # Only some pieces of a block, on part of the domain
+        res = plan.reconstruct(plan.evaluate_nodes(xs), keys=[3],
+                               columns=slice(10, 20))
+        self.assertEqual(list(res.keys()), [3])
+        np.testing.assert_allclose(res[3], expected[3][:, 10:20], rtol=1e-13)
+
+    def test_compiled_fits(self):
+        from gwsurrogate.new import fit_sidecar
+        sur = _make_aligned_surrogate()
+        sur.save(TEST_FILE)
+        sidecar = fit_sidecar.sidecar_filename(TEST_FILE)
+        self.addCleanup(lambda: os.path.isfile(sidecar) and os.remove(sidecar))
+        x = [2.3, -0.1, 0.1]
+        _, h, _ = sur(x, fM_low=0, fM_ref=0)
+
+        # The first load creates the sidecar file, the second one uses it
+        for i in range(2):
+            sur2 = surrogate.AlignedSpinCoOrbitalFrameSurrogate()
+            sur2.load(TEST_FILE, compiled_fits=True)
+            self.assertTrue(os.path.isfile(sidecar))
+            sub = sur2.sur_subs[(2, 1)].func_subs['re']
+            if i == 1:
+                self.assertIsNone(sub.node_functions)
+            self.assertIsInstance(sub._node_evaluator,
+                nodeFunction.CompiledNodeFits)
+            _, h2, _ = sur2(x, fM_low=0, fM_ref=0)
+            for mode in h:
+                np.testing.assert_allclose(h2[mode], h[mode], rtol=1e-13,
+                                           atol=1e-15)
+
+
+class SurrogateEvaluatorTester(BaseTest):
+
+    def test_map(self):
+        from gwsurrogate.surrogate import NRHybSur3dq8, SurrogateMapError
+
+        _make_aligned_surrogate().save(TEST_FILE)
+        sur = NRHybSur3dq8(TEST_FILE)
+
+        params = [(1.5, [0, 0, 0.3], [0, 0, -0.2]),
+                  {'q': 2.3, 'chiA0': [0, 0, -0.1], 'chiB0': [0, 0, 0.1]},
+                  (4., [0, 0, 0.5], [0, 0, 0.])]
+        for workers in [1, 2]:
+            res = sur.map(params, workers=workers, f_low=0)
+            self.assertEqual(len(res), len(params))
+            for p, (t, h, _) in zip(params, res):
+                if isinstance(p, dict):
+                    t_p, h_p, _ = sur(f_low=0, **p)
+                else:
+                    t_p, h_p, _ = sur(*p, f_low=0)
+                np.testing.assert_array_equal(t, t_p)
+                for mode in h_p.keys():
+                    np.testing.assert_array_equal(h[mode], h_p[mode])
+
+        # Mass ratio outside the allowed range
+        bad_params = params[:1] + [(20., [0, 0, 0], [0, 0, 0])]
+        with self.assertRaises(SurrogateMapError) as cm:
+            sur.map(bad_params, workers=2, f_low=0)
+        self.assertEqual(cm.exception.index, 1)
+        self.assertEqual(cm.exception.params, bad_params[1])
+
+        res = sur.map(bad_params, workers=2, f_low=0, on_error='return')
+        self.assertIsInstance(res[1], SurrogateMapError)
+        self.assertEqual(len(res[0]), 3)
+
+    def test_evaluate_batch_mode_sum(self):
+        from gwsurrogate.surrogate import NRHybSur3dq8
+
+        _make_aligned_surrogate().save(TEST_FILE)
+        sur = NRHybSur3dq8(TEST_FILE)
+        q = [1.5, 2.3]
+        chiA0 = [[0, 0, 0.3], [0, 0, -0.1]]
+        chiB0 = [0, 0, 0.1]
+        t, h, _ = sur.evaluate_batch(q, chiA0, chiB0, f_low=0,
+            inclination=0.4, phi_ref=0.2)
+        self.assertEqual(h.shape, (2, len(t)))
+        for i in range(2):
+            _, h_i, _ = sur(q[i], chiA0[i], chiB0, f_low=0,
+                inclination=0.4, phi_ref=0.2)
+            np.testing.assert_allclose(h[i], h_i, rtol=1e-12, atol=1e-14)
+
+    def test_multiple_orientations(self):
+        from gwsurrogate.surrogate import NRHybSur3dq8
+
+        _make_aligned_surrogate().save(TEST_FILE)
+        sur = NRHybSur3dq8(TEST_FILE)
+        x = (2.3, [0, 0, 0.3], [0, 0, -0.2])
+        inclination = np.array([0., 0.4, 1.2, np.pi])
+        phi_ref = np.array([0.3, 0., 2., 5.])
+        for phi in [0.7, phi_ref]:
+            t, h, _ = sur(*x, f_low=0, inclination=inclination, phi_ref=phi)
+            self.assertEqual(h.shape, (len(inclination), len(t)))
+            for i, inc in enumerate(inclination):
+                _, h_i, _ = sur(*x, f_low=0, inclination=inc,
+                                phi_ref=np.broadcast_to(phi, 4)[i])
+                np.testing.assert_allclose(h[i], h_i, rtol=1e-12, atol=1e-14)
+
+    def test_cache(self):
+        from gwsurrogate.surrogate import NRHybSur3dq8
+
+        _make_aligned_surrogate().save(TEST_FILE)
+        sur = NRHybSur3dq8(TEST_FILE)
+        x = (2.3, [0, 0, 0.3], [0, 0, -0.2])
+        opts = [{'f_low': 0},
+                {'f_low': 0, 'times': np.linspace(-1500, 40, 300)},
+                {'f_low': 0, 'inclination': 0.3},
+                {'f_low': 0, 'times': np.linspace(-1500, 40, 300),
+                 'mode_list': [(2, 2), (3, 3)]}]
+        expected = [sur(*x, **kw) for kw in opts]
+
+        # The cached interpolation operators agree with the spline
+        # interpolation up to round off
+        sur.enable_cache()
+        for _ in range(2):
+            for kw, (t_e, h_e, _) in zip(opts, expected):
+                t, h, _ = sur(*x, **kw)
+                np.testing.assert_array_equal(t, t_e)
+                if isinstance(h, dict):
+                    self.assertEqual(sorted(h.keys()), sorted(h_e.keys()))
+                    for mode in h.keys():
+                        np.testing.assert_allclose(h[mode], h_e[mode],
+                            rtol=1e-10, atol=1e-12)
+                        # Modifying the output should not affect the cache
+                        h[mode] *= 2
+                else:
+                    np.testing.assert_allclose(h, h_e, rtol=1e-10,
+                        atol=1e-12)
+
+        info = sur.cache_info()
+        self.assertEqual(info['sparse']['misses'], 1)
+        self.assertEqual(info['sparse']['hits'], 2)
+        self.assertEqual(info['dense']['misses'], 3)
+        self.assertEqual(info['dense']['hits'], 5)
+        self.assertGreater(info['dense']['nbytes'], 0)
+        # Both 'times' options use the same operator, for the (2,2) mode and
+        # for the other modes
+        self.assertEqual(info['interp']['entries'], 1)
+        self.assertEqual(info['interp']['misses'], 1)
+        self.assertEqual(info['interp']['hits'], 3)
+
+        sur.clear_cache()
+        info = sur.cache_info()
+        self.assertEqual(info['dense']['entries'], 0)
+        self.assertEqual(info['sparse']['nbytes'], 0)
+
+        sur.disable_cache()
+        self.assertEqual(sur.cache_info(), {})
+
+    def test_out_buffer(self):
+        from gwsurrogate.surrogate import NRHybSur3dq8
+
+        _make_aligned_surrogate().save(TEST_FILE)
+        sur = NRHybSur3dq8(TEST_FILE)
+        x = (2.3, [0, 0, 0.3], [0, 0, -0.2])
+        kw = {'f_low': 0, 'times': np.linspace(-1500, 40, 300),
+              'taper_end_duration': 20}
+
+        # Write into a segment of a zero padded buffer
+        t, h_e, _ = sur(*x, inclination=0.4, **kw)
+        buf = np.zeros(500, dtype=complex)
+        _, h, _ = sur(*x, inclination=0.4, out=buf[100:400], **kw)
+        self.assertTrue(np.shares_memory(h, buf))
+        np.testing.assert_allclose(buf[100:400], h_e, rtol=1e-12, atol=1e-14)
+        self.assertTrue(np.all(buf[:100] == 0) and np.all(buf[400:] == 0))
+
+        # Modes are written into the rows of out
+        t, h_e, _ = sur(*x, **kw)
+        buf = np.zeros((len(h_e), 500), dtype=complex)
+        _, h, _ = sur(*x, out=buf[:, 100:400], **kw)
+        self.assertEqual(list(h.keys()), list(h_e.keys()))
+        for i, mode in enumerate(h.keys()):
+            self.assertTrue(np.shares_memory(h[mode], buf[i]))
+            np.testing.assert_array_equal(buf[i, 100:400], h_e[mode])
+
+        with self.assertRaises(ValueError):
+            sur(*x, inclination=0.4, out=np.zeros(299, dtype=complex), **kw)
+        with self.assertRaises(ValueError):
+            sur(*x, out=np.zeros((len(h_e), 300)), **kw)
+
+    def test_single_precision(self):
+        from gwsurrogate.surrogate import NRHybSur3dq8
+
+        _make_aligned_surrogate().save(TEST_FILE)
+        sur = NRHybSur3dq8(TEST_FILE)
+        sur_single = NRHybSur3dq8(TEST_FILE, precision='single')
+        sub = sur_single._sur_dimless.sur_subs[(2, 2)].func_subs
+        self.assertEqual(sub['amp'].ei_basis.dtype, np.float32)
+        self.assertEqual(sub['phase'].ei_basis.dtype, np.float64)
+
+        x = (2.3, [0, 0, 0.3], [0, 0, -0.2])
+        for kw in [{'f_low': 0}, {'f_low': 0, 'inclination': 0.4},
+                   {'f_low': 0, 'times': np.linspace(-1500, 40, 300)}]:
+            t, h, _ = sur(*x, **kw)
+            t_s, h_s, _ = sur_single(*x, **kw)
+            np.testing.assert_array_equal(t_s, t)
+            if not isinstance(h, dict):
+                h, h_s = {0: h}, {0: h_s}
+            for k in h.keys():
+                self.assertEqual(h_s[k].dtype, np.complex128)
+                err = np.linalg.norm(h_s[k] - h[k])/np.linalg.norm(h[k])
+                self.assertLess(err, 1e-5)
+
+        with self.assertRaises(ValueError):
+            NRHybSur3dq8(TEST_FILE, precision='half')
+
+    def test_profiling(self):
+        import json
+        from gwsurrogate.surrogate import NRHybSur3dq8
+
+        _make_aligned_surrogate().save(TEST_FILE)
+        sur = NRHybSur3dq8(TEST_FILE)
+        x = (2.3, [0, 0, 0.3], [0, 0, -0.2])
+        kw = {'f_low': 0, 'times': np.linspace(-1500, 40, 300),
+              'inclination': 0.4, 'taper_end_duration': 20}
+        self.assertEqual(sur.profile_info(), {})
+
+        _, h_e, _ = sur(*x, **kw)
+        with sur.profiling() as prof:
+            for _ in range(2):
+                _, h, _ = sur(*x, **kw)
+        np.testing.assert_array_equal(h, h_e)
+        self.assertEqual(sur.profile_info(), {})
+
+        info = prof.info()
+        for stage in ['total', 'param_checks', 'node_fits',
+                      'ei_reconstruction', 'TaylorT3', 'coorbital_to_inertial',
+                      'spline_upsampling', 'taper', 'mode_sum']:
+            self.assertIn(stage, info)
+            self.assertGreater(info[stage]['total'], 0)
+        self.assertEqual(info['total']['calls'], 2)
+        self.assertEqual(info['mode_sum']['calls'], 2)
+        self.assertEqual(json.loads(prof.to_json()), json.loads(
+            json.dumps(info)))
+
+        prof = sur.enable_profiling()
+        sur(*x, f_low=0)
+        self.assertEqual(sur.profile_info()['total']['calls'], 1)
+        self.assertNotIn('mode_sum', sur.profile_info())
+        # A profiled method calling another one is only counted once
+        prof.reset()
+        sur.evaluate_fd(*x, dt=1., f_low=0)
+        self.assertEqual(sur.profile_info()['total']['calls'], 1)
+        self.assertIn('fft', sur.profile_info())
+        prof.reset()
+        self.assertEqual(sur.profile_info(), {})
+        sur.disable_profiling()
+        sur(*x, f_low=0)
+        self.assertEqual(prof.info(), {})
+
+    def test_evaluate_fd(self):
+        from gwsurrogate.surrogate import NRHybSur3dq8
+        from gwsurrogate.new import fourier
+
+        _make_aligned_surrogate().save(TEST_FILE)
+        sur = NRHybSur3dq8(TEST_FILE)
+        x = (2.3, [0, 0, 0.3], [0, 0, -0.2])
+        dt = 2.
+        t, h, _ = sur(*x, f_low=0, dt=dt, inclination=0.4)
+        _, h_modes, _ = sur(*x, f_low=0, dt=dt)
+
+        def dft(h, f):
+            return dt*np.exp(-2j*np.pi*np.outer(f, t)).dot(h)
+
+        # Polarizations with a given df
+        n_fft = 2048
+        self.assertGreater(n_fft, len(t))
+        f, htilde, _ = sur.evaluate_fd(*x, f_low=0, dt=dt, df=1./(n_fft*dt),
+            inclination=0.4)
+        np.testing.assert_allclose(f, np.arange(n_fft//2 + 1)/(n_fft*dt))
+        for key, h_pol in [('plus', h.real), ('cross', -h.imag)]:
+            np.testing.assert_allclose(htilde[key][:50], dft(h_pol, f[:50]),
+                rtol=0, atol=1e-10*np.max(abs(htilde[key])))
+
+        # Modes, including the negative frequencies, with tapers
+        f, htilde, _ = sur.evaluate_fd(*x, f_low=0, dt=dt,
+            taper_start_duration=100., taper_end_duration=20.)
+        self.assertEqual(sorted(htilde.keys()), sorted(h_modes.keys()))
+        self.assertEqual(len(f), fourier.fft_length(len(t)))
+        self.assertTrue(np.all(np.diff(f) > 0))
+        window = fourier.planck_window(len(t), 50, 10)
+        for mode, h_mode in h_modes.items():
+            np.testing.assert_allclose(htilde[mode][:20],
+                dft(h_mode*window, f[:20]), rtol=0,
+                atol=1e-10*np.max(abs(htilde[mode])))
+
+        # Resampling onto points of the oversampled FFT grid is exact
+        n_fft = fourier.fft_length(len(t), oversample=2)
+        freqs = np.arange(10, 30)/(n_fft*dt)
+        f, htilde, _ = sur.evaluate_fd(*x, f_low=0, dt=dt, freqs=freqs,
+            inclination=0.4)
+        np.testing.assert_array_equal(f, freqs)
+        np.testing.assert_allclose(htilde['plus'], dft(h.real, freqs),
+            rtol=1e-8, atol=1e-10*np.max(abs(htilde['plus'])))
+
+        with self.assertRaises(ValueError):
+            sur.evaluate_fd(*x, f_low=0, dt=dt, df=1./(100*dt))
+        with self.assertRaises(ValueError):
+            sur.evaluate_fd(*x, f_low=0, dt=dt, times=t)
+
+    def test_t_window(self):
+        from gwsurrogate.surrogate import NRHybSur3dq8
+
+        _make_aligned_surrogate().save(TEST_FILE)
+        sur = NRHybSur3dq8(TEST_FILE)
+        x = (2.3, [0, 0, 0.3], [0, 0, -0.2])
+        t, h, _ = sur(*x, f_low=0, dt=1.)
+        t_w, h_w, _ = sur(*x, f_low=0, dt=1., t_window=(-500., 10.))
+        in_window = (t >= -500.) & (t <= 10.)
+        np.testing.assert_allclose(t_w, t[in_window], rtol=0, atol=1e-9)
+
+        # Models without t_window support raise before evaluating
+        sur._sur_dimless.supports_t_window = False
+        with self.assertRaises(ValueError):
+            sur(*x, f_low=0, dt=1., t_window=(-500., 10.))
+
+    def test_evaluate_multiband(self):
+        from gwsurrogate.surrogate import NRHybSur3dq8
+
+        _make_aligned_surrogate().save(TEST_FILE)
+        sur = NRHybSur3dq8(TEST_FILE)
+        x = (2.3, [0, 0, 0.3], [0, 0, -0.2])
+        t, h, _ = sur(*x, f_low=0, dt=0.5, multiband_opts={'dt_max': 8.})
+        bands, h_bands, dynamics = sur.evaluate_multiband(*x, f_low=0,
+            dt=0.5, dt_max=8.)
+        self.assertIsNone(dynamics)
+        self.assertGreater(len(bands), 1)
+        np.testing.assert_array_equal(np.concatenate(bands), t)
+        for t_band, h_band in zip(bands, h_bands):
+            dt = np.diff(t_band)
+            np.testing.assert_allclose(dt, dt[0], rtol=1e-9)
+            for mode in h.keys():
+                self.assertEqual(len(h_band[mode]), len(t_band))
+        for mode in h.keys():
+            np.testing.assert_array_equal(np.concatenate([h_band[mode]
+                for h_band in h_bands]), h[mode])
+
+        # Models without multiband support raise before evaluating
+        sur._sur_dimless.supports_multiband = False
+        with self.assertRaises(ValueError):
+            sur.evaluate_multiband(*x, f_low=0, dt=0.5)
+
+    def test_evaluate_heterodyned(self):
+        from gwsurrogate.surrogate import NRHybSur3dq8
+
+        _make_aligned_surrogate().save(TEST_FILE)
+        sur = NRHybSur3dq8(TEST_FILE)
+        x = (2.3, [0, 0, 0.3], [0, 0, -0.2])
+        times = np.linspace(-1500., 40., 150)
+        _, h, _ = sur(*x, f_low=0, times=times)
+        t, h_ap, orbphase = sur.evaluate_heterodyned(*x, f_low=0,
+            times=times)
+        np.testing.assert_array_equal(t, times)
+        self.assertIsNone(orbphase)
+        _, h_coorb, orbphase = sur.evaluate_heterodyned(*x, f_low=0,
+            times=times, output_format='coorbital')
+        for mode, (amp, phase) in h_ap.items():
+            np.testing.assert_allclose(amp*np.exp(1j*phase), h[mode],
+                rtol=1e-10, atol=1e-14)
+            np.testing.assert_allclose(h_coorb[mode]*np.exp(
+                -1j*mode[1]*orbphase), h[mode], rtol=1e-10, atol=1e-14)
+
+        # Only the amplitude is rescaled in physical units
+        M, dist_mpc = 60., 100.
+        amp_scale, t_scale = sur._get_unit_scales('mks', M, dist_mpc)
+        _, h_mks, _ = sur.evaluate_heterodyned(*x, f_low=0,
+            times=times*t_scale, M=M, dist_mpc=dist_mpc, units='mks')
+        for mode, (amp, phase) in h_ap.items():
+            np.testing.assert_allclose(h_mks[mode][0], amp*amp_scale,
+                rtol=1e-10, atol=0)
+            np.testing.assert_allclose(h_mks[mode][1], phase, rtol=1e-10,
+                atol=1e-10)
+
+        with self.assertRaises(ValueError):
+            sur.evaluate_heterodyned(*x, f_low=0)
@@ -1,11 +1,54 @@
+/* The data needed to integrate the dynamics surrogate, see integrate_dynamics */
+typedef struct {
+    double *t;          // time nodes, length L
+    long L;
+    long *bf_orders;    // basis function orders of all fits, (n_coefs, 7)
+    double *coefs;      // coefficients of all fits, (n_coefs,)
+    long *offsets;      // fit k of node i is offsets[9*i+k]:offsets[9*i+k+1]
+    double q, normA, normB;
+    double q_fit_offset, q_fit_slope;
+    int q_max_bfOrder, chi_max_bfOrder;
+} dynamics_data;
+
 double ipow(double base, long exponent);
 static PyObject *eval_fit(PyObject *self, PyObject *args);
+static PyObject *eval_fits(PyObject *self, PyObject *args);
 static PyObject *normalize_y(PyObject *self, PyObject *args);
 static PyObject *get_ds_fit_x(PyObject *self, PyObject *args);
 static PyObject *assemble_dydt(PyObject *self, PyObject *args);
 static PyObject *ab4_dy(PyObject *self, PyObject *args);
+static PyObject *integrate_dynamics(PyObject *self, PyObject *args);
 static PyObject *binom(PyObject *self, PyObject *args);
 static PyObject *wigner_coef(PyObject *self, PyObject *args);
+static PyObject *wigner_d_elements(PyObject *self, PyObject *args);
+void _fit_powers(const double *x_data, double *x_powers, double q_fit_offset,
+        double q_fit_slope, int q_max_bfOrder, int chi_max_bfOrder);
+double _eval_fit_powers(const long *bf_order_data, const double *coef_data,
+        long n, const double *x_powers, int q_max_bfOrder,
+        int chi_max_bfOrder);
+void _normalize_y(const double *y_data, double normA, double normB,
+        double *res_data);
+void _get_ds_fit_x(const double *y_data, double q, double *x_data);
+void _assemble_dydt(const double *y_data, const double *ooxy_data,
+        double omega, const double *cAdot_data, const double *cBdot_data,
+        double *dydt_data);
+void _ab4_dy(const double *k1_data, const double *k2_data,
+        const double *k3_data, const double *k4_data, double dt1, double dt2,
+        double dt3, double dt4, double *res_data);
+void _get_fit_params(double *x);
+void _ds_time_deriv_from_index(const dynamics_data *d, long i0,
+        const double *y, double *dydt);
+double _natural_cspline4(const double *x, const double *y, double xi);
+int _ds_time_deriv(const dynamics_data *d, double t, const double *y,
+        double *dydt);
+double _ds_dt(const dynamics_data *d, long i);
+int _ds_one_RK4_step(const dynamics_data *d, double *y_of_t, long i0,
+        int direction, double *k1);
+void _ds_initial_RK4(const dynamics_data *d, double *y_of_t,
+        double k_ab4[3][11], double *dt_ab4);
+void _ds_integrate_AB4(const dynamics_data *d, double *y_of_t, long i0,
+        int direction, double k_ab4[3][11], const double *dt_ab4);
+int _ds_integrate(const dynamics_data *d, double *y_of_t, long i0);
 double factorial(int n);
 double factorial_ratio(int n, int k);
 double _binomial(int n, int k);
@@ -40,12 +40,15 @@ static struct module_state _state;
 /* ==== Setup the python methods table === */
 static PyMethodDef _utils_methods[] = {
     {"eval_fit", eval_fit, METH_VARARGS},
+    {"eval_fits", eval_fits, METH_VARARGS},
     {"normalize_y", normalize_y, METH_VARARGS},
     {"get_ds_fit_x", get_ds_fit_x, METH_VARARGS},
     {"assemble_dydt", assemble_dydt, METH_VARARGS},
     {"ab4_dy", ab4_dy, METH_VARARGS},
+    {"integrate_dynamics", integrate_dynamics, METH_VARARGS},
     {"binom", binom, METH_VARARGS},
     {"wigner_coef", wigner_coef, METH_VARARGS},
+    {"wigner_d_elements", wigner_d_elements, METH_VARARGS},
     {NULL, NULL} /* Marks the end of this structure */
 };
 
@@ -143,9 +146,9 @@ double ipow(double base, long exponent) {
 static PyObject *eval_fit(PyObject *self, PyObject *args) {
 
     PyArrayObject *bf_orders, *coefs, *x;
-    int i, j, n;
-    long *bf_order_data, *orders;
-    double res, prod, *coef_data, *x_data, q_fit_offset, q_fit_slope;
+    long n;
+    long *bf_order_data;
+    double res, *coef_data, *x_data, q_fit_offset, q_fit_slope;
     int q_max_bfOrder, chi_max_bfOrder;
 
     // Parse tuples
@@ -167,21 +170,182 @@ static PyObject *eval_fit(PyObject *self, PyObject *args) {
     coef_data = (double *) PyArray_DATA(coefs);
     x_data = (double *) PyArray_DATA(x);
     n = PyArray_DIMS(coefs)[0];
-    res = 0.0;
 
-    // Compute all needed powers
+    _fit_powers(x_data, x_powers, q_fit_offset, q_fit_slope, q_max_bfOrder,
+            chi_max_bfOrder);
+    res = _eval_fit_powers(bf_order_data, coef_data, n, x_powers,
+            q_max_bfOrder, chi_max_bfOrder);
+
+    return Py_BuildValue("d", res);
+}
+
+/*
+ * Checks that arr is an aligned C-contiguous numpy array with the given type
+ * and number of dimensions, so that its data can be read through a plain C
+ * pointer. Otherwise sets a ValueError and returns 0.
+ */
+static int _check_array(PyArrayObject *arr, int type, int ndim,
+        const char *name, const char *type_name) {
+    if (PyArray_TYPE(arr) != type || !PyArray_ISCARRAY_RO(arr)
+            || PyArray_NDIM(arr) != ndim) {
+        PyErr_Format(PyExc_ValueError,
+                "%s should be a C-contiguous %dd %s array.", name, ndim,
+                type_name);
+        return 0;
+    }
+    return 1;
+}
+
+/*
+ * Checks the packed fits bf_orders, coefs and offsets of eval_fits and
+ * integrate_dynamics: the types and shapes of the arrays, and that the
+ * offsets are nondecreasing and within coefs. Otherwise sets a ValueError
+ * and returns 0.
+ */
+static int _check_packed_fits(PyArrayObject *bf_orders, PyArrayObject *coefs,
+        PyArrayObject *offsets) {
+    long k, n_offsets, *offset_data;
+
+    if (!_check_array(bf_orders, NPY_LONG, 2, "bf_orders", "integer")
+            || !_check_array(coefs, NPY_DOUBLE, 1, "coefs", "float")
+            || !_check_array(offsets, NPY_LONG, 1, "offsets", "integer")) {
+        return 0;
+    }
+    if (PyArray_DIMS(bf_orders)[0] != PyArray_DIMS(coefs)[0]
+            || PyArray_DIMS(bf_orders)[1] != 7) {
+        PyErr_SetString(PyExc_ValueError,
+                "bf_orders should have shape (len(coefs), 7).");
+        return 0;
+    }
+    n_offsets = PyArray_DIMS(offsets)[0];
+    offset_data = (long *) PyArray_DATA(offsets);
+    for (k=0; k<n_offsets; k++) {
+        if (offset_data[k] < 0 || offset_data[k] > PyArray_DIMS(coefs)[0]
+                || (k > 0 && offset_data[k] < offset_data[k-1])) {
+            PyErr_SetString(PyExc_ValueError,
+                    "offsets should be nondecreasing indices of coefs.");
+            return 0;
+        }
+    }
+    return 1;
+}
+
+/*
+ * This function evaluates many parametric fits with a single call.
+ * Arguments (with python data types):
+ *      bf_orders:  A 2d integer numpy array with shape (n_coefs, 7), with
+ *                  the basis function orders of all fits.
+ *      coefs:      A 1d float numpy array with length n_coefs, with the
+ *                  coefficients of all fits.
+ *      offsets:    A 1d integer numpy array with length n_fits+1. Fit k uses
+ *                  the rows offsets[k]:offsets[k+1] of bf_orders and coefs.
+ *      x:          A float numpy array with the parameters at which the fits
+ *                  should be evaluated, either with length 7 for all fits,
+ *                  or with shape (n_fits, 7) with one row per fit.
+ *      q_fit_offset, q_fit_slope, q_max_bfOrder, chi_max_bfOrder:
+ *                  Same as for eval_fit.
+ *
+ * The powers of x are computed only once if x has length 7.
+ * Returns a 1d float numpy array with length n_fits, giving the same results
+ * as eval_fit for each fit.
+ */
+static PyObject *eval_fits(PyObject *self, PyObject *args) {
+
+    PyArrayObject *bf_orders, *coefs, *offsets, *x, *res;
+    long k, n_fits, *bf_order_data, *offset_data;
+    double *coef_data, *x_data, *res_data, q_fit_offset, q_fit_slope;
+    int q_max_bfOrder, chi_max_bfOrder, x_per_fit;
+    npy_intp dims[1];
+
+    // Parse tuples
+    if (!PyArg_ParseTuple(args, "O!O!O!O!ddii",
+            &PyArray_Type, &bf_orders,
+            &PyArray_Type, &coefs,
+            &PyArray_Type, &offsets,
+            &PyArray_Type, &x,
+            &q_fit_offset,
+            &q_fit_slope,
+            &q_max_bfOrder,
+            &chi_max_bfOrder)) return NULL;
+
+    if (!_check_packed_fits(bf_orders, coefs, offsets)
+            || !_check_array(x, NPY_DOUBLE, PyArray_NDIM(x), "x", "float")) {
+        return NULL;
+    }
+    n_fits = PyArray_DIMS(offsets)[0] - 1;
+    if (n_fits < 0) {
+        PyErr_SetString(PyExc_ValueError, "offsets should not be empty.");
+        return NULL;
+    }
+    x_per_fit = (PyArray_NDIM(x) == 2);
+    if ((x_per_fit && (PyArray_DIMS(x)[0] != n_fits
+                || PyArray_DIMS(x)[1] != 7))
+            || (!x_per_fit && PyArray_SIZE(x) != 7)) {
+        PyErr_SetString(PyExc_ValueError,
+                "x should have length 7 or shape (len(offsets)-1, 7).");
+        return NULL;
+    }
+
+    double x_powers[q_max_bfOrder+1 + 6*(chi_max_bfOrder+1)];
+
+    // Initialize output array
+    dims[0] = n_fits;
+    res = (PyArrayObject *) PyArray_SimpleNew(1, dims, NPY_DOUBLE);
+    res_data = (double *) PyArray_DATA(res);
+
+    // Point to numpy array data
+    bf_order_data = (long *) PyArray_DATA(bf_orders);
+    coef_data = (double *) PyArray_DATA(coefs);
+    offset_data = (long *) PyArray_DATA(offsets);
+    x_data = (double *) PyArray_DATA(x);
+
+    if (!x_per_fit) {
+        _fit_powers(x_data, x_powers, q_fit_offset, q_fit_slope,
+                q_max_bfOrder, chi_max_bfOrder);
+    }
+    for (k=0; k<n_fits; k++) {
+        if (x_per_fit) {
+            _fit_powers(x_data + 7*k, x_powers, q_fit_offset, q_fit_slope,
+                    q_max_bfOrder, chi_max_bfOrder);
+        }
+        res_data[k] = _eval_fit_powers(bf_order_data + 7*offset_data[k],
+                coef_data + offset_data[k], offset_data[k+1] - offset_data[k],
+                x_powers, q_max_bfOrder, chi_max_bfOrder);
+    }
+
+    return PyArray_Return(res);
+}
+
+/*
+ * Computes all powers of the fit parameters x (length 7) needed by the basis
+ * functions, see eval_fit. x_powers should have length
+ * q_max_bfOrder+1 + 6*(chi_max_bfOrder+1).
+ */
+void _fit_powers(const double *x_data, double *x_powers, double q_fit_offset,
+        double q_fit_slope, int q_max_bfOrder, int chi_max_bfOrder) {
+    int i, j, base_idx;
     for (i=0; i <= q_max_bfOrder; i++){        // power of q parameter
         x_powers[i] = ipow(q_fit_offset + q_fit_slope*x_data[0], i);
     }
-    int base_idx;
     for (i=0; i <= chi_max_bfOrder; i++){      // power of chi parameters
         for (j=1; j<7; j++){
             base_idx = q_max_bfOrder+1 + (chi_max_bfOrder+1)*(j-1);
             x_powers[base_idx + i] = ipow(x_data[j], i);
         }
     }
+}
 
-    // Sum up result
+/*
+ * Evaluates a fit with n coefficients from the powers computed by
+ * _fit_powers, see eval_fit.
+ */
+double _eval_fit_powers(const long *bf_order_data, const double *coef_data,
+        long n, const double *x_powers, int q_max_bfOrder,
+        int chi_max_bfOrder) {
+    long i;
+    int j, base_idx;
+    const long *orders;
+    double prod, res = 0.0;
     for (i=0; i<n; i++) {
         orders = bf_order_data + i*7;   // shift address of pointer
         prod = x_powers[orders[0]];
@@ -191,8 +355,7 @@ static PyObject *eval_fit(PyObject *self, PyObject *args) {
         }
         res += coef_data[i]*prod;
     }
-
-    return Py_BuildValue("d", res);
+    return res;
 }
 
 
@@ -212,8 +375,7 @@ static PyObject *eval_fit(PyObject *self, PyObject *args) {
 static PyObject *normalize_y(PyObject *self, PyObject *args) {
 
     PyArrayObject *y, *res;
-    int i;
-    double *y_data, *res_data, normA, normB, nA, nB, quatNorm, sum;
+    double *y_data, *res_data, normA, normB;
     npy_intp dims[1];
 
     // Parse tuples
@@ -228,6 +390,19 @@ static PyObject *normalize_y(PyObject *self, PyObject *args) {
     res_data = (double *) PyArray_DATA(res);
 
     y_data = (double *) PyArray_DATA(y);
+    _normalize_y(y_data, normA, normB, res_data);
+
+    return PyArray_Return(res);
+}
+
+/*
+ * Writes the normalized version of y to res, see normalize_y. res may be the
+ * same as y.
+ */
+void _normalize_y(const double *y_data, double normA, double normB,
+        double *res_data) {
+    int i;
+    double nA, nB, quatNorm, sum;
 
     // Compute current norms
     sum = 0.0;
@@ -257,8 +432,6 @@ static PyObject *normalize_y(PyObject *self, PyObject *args) {
     for (i=8; i<11; i++) {
         res_data[i] = y_data[i] * normB / nB;
     }
-
-    return PyArray_Return(res);
 }
 
 /*
@@ -278,16 +451,24 @@ static PyObject *normalize_y(PyObject *self, PyObject *args) {
 static PyObject *get_ds_fit_x(PyObject *self, PyObject *args) {
 
     PyArrayObject *y, *x;
-    double *y_data, *x_data, q, sp, cp;
+    double q;
     npy_intp dims[1];
 
     // Parse tuples
     if (!PyArg_ParseTuple(args, "O!d", &PyArray_Type, &y, &q)) return NULL;
 
-    y_data = (double *) PyArray_DATA(y);
     dims[0] = 7;
     x = (PyArrayObject *) PyArray_SimpleNew(1, dims, NPY_DOUBLE);
-    x_data = (double *) PyArray_DATA(x);
+    _get_ds_fit_x((double *) PyArray_DATA(y), q, (double *) PyArray_DATA(x));
+
+    return PyArray_Return(x);
+}
+
+/*
+ * Writes the fit input for y to x_data (length 7), see get_ds_fit_x.
+ */
+void _get_ds_fit_x(const double *y_data, double q, double *x_data) {
+    double sp, cp;
 
     // q
     x_data[0] = q;
@@ -303,8 +484,6 @@ static PyObject *get_ds_fit_x(PyObject *self, PyObject *args) {
     x_data[4] = y_data[8]*cp + y_data[9]*sp;
     x_data[5] = -1*y_data[8]*sp + y_data[9]*cp;
     x_data[6] = y_data[10];
-
-    return PyArray_Return(x);
 }
 
 /*
@@ -328,8 +507,7 @@ static PyObject *get_ds_fit_x(PyObject *self, PyObject *args) {
 static PyObject *assemble_dydt(PyObject *self, PyObject *args) {
 
     PyArrayObject *y, *ooxy, *cAdot, *cBdot, *dydt;
-    double *y_data, *ooxy_data, *cAdot_data, *cBdot_data, *dydt_data;
-    double omega, sp, cp, ooxy_x, ooxy_y;
+    double omega;
     npy_intp dims[1];
 
     // Parse tuples
@@ -344,12 +522,21 @@ static PyObject *assemble_dydt(PyObject *self, PyObject *args) {
     dims[0] = 11;
     dydt = (PyArrayObject *) PyArray_SimpleNew(1, dims, NPY_DOUBLE);
 
-    // Point to numpy array data
-    y_data = (double *) PyArray_DATA(y);
-    ooxy_data = (double *) PyArray_DATA(ooxy);
-    cAdot_data = (double *) PyArray_DATA(cAdot);
-    cBdot_data = (double *) PyArray_DATA(cBdot);
-    dydt_data = (double *) PyArray_DATA(dydt);
+    _assemble_dydt((double *) PyArray_DATA(y), (double *) PyArray_DATA(ooxy),
+            omega, (double *) PyArray_DATA(cAdot),
+            (double *) PyArray_DATA(cBdot), (double *) PyArray_DATA(dydt));
+
+    return PyArray_Return(dydt);
+}
+
+/*
+ * Writes the time derivative of y to dydt_data (length 11), see
+ * assemble_dydt.
+ */
+void _assemble_dydt(const double *y_data, const double *ooxy_data,
+        double omega, const double *cAdot_data, const double *cBdot_data,
+        double *dydt_data) {
+    double sp, cp, ooxy_x, ooxy_y;
 
     // Quaternion derivative
     // Omega = 2 * quat^{-1} * dqdt -> dqdt = 0.5 * quat * ooxy_quat where
@@ -373,8 +560,6 @@ static PyObject *assemble_dydt(PyObject *self, PyObject *args) {
     dydt_data[8] = cBdot_data[0]*cp - cBdot_data[1]*sp;
     dydt_data[9] = cBdot_data[0]*sp + cBdot_data[1]*cp;
     dydt_data[10] = cBdot_data[2];
-
-    return PyArray_Return(dydt);
 }
 
 /*
@@ -384,10 +569,7 @@ static PyObject *assemble_dydt(PyObject *self, PyObject *args) {
 static PyObject *ab4_dy(PyObject *self, PyObject *args) {
 
     PyArrayObject *k1, *k2, *k3, *k4, *res;
-    double *k1_data, *k2_data, *k3_data, *k4_data, *res_data;
-    double dt1, dt2, dt3, dt4, dt12, dt123, dt23, D1, D2, D3,
-            A, B, C, D, B41, B42, B43, B4, C41, C42, C43, C4;
-    int i;
+    double dt1, dt2, dt3, dt4;
     npy_intp dims[1];
 
     // Parse tuples
@@ -402,12 +584,22 @@ static PyObject *ab4_dy(PyObject *self, PyObject *args) {
     dims[0] = 11;
     res = (PyArrayObject *) PyArray_SimpleNew(1, dims, NPY_DOUBLE);
 
-    // Point to numpy array data
-    k1_data = (double *) PyArray_DATA(k1);
-    k2_data = (double *) PyArray_DATA(k2);
-    k3_data = (double *) PyArray_DATA(k3);
-    k4_data = (double *) PyArray_DATA(k4);
-    res_data = (double *) PyArray_DATA(res);
+    _ab4_dy((double *) PyArray_DATA(k1), (double *) PyArray_DATA(k2),
+            (double *) PyArray_DATA(k3), (double *) PyArray_DATA(k4),
+            dt1, dt2, dt3, dt4, (double *) PyArray_DATA(res));
+
+    return PyArray_Return(res);
+}
+
+/*
+ * Writes the AB4 update to res_data (length 11), see ab4_dy.
+ */
+void _ab4_dy(const double *k1_data, const double *k2_data,
+        const double *k3_data, const double *k4_data, double dt1, double dt2,
+        double dt3, double dt4, double *res_data) {
+    double dt12, dt123, dt23, D1, D2, D3,
+            A, B, C, D, B41, B42, B43, B4, C41, C42, C43, C4;
+    int i;
 
     // Various time intervals
     dt12 = dt1 + dt2;
@@ -437,9 +629,426 @@ static PyObject *ab4_dy(PyObject *self, PyObject *args) {
         D = (k4_data[i]-k1_data[i])/D1 - (k4_data[i]-k2_data[i])/D2 + (k4_data[i]-k3_data[i])/D3;
         res_data[i] = dt4 * (A + dt4 * (0.5*B + dt4*( C/3.0 + dt4*0.25*D)));
     }
+}
 
-    // Sum up contributions
-    return PyArray_Return(res);
+/*
+ * ==== Dynamics ODE integration ====
+ *
+ * The functions below do the full AB4 integration of the dynamics surrogate
+ * in a single call, following DynamicsSurrogate._integrate and the methods
+ * it calls in precessing_surrogate.py step by step, so that the results
+ * agree with the python integrator up to round off errors.
+ */
+
+/*
+ * Converts the fit input x in place from
+ * [q, chi1x, chi1y, chi1z, chi2x, chi2y, chi2z] to
+ * [log(q), chi1x, chi1y, chiHat, chi2x, chi2y, chi_a],
+ * same as _get_fit_params in precessing_surrogate.py.
+ */
+void _get_fit_params(double *x) {
+    double q, chi1z, chi2z, eta, chi_wtAvg, chiHat, chi_a;
+
+    q = x[0];
+    chi1z = x[3];
+    chi2z = x[6];
+    eta = q/pow(1.+q, 2);
+    chi_wtAvg = (q*chi1z+chi2z)/(1+q);
+    chiHat = (chi_wtAvg - 38.*eta/113.*(chi1z + chi2z))/(1. - 76.*eta/113.);
+    chi_a = (chi1z - chi2z)/2.;
+
+    x[0] = log(q);
+    x[3] = chiHat;
+    x[6] = chi_a;
+}
+
+/*
+ * Evaluates dydt at the time node i0, same as
+ * DynamicsSurrogate.get_time_deriv_from_index.
+ */
+void _ds_time_deriv_from_index(const dynamics_data *d, long i0,
+        const double *y, double *dydt) {
+    double x[7], vals[9];
+    double x_powers[d->q_max_bfOrder+1 + 6*(d->chi_max_bfOrder+1)];
+    long k, start, end;
+
+    _get_ds_fit_x(y, d->q, x);
+    _get_fit_params(x);
+    _fit_powers(x, x_powers, d->q_fit_offset, d->q_fit_slope,
+            d->q_max_bfOrder, d->chi_max_bfOrder);
+
+    // omega_orb_x, omega_orb_y, omega, chiA_dot (3), chiB_dot (3)
+    for (k=0; k<9; k++) {
+        start = d->offsets[9*i0 + k];
+        end = d->offsets[9*i0 + k + 1];
+        vals[k] = _eval_fit_powers(d->bf_orders + 7*start, d->coefs + start,
+                end - start, x_powers, d->q_max_bfOrder, d->chi_max_bfOrder);
+    }
+
+    _assemble_dydt(y, vals, vals[2], vals + 3, vals + 6, dydt);
+}
+
+/*
+ * Natural cubic spline through the 4 points (x, y), evaluated at xi. This
+ * does the same operations as gsl_interp_cspline, which is used by
+ * spline_interp_Cwrapper.
+ */
+double _natural_cspline4(const double *x, const double *y, double xi) {
+    double c[4], h0, h1, h2, g0, g1, gamma0, alpha0, alpha1, z1;
+    double h, dx, b, d;
+    int index, i, ilo, ihi;
+
+    // Second derivatives / 2 at the knots, with c[0] = c[3] = 0
+    h0 = x[1] - x[0];
+    h1 = x[2] - x[1];
+    h2 = x[3] - x[2];
+    g0 = 3.0 * ((y[2] - y[1]) * (1.0/h1) - (y[1] - y[0]) * (1.0/h0));
+    g1 = 3.0 * ((y[3] - y[2]) * (1.0/h2) - (y[2] - y[1]) * (1.0/h1));
+    alpha0 = 2.0 * (h1 + h0);
+    gamma0 = h1 / alpha0;
+    alpha1 = 2.0 * (h2 + h1) - h1 * gamma0;
+    z1 = g1 - gamma0 * g0;
+    c[0] = 0.0;
+    c[2] = z1 / alpha1;
+    c[1] = g0 / alpha0 - gamma0 * c[2];
+    c[3] = 0.0;
+
+    // Locate the interval by bisection
+    ilo = 0;
+    ihi = 3;
+    while (ihi > ilo + 1) {
+        i = (ihi + ilo)/2;
+        if (x[i] > xi) ihi = i;
+        else ilo = i;
+    }
+    index = ilo;
+
+    h = x[index+1] - x[index];
+    dx = xi - x[index];
+    b = ((y[index+1] - y[index]) / h) - h * (c[index+1] + 2.0 * c[index]) / 3.0;
+    d = (c[index+1] - c[index]) / (3.0 * h);
+    return y[index] + dx * (b + dx * (c[index] + dx * d));
+}
+
+/*
+ * Evaluates dydt at the time t by cubic interpolation of dydt at 4 nearby
+ * nodes, same as DynamicsSurrogate.get_time_deriv.
+ * Returns 0, or -1 with a python exception set.
+ */
+int _ds_time_deriv(const dynamics_data *d, double t, const double *y,
+        double *dydt) {
+    double dydts[4][11], vals[4];
+    long i, i0, imin;
+    int j;
+
+    if (t < d->t[0] || t > d->t[d->L-1]) {
+        PyErr_SetString(PyExc_Exception,
+                "Cannot extrapolate time derivative!");
+        return -1;
+    }
+
+    // Closest node
+    i0 = 0;
+    for (i=1; i<d->L; i++) {
+        if (fabs(d->t[i] - t) < fabs(d->t[i0] - t)) i0 = i;
+    }
+    if (t > d->t[i0]) {
+        imin = i0-1;
+    } else {
+        imin = i0-2;
+    }
+    if (imin < 0) imin = 0;
+    if (imin > d->L-4) imin = d->L-4;
+
+    for (i=0; i<4; i++) {
+        _ds_time_deriv_from_index(d, imin+i, y, dydts[i]);
+    }
+    for (j=0; j<11; j++) {
+        for (i=0; i<4; i++) {
+            vals[i] = dydts[i][j];
+        }
+        dydt[j] = _natural_cspline4(d->t + imin, vals, t);
+    }
+    return 0;
+}
+
+/*
+ * Time step between the y_of_t nodes i and i+1, which skips the half steps
+ * of the first 6 time nodes.
+ */
+double _ds_dt(const dynamics_data *d, long i) {
+    if (i < 3) return 2 * (d->t[2*i+1] - d->t[2*i]);
+    return d->t[i+4] - d->t[i+3];
+}
+
+/*
+ * One RK4 step from y_of_t node i0 to i0+direction, with direction 1 or -1,
+ * same as DynamicsSurrogate._one_forward_RK4_step and
+ * _one_backward_RK4_step. dydt at the start is written to k1.
+ * Returns 0, or -1 with a python exception set.
+ */
+int _ds_one_RK4_step(const dynamics_data *d, double *y_of_t, long i0,
+        int direction, double *k1) {
+    double k2[11], k3[11], k4[11], ytmp[11], t1, t2, half_dt;
+    double *y = y_of_t + 11*i0;
+    long i_t;
+    int j;
+
+    // i0 is on the y_of_t grid, which has 3 fewer samples than the t grid
+    i_t = i0 + 3;
+    if (i0 < 3) i_t = i0*2;
+
+    t1 = d->t[i_t];
+    if (direction > 0) {
+        t2 = d->t[i_t + 1];
+        if (i0 < 3) t2 = d->t[i_t + 2];
+    } else {
+        t2 = d->t[i_t - 1];
+        if (i0 <= 3) t2 = d->t[i_t - 2];
+    }
+    half_dt = 0.5*(t2 - t1);
+
+    if (_ds_time_deriv(d, t1, y, k1)) return -1;
+    for (j=0; j<11; j++) ytmp[j] = y[j] + half_dt*k1[j];
+    if (_ds_time_deriv(d, t1 + half_dt, ytmp, k2)) return -1;
+    for (j=0; j<11; j++) ytmp[j] = y[j] + half_dt*k2[j];
+    if (_ds_time_deriv(d, t1 + half_dt, ytmp, k3)) return -1;
+    for (j=0; j<11; j++) ytmp[j] = y[j] + 2*half_dt*k3[j];
+    if (_ds_time_deriv(d, t2, ytmp, k4)) return -1;
+    for (j=0; j<11; j++) {
+        ytmp[j] = y[j] + (half_dt/3.)*(k1[j] + 2*k2[j] + 2*k3[j] + k4[j]);
+    }
+    _normalize_y(ytmp, d->normA, d->normB, y_of_t + 11*(i0 + direction));
+    return 0;
+}
+
+/*
+ * Three RK4 steps from y_of_t node 0, same as DynamicsSurrogate._initial_RK4.
+ * Writes dydt at the y_of_t nodes 0, 1, 2 to k_ab4 and the time steps to
+ * dt_ab4.
+ */
+void _ds_initial_RK4(const dynamics_data *d, double *y_of_t,
+        double k_ab4[3][11], double *dt_ab4) {
+    double k2[11], k3[11], k4[11], ytmp[11], dt, *y, *k1;
+    int i, j;
+
+    for (i=0; i<3; i++) {
+        y = y_of_t + 11*i;
+        k1 = k_ab4[i];
+        dt = d->t[2*i+1] - d->t[2*i];
+        _ds_time_deriv_from_index(d, 2*i, y, k1);
+        dt_ab4[i] = 2*dt;
+        for (j=0; j<11; j++) ytmp[j] = y[j] + dt*k1[j];
+        _ds_time_deriv_from_index(d, 2*i+1, ytmp, k2);
+        for (j=0; j<11; j++) ytmp[j] = y[j] + dt*k2[j];
+        _ds_time_deriv_from_index(d, 2*i+1, ytmp, k3);
+        for (j=0; j<11; j++) ytmp[j] = y[j] + 2*dt*k3[j];
+        _ds_time_deriv_from_index(d, 2*i+2, ytmp, k4);
+        for (j=0; j<11; j++) {
+            ytmp[j] = y[j] + (dt/3.)*(k1[j] + 2*k2[j] + 2*k3[j] + k4[j]);
+        }
+        _normalize_y(ytmp, d->normA, d->normB, y_of_t + 11*(i+1));
+    }
+}
+
+/*
+ * AB4 integration forward from y_of_t node i0 (backward if direction is -1),
+ * same as DynamicsSurrogate._integrate_forward and _integrate_backward.
+ * k_ab4 and dt_ab4 are not modified.
+ */
+void _ds_integrate_AB4(const dynamics_data *d, double *y_of_t, long i0,
+        int direction, double k_ab4[3][11], const double *dt_ab4) {
+    double kbuf[4][11], *k[4], *tmp, dt[4], dy[11], ytmp[11];
+    long i_output, i_from, node_index;
+    int i, j;
+
+    for (i=0; i<3; i++) {
+        for (j=0; j<11; j++) kbuf[i][j] = k_ab4[i][j];
+        k[i] = kbuf[i];
+        dt[i] = dt_ab4[i];
+    }
+    k[3] = kbuf[3];
+
+    if (direction > 0) {
+        i_output = i0;
+    } else {
+        i_output = i0 - 1;
+    }
+    while (i_output >= 0 && i_output < d->L - 4) {
+        if (direction > 0) {
+            // Step from i_output to i_output+1
+            i_from = i_output;
+            node_index = i_output + 3;
+            dt[3] = d->t[i_output + 4] - d->t[i_output + 3];
+        } else {
+            // Step from i_output+1 to i_output
+            i_from = i_output + 1;
+            node_index = i_output + 4;
+            if (i_output < 2) node_index = 2 + 2*i_output;
+            dt[3] = _ds_dt(d, i_output);
+        }
+
+        _ds_time_deriv_from_index(d, node_index, y_of_t + 11*i_from, k[3]);
+        _ab4_dy(k[0], k[1], k[2], k[3], dt[0], dt[1], dt[2], dt[3], dy);
+        for (j=0; j<11; j++) {
+            if (direction > 0) {
+                ytmp[j] = y_of_t[11*i_from + j] + dy[j];
+            } else {
+                ytmp[j] = y_of_t[11*i_from + j] - dy[j];
+            }
+        }
+        _normalize_y(ytmp, d->normA, d->normB,
+                y_of_t + 11*(i_from + direction));
+
+        // Setup for next iteration
+        tmp = k[0];
+        k[0] = k[1];
+        k[1] = k[2];
+        k[2] = k[3];
+        k[3] = tmp;
+        dt[0] = dt[1];
+        dt[1] = dt[2];
+        dt[2] = dt[3];
+        i_output += direction;
+    }
+}
+
+/*
+ * Integrates the ODE from y_of_t node i0, forward and backward, same as
+ * DynamicsSurrogate._integrate.
+ * Returns 0, or -1 with a python exception set.
+ */
+int _ds_integrate(const dynamics_data *d, double *y_of_t, long i0) {
+    double k_ab4[3][11], dt_ab4[3], k_next[3][11], dt_next[3];
+    int i, j;
+
+    if (i0 == 0) {
+        _ds_initial_RK4(d, y_of_t, k_ab4, dt_ab4);
+        _ds_integrate_AB4(d, y_of_t, 3, 1, k_ab4, dt_ab4);
+        return 0;
+    }
+
+    if (i0 > 2) {
+        if (i0 - 3 > d->L - 7) {
+            PyErr_SetString(PyExc_Exception, "i0 must be <= len(self.t) - 7");
+            return -1;
+        }
+        // Initialize by taking 3 steps backwards with RK4
+        for (i=0; i<3; i++) {
+            if (_ds_one_RK4_step(d, y_of_t, i0-i, -1, k_ab4[i])) return -1;
+            dt_ab4[i] = _ds_dt(d, i0-1-i);
+        }
+        _ds_integrate_AB4(d, y_of_t, i0-3, -1, k_ab4, dt_ab4);
+        _ds_time_deriv_from_index(d, i0, y_of_t + 11*(i0-3), k_next[0]);
+    } else {
+        if (i0 > d->L - 7) {
+            PyErr_SetString(PyExc_Exception, "i0 must be <= len(self.t) - 7");
+            return -1;
+        }
+        // Initialize by taking 3 steps forwards with RK4
+        for (i=0; i<3; i++) {
+            if (_ds_one_RK4_step(d, y_of_t, i0+i, 1, k_ab4[i])) return -1;
+            dt_ab4[i] = _ds_dt(d, i0+i);
+        }
+        _ds_integrate_AB4(d, y_of_t, i0+3, 1, k_ab4, dt_ab4);
+        _ds_time_deriv_from_index(d, i0+3, y_of_t + 11*(i0+3), k_next[0]);
+    }
+
+    // Continue in the other direction
+    for (j=0; j<11; j++) {
+        k_next[1][j] = k_ab4[2][j];
+        k_next[2][j] = k_ab4[1][j];
+    }
+    for (i=0; i<3; i++) dt_next[i] = dt_ab4[2-i];
+    if (i0 > 2) {
+        _ds_integrate_AB4(d, y_of_t, i0, 1, k_next, dt_next);
+    } else {
+        _ds_integrate_AB4(d, y_of_t, i0, -1, k_next, dt_next);
+    }
+    return 0;
+}
+
+/*
+ * This function integrates the dynamics surrogate ODE over all time nodes,
+ * replacing the python loop in DynamicsSurrogate._integrate, which evaluates
+ * the fits with separate calls for each fit and each step.
+ * Arguments (with python data types):
+ *      t:          A 1d float numpy array with the L time nodes.
+ *      bf_orders:  A 2d integer numpy array with shape (n_coefs, 7), with
+ *                  the basis function orders of all fits of all nodes.
+ *      coefs:      A 1d float numpy array with length n_coefs, with the
+ *                  coefficients of all fits of all nodes.
+ *      offsets:    A 1d integer numpy array with length 9*L+1. Fit k of node
+ *                  i uses the rows offsets[9*i+k]:offsets[9*i+k+1] of
+ *                  bf_orders and coefs. The fits of each node are in the
+ *                  order omega_orb (2), omega, chiA (3), chiB (3).
+ *      y_of_t:     A C-contiguous 2d float numpy array with shape (L-3, 11),
+ *                  containing the initial data at the node i0. It is filled
+ *                  in place.
+ *      q:          A python float giving the mass ratio q.
+ *      normA:      A python float giving |chiA|
+ *      normB:      A python float giving |chiB|
+ *      i0:         The y_of_t node of the initial data.
+ *      q_fit_offset, q_fit_slope, q_max_bfOrder, chi_max_bfOrder:
+ *                  The fit settings, see eval_fit.
+ * Returns y_of_t.
+ */
+static PyObject *integrate_dynamics(PyObject *self, PyObject *args) {
+
+    PyArrayObject *t, *bf_orders, *coefs, *offsets, *y_of_t;
+    dynamics_data d;
+    long i0;
+
+    // Parse tuples
+    if (!PyArg_ParseTuple(args, "O!O!O!O!O!dddlddii",
+            &PyArray_Type, &t,
+            &PyArray_Type, &bf_orders,
+            &PyArray_Type, &coefs,
+            &PyArray_Type, &offsets,
+            &PyArray_Type, &y_of_t,
+            &d.q,
+            &d.normA,
+            &d.normB,
+            &i0,
+            &d.q_fit_offset,
+            &d.q_fit_slope,
+            &d.q_max_bfOrder,
+            &d.chi_max_bfOrder)) return NULL;
+
+    if (!_check_array(t, NPY_DOUBLE, 1, "t", "float")
+            || !_check_packed_fits(bf_orders, coefs, offsets)) {
+        return NULL;
+    }
+    d.L = PyArray_DIMS(t)[0];
+    if (d.L < 7 || PyArray_DIMS(offsets)[0] != 9*d.L + 1) {
+        PyErr_SetString(PyExc_ValueError,
+                "Expected at least 7 time nodes and 9*len(t)+1 offsets.");
+        return NULL;
+    }
+    if (PyArray_TYPE(y_of_t) != NPY_DOUBLE || !PyArray_ISCARRAY(y_of_t)
+            || PyArray_NDIM(y_of_t) != 2
+            || PyArray_DIMS(y_of_t)[0] != d.L - 3
+            || PyArray_DIMS(y_of_t)[1] != 11) {
+        PyErr_SetString(PyExc_ValueError,
+                "y_of_t should be a writeable C-contiguous float array with "
+                "shape (len(t)-3, 11).");
+        return NULL;
+    }
+    if (i0 < 0 || i0 > d.L - 4) {
+        PyErr_SetString(PyExc_ValueError, "i0 is out of range.");
+        return NULL;
+    }
+
+    // Point to numpy array data
+    d.t = (double *) PyArray_DATA(t);
+    d.bf_orders = (long *) PyArray_DATA(bf_orders);
+    d.coefs = (double *) PyArray_DATA(coefs);
+    d.offsets = (long *) PyArray_DATA(offsets);
+
+    if (_ds_integrate(&d, (double *) PyArray_DATA(y_of_t), i0)) return NULL;
+
+    Py_INCREF(y_of_t);
+    return (PyObject *) y_of_t;
 }
 
 double factorial(int n) {
@@ -487,3 +1096,176 @@ static PyObject *wigner_coef(PyObject *self, PyObject *args) {
     // Return result
     return Py_BuildValue("d", wc);
 }
+
+/*
+ * This function evaluates the Wigner-D matrix elements at times where ra and
+ * rb are both nonzero, see _wignerD_matrices in precessing_surrogate.py.
+ * Arguments (with python data types):
+ *      ra, rb:     1d complex numpy arrays with length n.
+ *      coefs:      A 1d float numpy array with the wigner_coef of each of the
+ *                  n_elements elements.
+ *      ra_idx, rb_idx, abs_idx:
+ *                  1d integer numpy arrays with length n_elements, the
+ *                  exponents of ra and rb plus 2*ellMax, and the exponent of
+ *                  abs(ra)**2 of each element.
+ *      rho_min, rho_max:
+ *                  1d integer numpy arrays with length n_elements, the range
+ *                  of nonzero polynomial coefficients of each element.
+ *      poly:       A 2d float numpy array with shape (n_elements, 2*ellMax+1),
+ *                  the coefficients of the polynomial in abs(rb/ra)**2 of
+ *                  each element.
+ *      ellMax:     The largest ell.
+ *      out:        A C-contiguous 2d complex numpy array with shape
+ *                  (n_elements, n), which is filled with the elements.
+ * The times are done in blocks of WIGNER_BLOCK. The powers of ra, rb,
+ * abs(ra)**2 and abs(rb/ra)**2 are computed once per time, and each element
+ * is then written for all times of the block.
+ * Returns None.
+ */
+#define WIGNER_BLOCK 64
+static PyObject *wigner_d_elements(PyObject *self, PyObject *args) {
+
+    PyArrayObject *ra, *rb, *coefs, *ra_idx, *rb_idx, *abs_idx, *rho_min,
+            *rho_max, *poly, *out;
+    long n, n_elements, i0, e, *ra_idx_data, *rb_idx_data, *abs_idx_data,
+            *rho_min_data, *rho_max_data;
+    double *ra_data, *rb_data, *coef_data, *poly_data, *out_data, *row;
+    double re, im, sqr, f_re, f_im, fac;
+    int ellMax, i, k, nb, n_pows, n_poly, a, b;
+
+    // Parse tuples
+    if (!PyArg_ParseTuple(args, "O!O!O!O!O!O!O!O!O!iO!",
+            &PyArray_Type, &ra,
+            &PyArray_Type, &rb,
+            &PyArray_Type, &coefs,
+            &PyArray_Type, &ra_idx,
+            &PyArray_Type, &rb_idx,
+            &PyArray_Type, &abs_idx,
+            &PyArray_Type, &rho_min,
+            &PyArray_Type, &rho_max,
+            &PyArray_Type, &poly,
+            &ellMax,
+            &PyArray_Type, &out)) return NULL;
+
+    n = PyArray_DIMS(ra)[0];
+    n_elements = PyArray_DIMS(coefs)[0];
+    if (PyArray_TYPE(out) != NPY_CDOUBLE || !PyArray_ISCARRAY(out)
+            || PyArray_NDIM(out) != 2 || PyArray_DIMS(out)[0] != n_elements
+            || PyArray_DIMS(out)[1] != n) {
+        PyErr_SetString(PyExc_ValueError,
+                "out should be a writeable C-contiguous complex array with "
+                "shape (len(coefs), len(ra)).");
+        return NULL;
+    }
+
+    n_pows = 4*ellMax + 1;
+    n_poly = 2*ellMax + 1;
+    // ra**k and rb**k for k=-2*ellMax..2*ellMax (index k+2*ellMax), and
+    // abs(ra)**(2*k), abs(rb/ra)**(2*k) for k=0..2*ellMax, for each time of
+    // the block
+    double ra_re[n_pows][WIGNER_BLOCK], ra_im[n_pows][WIGNER_BLOCK];
+    double rb_re[n_pows][WIGNER_BLOCK], rb_im[n_pows][WIGNER_BLOCK];
+    double abs_pows[n_poly][WIGNER_BLOCK], ratio_pows[n_poly][WIGNER_BLOCK];
+    double sum[WIGNER_BLOCK];
+
+    // Point to numpy array data
+    ra_data = (double *) PyArray_DATA(ra);
+    rb_data = (double *) PyArray_DATA(rb);
+    coef_data = (double *) PyArray_DATA(coefs);
+    ra_idx_data = (long *) PyArray_DATA(ra_idx);
+    rb_idx_data = (long *) PyArray_DATA(rb_idx);
+    abs_idx_data = (long *) PyArray_DATA(abs_idx);
+    rho_min_data = (long *) PyArray_DATA(rho_min);
+    rho_max_data = (long *) PyArray_DATA(rho_max);
+    poly_data = (double *) PyArray_DATA(poly);
+    out_data = (double *) PyArray_DATA(out);
+
+    for (i0=0; i0<n; i0+=WIGNER_BLOCK) {
+        nb = (n - i0 < WIGNER_BLOCK) ? n - i0 : WIGNER_BLOCK;
+
+        for (i=0; i<nb; i++) {
+            ra_re[n_poly-1][i] = 1.;
+            ra_im[n_poly-1][i] = 0.;
+            ra_re[n_poly][i] = ra_data[2*(i0+i)];
+            ra_im[n_poly][i] = ra_data[2*(i0+i)+1];
+            rb_re[n_poly-1][i] = 1.;
+            rb_im[n_poly-1][i] = 0.;
+            rb_re[n_poly][i] = rb_data[2*(i0+i)];
+            rb_im[n_poly][i] = rb_data[2*(i0+i)+1];
+
+            // The inverses
+            sqr = ra_re[n_poly][i]*ra_re[n_poly][i]
+                + ra_im[n_poly][i]*ra_im[n_poly][i];
+            abs_pows[0][i] = 1.;
+            abs_pows[1][i] = sqr;
+            ra_re[n_poly-2][i] = ra_re[n_poly][i]/sqr;
+            ra_im[n_poly-2][i] = -ra_im[n_poly][i]/sqr;
+            ratio_pows[0][i] = 1.;
+            ratio_pows[1][i] = (rb_re[n_poly][i]*rb_re[n_poly][i]
+                + rb_im[n_poly][i]*rb_im[n_poly][i])/sqr;
+            sqr = rb_re[n_poly][i]*rb_re[n_poly][i]
+                + rb_im[n_poly][i]*rb_im[n_poly][i];
+            rb_re[n_poly-2][i] = rb_re[n_poly][i]/sqr;
+            rb_im[n_poly-2][i] = -rb_im[n_poly][i]/sqr;
+        }
+
+        // Higher powers by repeated multiplication
+        for (k=2; k<n_poly; k++) {
+            a = n_poly-1 + k;       // ra**k, from ra**(k-1) * ra
+            b = n_poly-1 - k;       // ra**(-k), from ra**(1-k) * ra**(-1)
+            for (i=0; i<nb; i++) {
+                re = ra_re[a-1][i]*ra_re[n_poly][i]
+                    - ra_im[a-1][i]*ra_im[n_poly][i];
+                im = ra_re[a-1][i]*ra_im[n_poly][i]
+                    + ra_im[a-1][i]*ra_re[n_poly][i];
+                ra_re[a][i] = re;
+                ra_im[a][i] = im;
+                re = ra_re[b+1][i]*ra_re[n_poly-2][i]
+                    - ra_im[b+1][i]*ra_im[n_poly-2][i];
+                im = ra_re[b+1][i]*ra_im[n_poly-2][i]
+                    + ra_im[b+1][i]*ra_re[n_poly-2][i];
+                ra_re[b][i] = re;
+                ra_im[b][i] = im;
+
+                re = rb_re[a-1][i]*rb_re[n_poly][i]
+                    - rb_im[a-1][i]*rb_im[n_poly][i];
+                im = rb_re[a-1][i]*rb_im[n_poly][i]
+                    + rb_im[a-1][i]*rb_re[n_poly][i];
+                rb_re[a][i] = re;
+                rb_im[a][i] = im;
+                re = rb_re[b+1][i]*rb_re[n_poly-2][i]
+                    - rb_im[b+1][i]*rb_im[n_poly-2][i];
+                im = rb_re[b+1][i]*rb_im[n_poly-2][i]
+                    + rb_im[b+1][i]*rb_re[n_poly-2][i];
+                rb_re[b][i] = re;
+                rb_im[b][i] = im;
+
+                abs_pows[k][i] = abs_pows[k-1][i]*abs_pows[1][i];
+                ratio_pows[k][i] = ratio_pows[k-1][i]*ratio_pows[1][i];
+            }
+        }
+
+        for (e=0; e<n_elements; e++) {
+            a = ra_idx_data[e];
+            b = rb_idx_data[e];
+            row = poly_data + e*n_poly;
+
+            // The polynomial in abs(rb/ra)**2
+            for (i=0; i<nb; i++) sum[i] = 0.;
+            for (k=rho_min_data[e]; k<=rho_max_data[e]; k++) {
+                for (i=0; i<nb; i++) sum[i] += row[k]*ratio_pows[k][i];
+            }
+
+            // coef * ra**(m+mp) * rb**(m-mp) * abs(ra)**(2*(ell-m)) * sum
+            for (i=0; i<nb; i++) {
+                f_re = ra_re[a][i]*rb_re[b][i] - ra_im[a][i]*rb_im[b][i];
+                f_im = ra_re[a][i]*rb_im[b][i] + ra_im[a][i]*rb_re[b][i];
+                fac = coef_data[e]*abs_pows[abs_idx_data[e]][i]*sum[i];
+                out_data[2*(e*n + i0 + i)] = f_re*fac;
+                out_data[2*(e*n + i0 + i)+1] = f_im*fac;
+            }
+        }
+    }
+
+    Py_RETURN_NONE;
+}
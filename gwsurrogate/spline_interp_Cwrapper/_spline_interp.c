@@ -1,4 +1,5 @@
 #include <stdio.h>
+#include <stdlib.h>
 #include <gsl/gsl_spline.h>
 
 void spline_interp(long data_size, long out_size, \
@@ -20,3 +21,129 @@ void spline_interp(long data_size, long out_size, \
     gsl_spline_free(spline);
     gsl_interp_accel_free(acc);
 }
+
+/*
+ * Natural cubic spline interpolation of many columns sampled at the same
+ * knots data_x, like calling spline_interp for each column, but the
+ * tridiagonal system is factorized and the intervals of out_x are located
+ * only once for all columns.
+ *
+ * data_y[k] points to the first sample of column k, the samples of each
+ * column are y_step doubles apart. The result for column k is written to
+ * out_y[k], with samples out_step doubles apart. This allows e.g. the real
+ * and imaginary parts of complex arrays to be used without copies.
+ *
+ * Follows the gsl cspline algorithm (natural boundary conditions), so that
+ * the results agree with spline_interp. out_x should lie in
+ * [data_x[0], data_x[data_size-1]]. Returns 0 on success, 1 if memory
+ * could not be allocated and 2 if there are fewer than 3 knots, which gsl
+ * cspline does not allow either.
+ */
+int spline_interp_many(long data_size, long out_size, long n_cols, \
+        double *data_x, double **data_y, long y_step, \
+        double *out_x, double **out_y, long out_step) {
+
+    long n = data_size;
+    long sys_size = n - 2;
+    long ii, jj, kk;
+
+    if (n < 3) {
+        return 2;
+    }
+
+    double *h = malloc((n - 1)*sizeof(double));
+    double *alpha = malloc(n*sizeof(double));
+    double *gamma = malloc(n*sizeof(double));
+    double *c = malloc(n*sizeof(double));
+    double *b = malloc((n - 1)*sizeof(double));
+    double *d = malloc((n - 1)*sizeof(double));
+    // At least one element, as malloc(0) may return NULL
+    long *out_idx = malloc((out_size > 0 ? out_size : 1)*sizeof(long));
+    double *out_dx = malloc((out_size > 0 ? out_size : 1)*sizeof(double));
+    if (!h || !alpha || !gamma || !c || !b || !d || !out_idx || !out_dx) {
+        free(h); free(alpha); free(gamma); free(c); free(b); free(d);
+        free(out_idx); free(out_dx);
+        return 1;
+    }
+
+    for (ii=0; ii < n - 1; ii++) {
+        h[ii] = data_x[ii + 1] - data_x[ii];
+    }
+
+    // Factorize the symmetric tridiagonal system with
+    // diag[i] = 2*(h[i] + h[i+1]) and offdiag[i] = h[i+1], as in gsl
+    if (sys_size > 0) {
+        alpha[0] = 2.0*(h[1] + h[0]);
+        gamma[0] = h[1]/alpha[0];
+        for (ii=1; ii < sys_size - 1; ii++) {
+            alpha[ii] = 2.0*(h[ii + 1] + h[ii]) - h[ii]*gamma[ii - 1];
+            gamma[ii] = h[ii + 1]/alpha[ii];
+        }
+        if (sys_size > 1) {
+            alpha[sys_size - 1] = 2.0*(h[sys_size] + h[sys_size - 1]) \
+                - h[sys_size - 1]*gamma[sys_size - 2];
+        }
+    }
+
+    // Locate the interval of each output point, same as gsl_interp_accel
+    // for sorted out_x
+    jj = 0;
+    for (kk=0; kk < out_size; kk++) {
+        double x = out_x[kk];
+        if (x < data_x[jj] || (jj < n - 2 && x >= data_x[jj + 1])) {
+            long lo = 0;
+            long hi = n - 1;
+            while (hi > lo + 1) {
+                long mid = (hi + lo)/2;
+                if (data_x[mid] > x) {
+                    hi = mid;
+                } else {
+                    lo = mid;
+                }
+            }
+            jj = lo;
+        }
+        out_idx[kk] = jj;
+        out_dx[kk] = x - data_x[jj];
+    }
+
+    for (kk=0; kk < n_cols; kk++) {
+        double *y = data_y[kk];
+        double *out = out_y[kk];
+
+        // Solve for the quadratic coefficients c, with c = 0 at both ends
+        c[0] = 0.0;
+        c[n - 1] = 0.0;
+        for (ii=0; ii < sys_size; ii++) {
+            double g = 3.0*((y[(ii + 2)*y_step] - y[(ii + 1)*y_step])/h[ii + 1]
+                - (y[(ii + 1)*y_step] - y[ii*y_step])/h[ii]);
+            if (ii > 0) {
+                g -= gamma[ii - 1]*c[ii];
+            }
+            c[ii + 1] = g;
+        }
+        for (ii=0; ii < sys_size; ii++) {
+            c[ii + 1] /= alpha[ii];
+        }
+        for (ii=sys_size - 2; ii >= 0; ii--) {
+            c[ii + 1] -= gamma[ii]*c[ii + 2];
+        }
+
+        for (ii=0; ii < n - 1; ii++) {
+            double dy = y[(ii + 1)*y_step] - y[ii*y_step];
+            b[ii] = dy/h[ii] - h[ii]*(c[ii + 1] + 2.0*c[ii])/3.0;
+            d[ii] = (c[ii + 1] - c[ii])/(3.0*h[ii]);
+        }
+
+        for (ii=0; ii < out_size; ii++) {
+            long idx = out_idx[ii];
+            double dx = out_dx[ii];
+            out[ii*out_step] = y[idx*y_step] \
+                + dx*(b[idx] + dx*(c[idx] + dx*d[idx]));
+        }
+    }
+
+    free(h); free(alpha); free(gamma); free(c); free(b); free(d);
+    free(out_idx); free(out_dx);
+    return 0;
+}
@@ -1,5 +1,5 @@
 import ctypes
-from ctypes import c_double, c_long, POINTER, util
+from ctypes import c_double, c_long, c_int, c_void_p, POINTER, util
 import numpy as np
 import os
 from glob import glob
@@ -15,10 +15,16 @@ def _load_spline_interp(dll_path,function_name):
     dllCBLAS = ctypes.CDLL(cblas_path, mode=ctypes.RTLD_GLOBAL)
 
     dll = ctypes.CDLL(dll_path, mode=ctypes.RTLD_GLOBAL)
-    func = dll.spline_interp
-    func.argtypes = [c_long, c_long,
-        POINTER(c_double), POINTER(c_double),
-        POINTER(c_double), POINTER(c_double)]
+    func = getattr(dll, function_name)
+    if function_name == 'spline_interp_many':
+        func.argtypes = [c_long, c_long, c_long,
+            POINTER(c_double), c_void_p, c_long,
+            POINTER(c_double), c_void_p, c_long]
+        func.restype = c_int
+    else:
+        func.argtypes = [c_long, c_long,
+            POINTER(c_double), POINTER(c_double),
+            POINTER(c_double), POINTER(c_double)]
     return func
 
 dll_dir = os.path.dirname(os.path.realpath(__file__))
@@ -35,6 +41,7 @@ elif len(spline_libs) > 1:
 else:
   #c_interp = _load_spline_interp('%s/_spline_interp.so'%dll_dir, 'spline_interp')
   c_interp = _load_spline_interp(spline_libs[0], 'spline_interp')
+  c_interp_many = _load_spline_interp(spline_libs[0], 'spline_interp_many')
 
 def interpolate(xnew, x, y):
 
@@ -55,3 +62,90 @@ def interpolate(xnew, x, y):
     c_interp(x.shape[0],xnew.shape[0],x_p,y_p,xnew_p,ynew_p)
 
     return ynew
+
+
+def _column_pointers(arr):
+    """
+    Returns (pointers, step) for a 2d float64 array arr, where pointers is
+    an array with the address of the first element of each row and step is
+    the distance between the elements of a row in units of doubles.
+    """
+    itemsize = arr.itemsize
+    if arr.strides[1] % itemsize != 0 or arr.strides[0] % itemsize != 0:
+        raise ValueError('Array strides should be multiples of the item'
+            ' size.')
+    # Signed offsets, as the strides can be negative
+    pointers = arr.ctypes.data + arr.strides[0]*np.arange(arr.shape[0],
+        dtype=np.int64)
+    return pointers.astype(np.uint64), arr.strides[1]//itemsize
+
+
+def interpolate_many(xnew, x, y, out=None):
+    """
+    Interpolates each row of y, sampled at x, onto xnew with natural cubic
+    splines. Gives the same result as interpolate for each row, but the
+    spline system is set up and the samples xnew are located only once for
+    all rows, in a single call to the C library.
+
+    x: 1d array of strictly increasing knots, of length n_x >= 3.
+    xnew: 1d array of samples in [x[0], x[-1]], of length n_out. Sorted
+        samples are located fastest.
+    y: Array with shape (n_cols, n_x), real or complex. For complex y, the
+        real and imaginary parts are interpolated separately.
+    out: Optional array with shape (n_cols, n_out), float64 for real y and
+        complex128 for complex y, for the result. A new array is created if
+        not given.
+
+    Float64 and complex128 arrays are used in place, with any strides (for
+    example rows or transposes of larger arrays), and are not copied.
+
+    Returns out.
+    """
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    xnew = np.ascontiguousarray(xnew, dtype=np.float64)
+    if x.ndim != 1 or x.shape[0] < 3:
+        raise ValueError('x should be a 1d array with at least 3 knots.')
+    if not np.all(np.diff(x) > 0):
+        raise ValueError('x should be strictly increasing.')
+    if xnew.shape[0] > 0 and (xnew.min() < x[0] or xnew.max() > x[-1]):
+        raise Exception('Extrapolation not allowed')
+
+    y = np.asarray(y)
+    if y.ndim != 2 or y.shape[1] != x.shape[0]:
+        raise ValueError('y should have shape (n_cols, %d).'%x.shape[0])
+    is_complex = np.iscomplexobj(y)
+    dtype = np.complex128 if is_complex else np.float64
+    if y.dtype != dtype:
+        y = y.astype(dtype)
+
+    shape = (y.shape[0], xnew.shape[0])
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif not isinstance(out, np.ndarray) or out.dtype != dtype \
+            or out.shape != shape:
+        raise ValueError('out should be a %s array with shape %s.'%(
+            np.dtype(dtype).name, shape))
+
+    if is_complex:
+        y_parts = [y.real, y.imag]
+        out_parts = [out.real, out.imag]
+    else:
+        y_parts = [y]
+        out_parts = [out]
+
+    y_pointers, y_step = zip(*[_column_pointers(part) for part in y_parts])
+    out_pointers, out_step = zip(*[_column_pointers(part)
+        for part in out_parts])
+    y_pointers = np.concatenate(y_pointers)
+    out_pointers = np.concatenate(out_pointers)
+
+    status = c_interp_many(x.shape[0], xnew.shape[0], len(y_pointers),
+        x.ctypes.data_as(POINTER(c_double)), y_pointers.ctypes.data, y_step[0],
+        xnew.ctypes.data_as(POINTER(c_double)), out_pointers.ctypes.data,
+        out_step[0])
+    if status == 2:
+        raise ValueError('x should have at least 3 knots.')
+    if status != 0:
+        raise MemoryError('Could not allocate the spline work arrays.')
+    return out
+
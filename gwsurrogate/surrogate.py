@@ -44,8 +44,16 @@ from gwsurrogate.new.surrogate import ParamDim, ParamSpace
 
 import warnings
 import os
+import time
+import traceback
+import multiprocessing
 
 from .new import surrogate as new_surrogate
+from .new import cache as new_cache
+from .new import harmonics
+from .new import profiling as new_profiling
+from .new import fourier as new_fourier
+from .new import multiband as new_multiband
 from .new import precessing_surrogate
 from . import catalog
 
@@ -1338,6 +1346,85 @@ def CompareSingleModeSurrogate(sur1,sur2):
 
 
 
+def _check_out_buffer(out, shape):
+    """ Checks that out can be used to store a complex array of shape. """
+    if not isinstance(out, np.ndarray) or out.dtype != np.complex128:
+        raise ValueError('out should be a numpy array with dtype complex128.')
+    if out.shape != tuple(shape):
+        raise ValueError('out has shape %s, but the output has shape %s.'\
+            %(out.shape, tuple(shape)))
+
+
+class _ProfilingContext(object):
+    """ See SurrogateEvaluator.profiling """
+
+    def __init__(self, sur):
+        self.sur = sur
+
+    def __enter__(self):
+        self.was_enabled = self.sur._profiler is not None
+        return self.sur.enable_profiling()
+
+    def __exit__(self, *args):
+        if not self.was_enabled:
+            self.sur.disable_profiling()
+        return False
+
+
+##############################################
+class SurrogateMapError(Exception):
+    """
+    Raised by SurrogateEvaluator.map when the evaluation for one of the
+    parameters fails.
+
+    Attributes:
+        index:      Position of the failed parameters in param_iterable.
+        params:     The parameters for which the evaluation failed.
+        worker_traceback: The formatted traceback from the process that did
+                    the evaluation.
+    """
+
+    def __init__(self, message, index=None, params=None,
+            worker_traceback=None):
+        super(SurrogateMapError, self).__init__(message)
+        self.index = index
+        self.params = params
+        self.worker_traceback = worker_traceback
+
+
+# The surrogate evaluated by SurrogateEvaluator.map. With the 'fork' start
+# method this is set in the parent just before the pool is created, so the
+# workers inherit the loaded data copy-on-write without any pickling.
+_MAP_SURROGATE = None
+
+def _map_init_worker(surrogate_class, h5filename, load_opts):
+    """ Pool initializer. For start methods that do not share the parent's
+    memory, loads the surrogate once per worker process.
+    """
+    global _MAP_SURROGATE
+    if surrogate_class is not None:
+        _MAP_SURROGATE = surrogate_class(h5filename, **load_opts)
+
+def _map_eval(task):
+    """ Evaluates _MAP_SURROGATE for a single task of SurrogateEvaluator.map.
+    Exceptions are caught and returned as strings, as they need not be
+    picklable.
+    """
+    idx, params, kwargs = task
+    try:
+        if isinstance(params, dict):
+            call_kwargs = dict(kwargs)
+            call_kwargs.update(params)
+            res = _MAP_SURROGATE(**call_kwargs)
+        else:
+            res = _MAP_SURROGATE(*params, **kwargs)
+        return idx, True, res
+    except Exception as e:
+        return idx, False, ('%s: %s'%(type(e).__name__, e), \
+            traceback.format_exc())
+
+
+##############################################
 class SurrogateEvaluator(object):
     """
     Class to load and evaluate generic surrogate models.
@@ -1386,6 +1473,12 @@ class SurrogateEvaluator(object):
         self.soft_param_lims = soft_param_lims
         self.hard_param_lims = hard_param_lims
 
+        # Cache for the dimensionless output, see enable_cache
+        self._dense_cache = None
+
+        # StageProfiler for the evaluations, see enable_profiling
+        self._profiler = None
+
         print('Loaded %s model'%self.name)
 
 
@@ -1516,30 +1609,303 @@ class SurrogateEvaluator(object):
 
 
 
-    def _mode_sum(self, h_modes, theta, phi, fake_neg_modes=False):
+    def _check_inputs(self, M, dist_mpc, f_low, f_ref, dt, df, times, freqs,
+            mode_list, ellMax, units, taper_end_duration):
+        """ Sanity checks on the inputs of __call__ that do not depend on the
+            intrinsic parameters. See __call__ for a description of the
+            arguments.
+        """
+        if (M is None) ^ (dist_mpc is None):
+            raise ValueError("Either specify both M and dist_mpc, or "
+                    "neither")
+
+        if (M is not None) ^ (units == 'mks'):
+            raise ValueError("M/dist_mpc must be specified if and only if"
+                " units='mks'")
+
+        if (dt is not None) and (self._domain_type != 'Time'):
+            raise ValueError("%s is not a Time domain model, cannot "
+                    "specify dt"%self.name)
+
+        if (times is not None) and (self._domain_type != 'Time'):
+            raise ValueError("%s is not a Time domain model, cannot "
+                    "specify times"%self.name)
+
+        if (df is not None) and (self._domain_type != 'Frequency'):
+            raise ValueError("%s is not a Frequency domain model, cannot"
+                " specify df"%self.name)
+
+        if (freqs is not None) and (self._domain_type != 'Frequency'):
+            raise ValueError("%s is not a Frequency domain model, cannot"
+                " specify freqs"%self.name)
+
+        if (dt is not None) and (times is not None):
+            raise ValueError("Cannot specify both dt and times.")
+
+        if (df is not None) and (freqs is not None):
+            raise ValueError("Cannot specify both df and freqs.")
+
+        if (f_low is None):
+            raise ValueError("f_low must be specified.")
+
+        if (f_ref is not None) and (f_ref < f_low):
+            raise ValueError("f_ref cannot be lower than f_low.")
+
+        if (mode_list is not None) and (ellMax is not None):
+            raise ValueError("Cannot specify both mode_list and ellMax.")
+
+        if (mode_list is not None) and self.keywords['Precessing']:
+            raise ValueError("mode_list is not allowed for precessing "
+                    "models, use ellMax instead.")
+
+        if (taper_end_duration is not None) and self._domain_type !='Time':
+            raise ValueError("%s is not a Time domain model, cannot taper")
+
+
+    def _get_unit_scales(self, units, M, dist_mpc):
+        """ Returns amp_scale, t_scale, the scalings from dimensionless units
+            to the requested units.
+        """
+        if units == 'dimensionless':
+            amp_scale = 1.0
+            t_scale = 1.0
+        elif units == 'mks':
+            amp_scale = \
+                M*_gwtools.Msuninsec*_gwtools.c/(1e6*dist_mpc*_gwtools.PC_SI)
+            t_scale = _gwtools.Msuninsec * M
+        else:
+            raise Exception('Invalid units')
+        return amp_scale, t_scale
+
+
+    def enable_cache(self, sparse_max_bytes=2**28, dense_max_bytes=2**30,
+            interp_max_bytes=2**28):
+        """
+    Turns on caching of waveform evaluations in __call__. There are three
+    tiers, each a least recently used cache bounded by the total size of the
+    stored arrays:
+
+    sparse: The evaluation of the surrogate on its sparse time domain, keyed
+            by the intrinsic parameters. This is reused when the same binary
+            is requested with a different f_low, f_ref, dt or times, or with
+            a different total mass. For precessing models this depends on the
+            reference frequency, so f_low/f_ref/precessing_opts are included
+            in the key. Only models with a sparse_cache attribute support
+            this tier.
+
+    dense:  The dimensionless waveform on the output grid, keyed by the
+            intrinsic parameters plus f_low, f_ref, dt/times and
+            mode_list/ellMax in units of M. This is reused when only the
+            distance, inclination, phi_ref or taper change.
+
+    interp: The linear operators that upsample the surrogate data from the
+            sparse time domain to the output times, keyed by the two time
+            grids. This is reused for all binaries evaluated with the same
+            dt or times and, for the aligned spin models, the same f_low.
+            Only models with an interp_cache attribute support this tier.
+
+    INPUT
+    =====
+    sparse_max_bytes: Memory limit for the sparse tier. Default: 256 MB.
+    dense_max_bytes:  Memory limit for the dense tier. Default: 1 GB.
+    interp_max_bytes: Memory limit for the interp tier. Default: 256 MB.
+        """
+        self._dense_cache = new_cache.LRUCache(dense_max_bytes)
+        if hasattr(self._sur_dimless, 'sparse_cache'):
+            self._sur_dimless.sparse_cache \
+                = new_cache.LRUCache(sparse_max_bytes)
+        if hasattr(self._sur_dimless, 'interp_cache'):
+            self._sur_dimless.interp_cache \
+                = new_cache.LRUCache(interp_max_bytes)
+
+    def disable_cache(self):
+        """ Turns off caching and frees the cached data. """
+        self._dense_cache = None
+        if hasattr(self._sur_dimless, 'sparse_cache'):
+            self._sur_dimless.sparse_cache = None
+        if hasattr(self._sur_dimless, 'interp_cache'):
+            self._sur_dimless.interp_cache = None
+
+    def clear_cache(self):
+        """ Removes all cached waveforms and resets the hit/miss counters. """
+        for cache in self._get_caches().values():
+            cache.clear()
+
+    def cache_info(self):
+        """
+    Returns a dictionary with the statistics (number of entries, size in
+    bytes, hits, misses and evictions) of the 'sparse', 'dense' and 'interp'
+    cache tiers. Tiers that are not enabled are omitted.
+        """
+        return {k: cache.info() for k, cache in self._get_caches().items()}
+
+    def _get_caches(self):
+        caches = {}
+        if self._dense_cache is not None:
+            caches['dense'] = self._dense_cache
+        sparse_cache = getattr(self._sur_dimless, 'sparse_cache', None)
+        if sparse_cache is not None:
+            caches['sparse'] = sparse_cache
+        interp_cache = getattr(self._sur_dimless, 'interp_cache', None)
+        if interp_cache is not None:
+            caches['interp'] = interp_cache
+        return caches
+
+    def enable_profiling(self):
+        """
+    Turns on timing of the stages of __call__ and evaluate_batch. For each
+    stage, the number of calls and the total wall time are recorded. The
+    stages are:
+
+    total:                 The full evaluation.
+    param_checks:          Sanity checks of the inputs.
+    node_fits:             Evaluation of the fits for the empirical nodes.
+    ei_reconstruction:     Reconstruction of the data pieces from the
+                           empirical interpolation bases.
+    TaylorT3:              The TaylorT3 part of the (2,2) phase (aligned spin
+                           models).
+    coorbital_to_inertial: Transformation of the modes from the coorbital
+                           frame to the inertial frame (aligned spin models),
+                           including spline_upsampling.
+    spline_upsampling:     Interpolation from the sparse surrogate domain onto
+                           the output times.
+    dynamics_ode:          Integration of the dynamics ODE (precessing
+                           models).
+    coorbital_surrogate:   Evaluation of the coorbital frame waveform
+                           surrogate (precessing models), including the
+                           node_fits and ei_reconstruction.
+    wigner_rotation:       Rotation of the modes from the coorbital frame to
+                           the inertial frame (precessing models).
+    taper:                 Computing the taper window (also the Planck
+                           windows of evaluate_fd).
+    mode_sum:              The sum over modes, if inclination is given.
+    unit_scaling:          Rescaling the domain and waveform to physical
+                           units, which also applies the taper.
+    fft:                   The FFTs of evaluate_fd.
+    fd_resample:           Interpolation of the FFTs onto the requested
+                           frequencies in evaluate_fd.
+
+    Nested stages are also included in the time of the enclosing stages.
+    Evaluations served from the cache skip the surrogate stages.
+
+    Returns the gwsurrogate.new.profiling.StageProfiler holding the timings.
+    Use profile_info() or its to_json() method to export them. If profiling
+    is already on, the existing profiler is returned.
+        """
+        if self._profiler is None:
+            self._profiler = new_profiling.StageProfiler()
+        return self._profiler
+
+    def disable_profiling(self):
+        """ Turns off profiling and discards the recorded timings. """
+        self._profiler = None
+
+    def profile_info(self):
+        """
+    Returns a dictionary with the stage names as keys, and the number of
+    'calls' and the 'total' and 'mean' wall time in seconds of each stage
+    as values. Returns an empty dictionary if profiling is off.
+        """
+        if self._profiler is None:
+            return {}
+        return self._profiler.info()
+
+    def profiling(self):
+        """
+    Context manager that turns on profiling for the enclosed code and returns
+    the StageProfiler, e.g.:
+
+        with sur.profiling() as prof:
+            sur(q, chiA0, chiB0, f_low=0)
+        print(prof)
+
+    Profiling is turned off again at the end, unless it was already on.
+        """
+        return _ProfilingContext(self)
+
+    def _eval_dimless(self, x, **kwargs):
+        """
+        Evaluates self._sur_dimless, going through the dense cache if
+        enabled. kwargs are passed on to self._sur_dimless. With
+        multiband_opts, its evaluate_multiband is used instead, which also
+        returns the band edges.
+        """
+        if kwargs.get('multiband_opts') is not None:
+            sur_dimless = self._sur_dimless.evaluate_multiband
+        else:
+            sur_dimless = self._sur_dimless
+        if self._dense_cache is None:
+            return sur_dimless(x, **kwargs)
+
+        key = [new_cache.array_key(np.hstack(x))]
+        for k in sorted(kwargs.keys()):
+            val = kwargs[k]
+            if k == 'mode_list' and val is not None:
+                val = tuple(tuple(mode) for mode in val)
+            elif isinstance(val, dict):
+                val = tuple((opt, new_cache.array_key(val[opt]))
+                    for opt in sorted(val.keys()))
+            elif val is not None and np.ndim(val) > 0:
+                val = new_cache.array_key(val)
+            key.append((k, val))
+        key = tuple(key)
+
+        res = self._dense_cache.get(key)
+        if res is None:
+            res = sur_dimless(x, **kwargs)
+            self._dense_cache.put(key, res)
+        # __call__ modifies the output in place
+        return new_cache.copy_arrays(res)
+
+    def _mode_sum(self, h_modes, theta, phi, fake_neg_modes=False, out=None):
         """ Sums over h_modes at a given theta, phi.
             If fake_neg_modes = True, deduces m<0 modes from m>0 modes.
             If fake_neg_modes = True, m<0 modes should not be in h_modes.
+
+            The -2Ylm are computed for all modes at once and cached for each
+            orientation, and the sum is done as a matrix product over the
+            stacked modes.
+
+            If out is given, the result is written into it.
+        """
+        mode_list, h = harmonics.stack_modes(h_modes)
+        return harmonics.mode_sum(h, mode_list, theta, phi,
+            fake_neg_modes=fake_neg_modes, out=out)
+
+    def _modes_to_buffer(self, h_modes, out):
+        """ Copies the modes into the rows of out, which should have shape
+        (len(h_modes), n_times). Returns a dict of modes, whose values are
+        views of the rows of out.
         """
-        h = 0.
-        for (ell, m), h_mode in h_modes.items(): # inefficient in py2
-            h += _sYlm(-2, ell, m, theta, phi) * h_mode
-            if fake_neg_modes:
-                if m > 0:
-                    h += _sYlm(-2, ell, -m, theta, phi) \
-                        * (-1)**ell * h_mode.conjugate()
-                elif m < 0:
-                    # Looks like this m<0 mode exits, we should be using that.
-                    raise Exception('Expected only m>0 modes.')
+        _check_out_buffer(out, (len(h_modes),) + np.shape(
+            next(iter(h_modes.values()))))
+        h = {}
+        for i, (mode, hlm) in enumerate(h_modes.items()):
+            out[i] = hlm
+            h[mode] = out[i]
         return h
 
+    def _get_taper_window(self, domain, taper_end_duration):
+        """ Window that tapers the last taper_end_duration of the waveform
+        to zero.
+        """
+        # NOTE: we use a roll on window [domain[0]-100, domain[0]-50]
+        # to trick the window function into not tapering the beginning
+        # of h
+        return _gwutils.windowWaveform(domain, np.ones(len(domain)), \
+            domain[0]-100, domain[0]-50, \
+            domain[-1] - taper_end_duration, domain[-1], \
+            windowType="planck")
+
 
+    @new_profiling.profiled
     def __call__(self, q, chiA0, chiB0, M=None, dist_mpc=None, f_low=None,
         f_ref=None, dt=None, df=None, times=None, freqs=None,
         mode_list=None, ellMax=None, inclination=None, phi_ref=0,
         precessing_opts=None, tidal_opts=None, par_dict=None,
         units='dimensionless', skip_param_checks=False,
-        taper_end_duration=None):
+        taper_end_duration=None, out=None, t_window=None,
+        multiband_opts=None):
         """
     INPUT
     =====
@@ -1649,6 +2015,12 @@ class SurrogateEvaluator(object):
                 same convention as LAL. See below for definition of the
                 reference frame.
 
+                inclination and phi_ref can also be arrays, which are
+                broadcast against each other. The modes are then evaluated
+                only once, and projected onto all orientations with a single
+                (n_orient, n_modes) x (n_modes, n_times) product. The returned
+                h has shape (n_orient, n_times).
+
     precessing_opts:
                 A dictionary containing optional parameters for a precessing
                 surrogate model. Default: None.
@@ -1709,6 +2081,44 @@ class SurrogateEvaluator(object):
                 When set to None, no taper is applied
                 Default: None.
 
+    out:        Optional complex128 array in which to store h, to avoid
+                allocating a new array for the output. This can be, for
+                example, a segment of a zero padded array for a detector
+                data stream. The amplitude rescaling, taper and mode sum are
+                done in place in out.
+                If inclination is specified, out should have the same shape
+                as the returned h. Otherwise, out should have shape
+                (n_modes, len(domain)), and the returned dict of modes has
+                views of the rows of out as values, in the same order as the
+                dict keys.
+                Default: None.
+
+    t_window:   (t1, t2), to return only the part of the waveform with
+                t1 <= t <= t2, for example only around the merger. The times
+                should be in M if units = 'dimensionless', and in seconds if
+                units = 'mks'. Most of the evaluation is then restricted to
+                the window, which is much cheaper for a short window of a
+                long waveform. Cannot be used with times.
+                Only supported by the aligned spin models, except the tidal
+                ones.
+                Default: None.
+
+    multiband_opts:
+                A dict, to return the waveform on a piecewise uniform time
+                grid, with time step dt at the merger and larger time steps
+                in the early inspiral, rather than with a uniform time step
+                dt. This is much cheaper for long waveforms. See
+                evaluate_multiband, which also splits the output into the
+                uniformly sampled bands. Requires dt.
+                Allowed keys are:
+                dt_max: The largest time step, in the same units as dt.
+                    Default: None, no limit.
+                samples_per_cycle: The minimum number of samples per cycle
+                    of the highest mode. Default: 4.
+                Only supported by the aligned spin models, except the tidal
+                ones, and the precessing models.
+                Default: None.
+
     RETURNS
     =====
 
@@ -1732,7 +2142,8 @@ class SurrogateEvaluator(object):
                     all modes given in the ellMax/mode_list argument. For
                     nonprecessing systems the m<0 modes are automatically
                     deduced from the m>0 modes. To see if a model is precessing
-                    check self.keywords.
+                    check self.keywords. If inclination/phi_ref are arrays, h
+                    has shape (n_orient, len(domain)).
 
                     Else, h is a dictionary of available modes with (l, m)
                     tuples as keys. For example, h22 = h[(2,2)].
@@ -1772,62 +2183,37 @@ class SurrogateEvaluator(object):
         the LAL convention. See LIGO DCC document T1800226 for the LAL frame
         diagram.
         """
+        return self._evaluate(q, chiA0, chiB0, M, dist_mpc, f_low, f_ref, dt,
+            df, times, freqs, mode_list, ellMax, inclination, phi_ref,
+            precessing_opts, tidal_opts, par_dict, units, skip_param_checks,
+            taper_end_duration, out, t_window, multiband_opts)[:3]
+
 
+    def _evaluate(self, q, chiA0, chiB0, M=None, dist_mpc=None, f_low=None,
+        f_ref=None, dt=None, df=None, times=None, freqs=None,
+        mode_list=None, ellMax=None, inclination=None, phi_ref=0,
+        precessing_opts=None, tidal_opts=None, par_dict=None,
+        units='dimensionless', skip_param_checks=False,
+        taper_end_duration=None, out=None, t_window=None,
+        multiband_opts=None):
+        """
+        Evaluates the model as described in __call__. Returns domain, h,
+        dynamics, band_edges, where band_edges are the indices of the starts
+        of the bands in domain, followed by len(domain), if multiband_opts is
+        given, and None otherwise.
+        """
         chiA0 = np.array(chiA0)
         chiB0 = np.array(chiB0)
 
         # Sanity checks
         if not skip_param_checks:
+            with new_profiling.stage('param_checks'):
+                self._check_inputs(M, dist_mpc, f_low, f_ref, dt, df, times,
+                    freqs, mode_list, ellMax, units, taper_end_duration)
 
-            if (M is None) ^ (dist_mpc is None):
-                raise ValueError("Either specify both M and dist_mpc, or "
-                        "neither")
-
-            if (M is not None) ^ (units == 'mks'):
-                raise ValueError("M/dist_mpc must be specified if and only if"
-                    " units='mks'")
-
-            if (dt is not None) and (self._domain_type != 'Time'):
-                raise ValueError("%s is not a Time domain model, cannot "
-                        "specify dt"%self.name)
-
-            if (times is not None) and (self._domain_type != 'Time'):
-                raise ValueError("%s is not a Time domain model, cannot "
-                        "specify times"%self.name)
-
-            if (df is not None) and (self._domain_type != 'Frequency'):
-                raise ValueError("%s is not a Frequency domain model, cannot"
-                    " specify df"%self.name)
-
-            if (freqs is not None) and (self._domain_type != 'Frequency'):
-                raise ValueError("%s is not a Frequency domain model, cannot"
-                    " specify freqs"%self.name)
-
-            if (dt is not None) and (times is not None):
-                raise ValueError("Cannot specify both dt and times.")
-
-            if (df is not None) and (freqs is not None):
-                raise ValueError("Cannot specify both df and freqs.")
-
-            if (f_low is None):
-                raise ValueError("f_low must be specified.")
-
-            if (f_ref is not None) and (f_ref < f_low):
-                raise ValueError("f_ref cannot be lower than f_low.")
-
-            if (mode_list is not None) and (ellMax is not None):
-                raise ValueError("Cannot specify both mode_list and ellMax.")
-
-            if (mode_list is not None) and self.keywords['Precessing']:
-                raise ValueError("mode_list is not allowed for precessing "
-                        "models, use ellMax instead.")
-
-            if (taper_end_duration is not None) and self._domain_type !='Time':
-                raise ValueError("%s is not a Time domain model, cannot taper")
-
-            # more sanity checks including extrapolation checks
-            self._check_params(q, chiA0, chiB0, precessing_opts, tidal_opts,
-                    par_dict)
+                # more sanity checks including extrapolation checks
+                self._check_params(q, chiA0, chiB0, precessing_opts,
+                    tidal_opts, par_dict)
 
 
         x = self._get_intrinsic_parameters(q, chiA0, chiB0, precessing_opts,
@@ -1835,15 +2221,7 @@ class SurrogateEvaluator(object):
 
 
         # Get scalings from dimensionless units to mks units
-        if units == 'dimensionless':
-            amp_scale = 1.0
-            t_scale = 1.0
-        elif units == 'mks':
-            amp_scale = \
-                M*_gwtools.Msuninsec*_gwtools.c/(1e6*dist_mpc*_gwtools.PC_SI)
-            t_scale = _gwtools.Msuninsec * M
-        else:
-            raise Exception('Invalid units')
+        amp_scale, t_scale = self._get_unit_scales(units, M, dist_mpc)
 
         # If f_ref is not given, we set it to f_low.
         if f_ref is None:
@@ -1856,38 +2234,60 @@ class SurrogateEvaluator(object):
         freqsM = None if freqs is None else freqs*t_scale
 
 
+        # t_window and multiband_opts are only passed on if given, as only
+        # some models support them
+        window_opts = {}
+        if t_window is not None:
+            if not getattr(self._sur_dimless, 'supports_t_window', False):
+                raise ValueError("t_window is only supported for the aligned"
+                    " spin models, except the tidal ones.")
+            window_opts['t_window'] = tuple(np.asarray(t_window,
+                dtype=float)/t_scale)
+        if multiband_opts is not None:
+            if not getattr(self._sur_dimless, 'supports_multiband', False):
+                raise ValueError("multiband_opts is only supported for the"
+                    " aligned spin models, except the tidal ones, and the"
+                    " precessing models.")
+            if dt is None:
+                raise ValueError("dt must be specified with multiband_opts.")
+            multiband_opts = dict(multiband_opts)
+            if multiband_opts.get('dt_max') is not None:
+                multiband_opts['dt_max'] = multiband_opts['dt_max']/t_scale
+            window_opts['multiband_opts'] = multiband_opts
+
         # Get waveform modes and domain in dimensionless units
         fM_low = f_low*t_scale
         fM_ref = f_ref*t_scale
-        domain, h, dynamics = self._sur_dimless(x, fM_low=fM_low,
+        res = self._eval_dimless(x, fM_low=fM_low,
             fM_ref=fM_ref, dtM=dtM, timesM=timesM, dfM=dfM,
             freqsM=freqsM, mode_list=mode_list, ellMax=ellMax,
             precessing_opts=precessing_opts, tidal_opts=tidal_opts,
-            par_dict=par_dict)
+            par_dict=par_dict, **window_opts)
+        # Multibanded grids also return the bands, see _eval_dimless
+        domain, h, dynamics = res[:3]
+        band_edges = res[3] if multiband_opts is not None else None
 
         # taper the last portion of the waveform, regardless of whether or not
         # this corresponds to inspiral, merger, or ringdown.
         if taper_end_duration is not None:
-            h_tapered = {}
-            for mode, hlm in h.items():
-                # NOTE: we use a roll on window [domain[0]-100, domain[0]-50]
-                # to trick the window function into not tapering the beginning
-                # of h
-                h_tapered[mode] = _gwutils.windowWaveform(domain, hlm, \
-                    domain[0]-100, domain[0]-50, \
-                    domain[-1] - taper_end_duration, domain[-1], \
-                    windowType="planck")
-
-            h = h_tapered
+            with new_profiling.stage('taper'):
+                window = self._get_taper_window(domain, taper_end_duration)
+        else:
+            window = None
 
         # sum over modes to get complex strain if inclination is given
         if inclination is not None:
             # For nonprecessing systems get the m<0 modes from the m>0 modes.
             fake_neg_modes = not self.keywords['Precessing']
 
-            # Follows the LAL convention (see help text)
-            h = self._mode_sum(h, inclination, np.pi/2 - phi_ref,
-                    fake_neg_modes=fake_neg_modes)
+            # Follows the LAL convention (see help text). For arrays of
+            # inclination/phi_ref this gives one row per orientation.
+            with new_profiling.stage('mode_sum'):
+                h = self._mode_sum(h, inclination,
+                    np.pi/2 - np.asarray(phi_ref),
+                    fake_neg_modes=fake_neg_modes, out=out)
+        elif out is not None:
+            h = self._modes_to_buffer(h, out)
 
         # Rescale domain to physical units
         if self._domain_type == 'Time':
@@ -1908,16 +2308,543 @@ class SurrogateEvaluator(object):
                 raise Exception("freqs were given as input but returned "
                     "domain somehow does not match.")
 
-        # Rescale waveform to physical units
+        # Apply the taper and rescale waveform to physical units. The taper
+        # is linear, so it can be applied after the mode sum. Everything is
+        # done in place, as a single pass over the data.
+        if window is not None:
+            scale = window*amp_scale if amp_scale != 1 else window
+        elif amp_scale != 1:
+            scale = amp_scale
+        else:
+            scale = None
+        if scale is not None:
+            with new_profiling.stage('unit_scaling'):
+                if type(h) == dict:
+                    for hlm in h.values():
+                        hlm *= scale
+                else:
+                    h *= scale
+
+        return domain, h, dynamics, band_edges
+
+
+    @new_profiling.profiled
+    def evaluate_batch(self, q, chiA0, chiB0, M=None, dist_mpc=None,
+        f_low=None, f_ref=None, dt=None, df=None, times=None, freqs=None,
+        mode_list=None, ellMax=None, inclination=None, phi_ref=0,
+        precessing_opts=None, tidal_opts=None, par_dict=None,
+        units='dimensionless', skip_param_checks=False,
+        taper_end_duration=None):
+        """
+    Evaluates the surrogate for many binaries in a single call.
+
+    INPUT
+    =====
+    q :         Array of mass ratios with length n_params.
+    chiA0:      Spin vectors of the heavier black hole with shape
+                (n_params, 3). A single length-3 spin is used for all q.
+    chiB0:      Spin vectors of the lighter black hole with shape
+                (n_params, 3). A single length-3 spin is used for all q.
+
+    tidal_opts: As in __call__, but Lambda1 and Lambda2 can be arrays with
+                length n_params.
+
+    All other arguments are the same as for __call__, and are shared by all
+    binaries. return_dynamics is not supported.
+
+    The input checks, unit conversions and the TaylorT3 phase are computed
+    once for all binaries, and, for models that support it, the empirical
+    interpolant is reconstructed with a single matrix-matrix product per
+    data piece.
+
+    The waveforms are returned as stacked arrays, so they need a common
+    domain. Either specify times or set f_low = 0.
+
+    RETURNS
+    =====
+
+    domain, h, mode_list
+
+    domain :    Array of time samples common to all binaries, see __call__.
+
+    h :         If inclination is None, a complex array with shape
+                (n_params, len(mode_list), len(domain)) containing the
+                waveform modes. As in __call__, the m<0 modes are not included
+                for nonprecessing models.
+
+                Else, a complex array with shape (n_params, len(domain))
+                containing the complex strain, see __call__. If
+                inclination/phi_ref are arrays, the shape is
+                (n_params, n_orient, len(domain)).
+
+    mode_list : The (ell, m) modes along the second axis of h, when
+                inclination is None.
+        """
+
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        n_params = len(q)
+        chiA0 = np.asarray(chiA0, dtype=float) * np.ones((n_params, 3))
+        chiB0 = np.asarray(chiB0, dtype=float) * np.ones((n_params, 3))
+
+        if tidal_opts is not None:
+            tidal_opts_list = [{k: np.atleast_1d(v)[i % np.size(v)]
+                for k, v in tidal_opts.items()} for i in range(n_params)]
+        else:
+            tidal_opts_list = [None]*n_params
+
+        if self._domain_type != 'Time':
+            raise ValueError("Batch evaluation is only implemented for Time "
+                "domain models.")
+
+        # Sanity checks
+        if not skip_param_checks:
+            self._check_inputs(M, dist_mpc, f_low, f_ref, dt, df, times,
+                freqs, mode_list, ellMax, units, taper_end_duration)
+
+            if (precessing_opts is not None) \
+                    and precessing_opts.get('return_dynamics', False):
+                raise ValueError("return_dynamics is not supported for "
+                    "batch evaluation.")
+
+            for i in range(n_params):
+                self._check_params(q[i], chiA0[i], chiB0[i], precessing_opts,
+                    tidal_opts_list[i], par_dict)
+
+        xs = [self._get_intrinsic_parameters(q[i], chiA0[i], chiB0[i],
+            precessing_opts, tidal_opts_list[i], par_dict)
+            for i in range(n_params)]
+        if not self.keywords['Precessing']:
+            xs = np.array(xs)
+
+        amp_scale, t_scale = self._get_unit_scales(units, M, dist_mpc)
+
+        if f_ref is None:
+            f_ref = f_low
+
+        dtM = None if dt is None else dt/t_scale
+        timesM = None if times is None else times/t_scale
+
+        # Get waveform modes and domain in dimensionless units
+        domain, h, mode_list = self._sur_dimless.evaluate_batch(xs,
+            fM_low=f_low*t_scale, fM_ref=f_ref*t_scale, dtM=dtM,
+            timesM=timesM, mode_list=mode_list, ellMax=ellMax,
+            precessing_opts=precessing_opts, tidal_opts=tidal_opts,
+            par_dict=par_dict)
+
+        if taper_end_duration is not None:
+            with new_profiling.stage('taper'):
+                h *= self._get_taper_window(domain, taper_end_duration)
+
+        if inclination is not None:
+            fake_neg_modes = not self.keywords['Precessing']
+            with new_profiling.stage('mode_sum'):
+                h = harmonics.mode_sum(np.moveaxis(h, 1, 0), mode_list,
+                    inclination, np.pi/2 - np.asarray(phi_ref),
+                    fake_neg_modes=fake_neg_modes)
+            # Put the n_params axis first, before any orientation axes
+            h = np.moveaxis(h, -2, 0)
+
+        domain *= t_scale
+        if (times is not None):
+            if not np.array_equal(domain, times):
+                raise Exception("times were given as input but returned "
+                    "domain somehow does not match.")
+
         if amp_scale != 1:
+            with new_profiling.stage('unit_scaling'):
+                h *= amp_scale
+
+        return domain, h, mode_list
+
+
+
+
+    @new_profiling.profiled
+    def evaluate_fd(self, q, chiA0, chiB0, dt=None, df=None, freqs=None,
+            taper_start_duration=None, taper_end_duration=None,
+            inclination=None, phi_ref=0, **kwargs):
+        """
+    Evaluates a time domain model on a uniform time grid and returns its
+    Fourier transform
+        htilde(f) = dt * sum_k h(t_k) exp(-2j*pi*f*t_k),
+    where the time origin t=0 is at the peak of the waveform, as for the
+    domain returned by __call__.
+
+    The waveform is tapered with Planck windows, and zero padded by the FFT
+    itself, so no padded copy of the waveform is made. The windows and time
+    shift factors are cached per length, and the FFT plans by scipy.fft.
+
+    INPUT
+    =====
+    q, chiA0, chiB0: Same as for __call__.
+
+    dt:         Time step of the waveform before the FFT, in M if units =
+                'dimensionless' and in seconds if units = 'mks'. Required.
+
+    df:         Frequency spacing of the output, in cycles/M or Hz.
+                1/(df*dt) should be an integer number of samples, at least
+                the length of the waveform, and the waveform is zero padded to
+                that length. Default: None, in which case the waveform is
+                padded to the next FFT friendly length.
+
+    freqs:      Frequencies at which to return htilde, in cycles/M or Hz. The
+                FFT is then done with twice the waveform length, for a finer
+                frequency grid, and its amplitude and phase are interpolated
+                onto freqs. Do not specify both df and freqs. Default: None.
+
+    taper_start_duration, taper_end_duration:
+                Durations of the Planck tapers at the start and end of the
+                waveform, in the same units as dt. Default: None, no taper.
+
+    inclination, phi_ref:
+                Same as for __call__. If inclination is given, the real
+                polarizations h_plus and h_cross of h = h_plus - 1j*h_cross
+                are transformed with real FFTs, for freqs >= 0. Else, each
+                mode is transformed with a complex FFT, which also gives the
+                negative frequencies.
+
+    kwargs:     All other keyword arguments of __call__, like f_low, M,
+                dist_mpc, units, mode_list or precessing_opts. times and out
+                are not allowed.
+
+    RETURNS
+    =====
+    freqs, htilde, dynamics
+
+    freqs:      The frequencies of htilde, in cycles/M if units =
+                'dimensionless', in Hz if units = 'mks'. These are the
+                given freqs, if any.
+
+    htilde:     If inclination is given, a dict with the Fourier transforms
+                of the polarizations, with keys 'plus' and 'cross'. For
+                arrays of inclination/phi_ref these have shape
+                (n_orient, len(freqs)).
+                Else, a dict with the Fourier transform of each mode, with
+                (l, m) keys.
+
+    dynamics:   Same as for __call__, on the uniform time grid.
+        """
+        if self._domain_type != 'Time':
+            raise ValueError("evaluate_fd is only implemented for Time "
+                "domain models.")
+        if dt is None:
+            raise ValueError("dt must be specified.")
+        if (df is not None) and (freqs is not None):
+            raise ValueError("Cannot specify both df and freqs.")
+        for key in ['times', 'out', 'df']:
+            if key in kwargs:
+                raise ValueError("%s is not allowed for evaluate_fd."%key)
+
+        domain, h, dynamics = self(q, chiA0, chiB0, dt=dt,
+            inclination=inclination, phi_ref=phi_ref, **kwargs)
+        n = len(domain)
+
+        if (taper_start_duration is not None) \
+                or (taper_end_duration is not None):
+            with new_profiling.stage('taper'):
+                n_start = 0 if taper_start_duration is None \
+                    else int(round(taper_start_duration/dt))
+                n_end = 0 if taper_end_duration is None \
+                    else int(round(taper_end_duration/dt))
+                window = new_fourier.planck_window(n, n_start, n_end)
+                if type(h) == dict:
+                    for hlm in h.values():
+                        hlm *= window
+                else:
+                    h *= window
+
+        if df is not None:
+            n_fft = int(round(1./(df*dt)))
+            if abs(n_fft*df*dt - 1) > 1e-8:
+                raise ValueError("1/(df*dt) should be an integer.")
+            if n_fft < n:
+                raise ValueError("The waveform has %d samples, which is"
+                    " more than 1/(df*dt) = %d. Use a smaller df or a higher"
+                    " f_low."%(n, n_fft))
+        elif freqs is not None:
+            n_fft = new_fourier.fft_length(n, oversample=2)
+        else:
+            n_fft = new_fourier.fft_length(n)
+
+        t0 = domain[0]
+        with new_profiling.stage('fft'):
             if type(h) == dict:
-                h.update((x, y*amp_scale) for x, y in h.items())
+                # All modes are transformed together, in a single call
+                mode_list, h_stack = harmonics.stack_modes(h)
+                fft_freqs, htilde_stack = new_fourier.fft(h_stack, dt, t0,
+                    n_fft)
+                htilde = dict(zip(mode_list, htilde_stack))
             else:
-                h *= amp_scale
+                # h = h_plus - 1j*h_cross, both transformed in a single call
+                fft_freqs, hpc_tilde = new_fourier.rfft(
+                    np.array([h.real, h.imag]), dt, t0, n_fft)
+                hpc_tilde[1] *= -1
+                htilde = {'plus': hpc_tilde[0], 'cross': hpc_tilde[1]}
+
+        if freqs is None:
+            return fft_freqs, htilde, dynamics
+
+        with new_profiling.stage('fd_resample'):
+            htilde = {k: new_fourier.resample(freqs, fft_freqs, v)
+                for k, v in htilde.items()}
+        return np.copy(freqs), htilde, dynamics
+
+
+    @new_profiling.profiled
+    def evaluate_multiband(self, q, chiA0, chiB0, dt=None, dt_max=None,
+            samples_per_cycle=4, **kwargs):
+        """
+    Evaluates a time domain model on a multibanded time grid: a sequence of
+    bands, each with a uniform time step. The time step is dt at the merger,
+    and is doubled from band to band towards the early inspiral, as allowed
+    by the frequency of the (2,2) mode. For long waveforms this needs far
+    fewer samples than a uniform time step dt, so the evaluation is much
+    cheaper, and the bands can be used directly by multibanded likelihoods.
+
+    INPUT
+    =====
+    q, chiA0, chiB0: Same as for __call__.
+
+    dt:         Time step at the merger, in M if units = 'dimensionless' and
+                in seconds if units = 'mks'. Required.
+
+    dt_max:     The largest time step, in the same units as dt.
+                Default: None, no limit.
+
+    samples_per_cycle:
+                The time step of each band gives at least samples_per_cycle
+                samples per cycle of the highest mode in the band.
+                Default: 4.
+
+    kwargs:     All other keyword arguments of __call__, like f_low, M,
+                dist_mpc, units, inclination or precessing_opts. times and
+                multiband_opts are not allowed.
+
+    RETURNS
+    =====
+    bands, h, dynamics
+
+    bands:      A list of the uniformly sampled time arrays of the bands,
+                from the start of the waveform to the end.
+
+    h:          A list with the waveform in each band, as returned by
+                __call__ for the times of the band. The arrays are views of
+                a single output array.
+
+    dynamics:   Same as for __call__, on the concatenated times of all
+                bands.
+        """
+        if self._domain_type != 'Time':
+            raise ValueError("evaluate_multiband is only implemented for Time"
+                " domain models.")
+        if dt is None:
+            raise ValueError("dt must be specified.")
+        for key in ['times', 'multiband_opts']:
+            if key in kwargs:
+                raise ValueError("%s is not allowed for evaluate_multiband."
+                    %key)
+
+        multiband_opts = {'dt_max': dt_max,
+            'samples_per_cycle': samples_per_cycle}
+        domain, h, dynamics, edges = self._evaluate(q, chiA0, chiB0, dt=dt,
+            multiband_opts=multiband_opts, **kwargs)
+        return new_multiband.split_bands(edges, domain), \
+            new_multiband.split_bands(edges, h), dynamics
+
+
+    @new_profiling.profiled
+    def evaluate_heterodyned(self, q, chiA0, chiB0, times=None, M=None,
+            dist_mpc=None, f_low=None, f_ref=None, mode_list=None,
+            ellMax=None, output_format='amp_phase', precessing_opts=None,
+            tidal_opts=None, par_dict=None, units='dimensionless',
+            skip_param_checks=False):
+        """
+    Evaluates the modes of an aligned spin model at a few times, as smooth
+    functions that can be interpolated between them, rather than as rapidly
+    oscillating complex modes. This is meant for likelihoods that need the
+    waveform only at a few hundred nodes, like relative binning.
+
+    INPUT
+    =====
+    q, chiA0, chiB0, M, dist_mpc, f_low, f_ref, mode_list, ellMax,
+    precessing_opts, tidal_opts, par_dict, units, skip_param_checks:
+                Same as for __call__.
+
+    times:      Times at which to evaluate the modes, in M if units =
+                'dimensionless' and in seconds if units = 'mks'. Required.
+
+    output_format:
+                'amp_phase': Each mode is returned as a tuple (amplitude,
+                    phase) of real arrays, with h_lm = amplitude *
+                    exp(1j*phase).
+                'coorbital': Each mode is returned as the slowly varying
+                    complex mode in the coorbital frame, h_coorb_lm, with
+                    h_lm = h_coorb_lm * exp(-1j*m*orbphase), where the
+                    orbital phase orbphase is returned as well.
+                Default: 'amp_phase'.
+
+    Only supported by the aligned spin models, except the tidal ones.
+
+    RETURNS
+    =====
+    times, h, orbphase
+
+    times:      Same as the input times.
+    h:          A dict of the modes in the above format, with (l, m) keys,
+                for m > 0. The m < 0 modes follow from
+                h_l,-m = (-1)^l conj(h_lm).
+    orbphase:   The orbital phase at times for output_format='coorbital',
+                and None for output_format='amp_phase'.
+        """
+        if not getattr(self._sur_dimless, 'supports_output_format', False):
+            raise ValueError("evaluate_heterodyned is only supported for the"
+                " aligned spin models, except the tidal ones.")
+        if output_format not in ['amp_phase', 'coorbital']:
+            raise ValueError("Invalid output_format: %s"%output_format)
+        if times is None:
+            raise ValueError("times must be specified.")
+
+        chiA0 = np.array(chiA0)
+        chiB0 = np.array(chiB0)
+        if not skip_param_checks:
+            with new_profiling.stage('param_checks'):
+                self._check_inputs(M, dist_mpc, f_low, f_ref, None, None,
+                    times, None, mode_list, ellMax, units, None)
+                self._check_params(q, chiA0, chiB0, precessing_opts,
+                    tidal_opts, par_dict)
+
+        x = self._get_intrinsic_parameters(q, chiA0, chiB0, precessing_opts,
+            tidal_opts, par_dict)
+        amp_scale, t_scale = self._get_unit_scales(units, M, dist_mpc)
+        if f_ref is None:
+            f_ref = f_low
+
+        _, h, dynamics = self._eval_dimless(x, fM_low=f_low*t_scale,
+            fM_ref=f_ref*t_scale, timesM=np.asarray(times)/t_scale,
+            mode_list=mode_list, ellMax=ellMax,
+            precessing_opts=precessing_opts, tidal_opts=tidal_opts,
+            par_dict=par_dict, output_format=output_format)
+
+        if amp_scale != 1:
+            for mode, hlm in h.items():
+                if output_format == 'amp_phase':
+                    h[mode] = (hlm[0]*amp_scale, hlm[1])
+                else:
+                    hlm *= amp_scale
+
+        orbphase = None if dynamics is None else dynamics['orbphase']
+        return np.copy(times), h, orbphase
+
+
+    def map(self, param_iterable, workers=None, chunksize=1, timeout=None,
+            on_error='raise', start_method='fork', **kwargs):
+        """
+    Evaluates the surrogate for many binaries using a pool of worker
+    processes.
+
+    With the default 'fork' start method, the workers inherit the surrogate
+    data already loaded in this process, so the EI bases and fits are shared
+    copy-on-write and are never reloaded or pickled per task. With
+    'forkserver', each worker loads the h5 file once when it starts.
+
+    INPUT
+    =====
+    param_iterable: Iterable over the parameters of each binary. Each element
+                    is either a tuple (q, chiA0, chiB0) or a dictionary of
+                    keyword arguments for __call__.
+
+    workers:        Number of worker processes. Default: multiprocessing.cpu_count().
+                    If workers = 1, the evaluations are done serially in
+                    this process.
 
-        return domain, h, dynamics
+    chunksize:      Number of binaries sent to a worker at a time.
 
+    timeout:        Maximum time in seconds for the entire map. If exceeded,
+                    the remaining evaluations are cancelled and a
+                    multiprocessing.TimeoutError is raised.
 
+    on_error:       'raise' or 'return'. If 'raise', the remaining
+                    evaluations are cancelled at the first (in order)
+                    failure and a SurrogateMapError with the offending
+                    parameters is raised. If 'return', the SurrogateMapError
+                    is placed in the output list instead of the result, and
+                    the remaining evaluations continue.
+
+    start_method:   'fork' or 'forkserver'.
+
+    kwargs:         Keyword arguments passed to __call__ for all binaries,
+                    e.g. f_low, dt, units. Keys given in a dictionary element
+                    of param_iterable take precedence.
+
+    RETURNS
+    =====
+    A list with the output of __call__ for each element of param_iterable,
+    in the same order.
+        """
+        global _MAP_SURROGATE
+
+        if on_error not in ['raise', 'return']:
+            raise ValueError("on_error should be 'raise' or 'return'.")
+        if start_method not in ['fork', 'forkserver']:
+            raise ValueError("start_method should be 'fork' or 'forkserver'.")
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+
+        params_list = list(param_iterable)
+        tasks = [(idx, params, kwargs) for idx, params in \
+            enumerate(params_list)]
+        results = [None]*len(tasks)
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        def process(res):
+            idx, success, val = res
+            if success:
+                results[idx] = val
+                return
+            err = SurrogateMapError('Evaluation failed for parameters %s: '
+                '%s'%(params_list[idx], val[0]), index=idx,
+                params=params_list[idx], worker_traceback=val[1])
+            if on_error == 'raise':
+                raise err
+            results[idx] = err
+
+        prev_surrogate = _MAP_SURROGATE
+        _MAP_SURROGATE = self
+        try:
+            if workers == 1:
+                for task in tasks:
+                    if timeout is not None and time.time() > deadline:
+                        raise multiprocessing.TimeoutError('map timed out.')
+                    process(_map_eval(task))
+                return results
+
+            ctx = multiprocessing.get_context(start_method)
+            if start_method == 'fork':
+                initargs = (None, None, None)
+            else:
+                initargs = (self.__class__, self.h5filename, self._load_opts)
+
+            pool = ctx.Pool(workers, initializer=_map_init_worker,
+                initargs=initargs)
+            try:
+                res_iter = pool.imap(_map_eval, tasks, chunksize=chunksize)
+                for _ in range(len(tasks)):
+                    if timeout is None:
+                        res = res_iter.next()
+                    else:
+                        res = res_iter.next(max(deadline - time.time(), 0))
+                    process(res)
+                pool.close()
+            finally:
+                # Cancels any remaining evaluations if we are here because
+                # of an error or timeout
+                pool.terminate()
+                pool.join()
+        finally:
+            _MAP_SURROGATE = prev_surrogate
+
+        return results
 
 
 class NRHybSur3dq8(SurrogateEvaluator):
@@ -1948,8 +2875,20 @@ See the __call__ method on how to evaluate waveforms.
 In the __call__ method, x must have format x = [q, chi1z, chi2z].
     """
 
-    def __init__(self, h5filename):
+    def __init__(self, h5filename, mode_list=None, ellMax=None,
+            precision='double', compiled_fits=False):
+        """
+        h5filename: The h5 file containing the surrogate data.
+        mode_list:  If given, only load the data needed to evaluate these
+                    modes.
+        ellMax:     If given, only load the data needed to evaluate modes
+                    with ell <= ellMax.
+        precision:  'double' or 'single'. See LoadSurrogate.
+        compiled_fits: See LoadSurrogate.
+        """
         self.h5filename = h5filename
+        self._load_opts = {'mode_list': mode_list, 'ellMax': ellMax,
+            'precision': precision, 'compiled_fits': compiled_fits}
         domain_type = 'Time'
         keywords = {
             'Precessing': False,
@@ -1976,7 +2915,7 @@ In the __call__ method, x must have format x = [q, chi1z, chi2z].
         passed to self._sur_dimless() in the __call__ function of this class.
         """
         sur = new_surrogate.AlignedSpinCoOrbitalFrameSurrogate()
-        sur.load(self.h5filename)
+        sur.load(self.h5filename, **self._load_opts)
         return sur
 
     def _get_intrinsic_parameters(self, q, chiA0, chiB0, precessing_opts,
@@ -2026,8 +2965,20 @@ See the __call__ method on how to evaluate waveforms.
 In the __call__ method, x must have format x = [q, chi1z, chi2z].
     """
 
-    def __init__(self, h5filename):
+    def __init__(self, h5filename, mode_list=None, ellMax=None,
+            precision='double', compiled_fits=False):
+        """
+        h5filename: The h5 file containing the surrogate data.
+        mode_list:  If given, only load the data needed to evaluate these
+                    modes.
+        ellMax:     If given, only load the data needed to evaluate modes
+                    with ell <= ellMax.
+        precision:  'double' or 'single'. See LoadSurrogate.
+        compiled_fits: See LoadSurrogate.
+        """
         self.h5filename = h5filename
+        self._load_opts = {'mode_list': mode_list, 'ellMax': ellMax,
+            'precision': precision, 'compiled_fits': compiled_fits}
         domain_type = 'Time'
         keywords = {
             'Tidal': True,
@@ -2054,7 +3005,7 @@ In the __call__ method, x must have format x = [q, chi1z, chi2z].
         passed to self._sur_dimless() in the __call__ function of this class.
         """
         sur = new_surrogate.AlignedSpinCoOrbitalFrameSurrogateTidal()
-        sur.load(self.h5filename)
+        sur.load(self.h5filename, **self._load_opts)
         return sur
 
     def _get_intrinsic_parameters(self, q, chiA0, chiB0, precessing_opts,
@@ -2105,8 +3056,21 @@ See the __call__ method on how to evaluate waveforms.
 In the __call__ method, x must have format x = [q, chi1, chi2].
     """
 
-    def __init__(self, h5filename):
+    def __init__(self, h5filename, mode_list=None, ellMax=None,
+            precision='double', compiled_fits=False):
+        """
+        h5filename: The h5 file containing the surrogate data.
+        mode_list:  If given, only load the data needed to evaluate these
+                    modes.
+        ellMax:     If given, only load the data needed to evaluate modes
+                    with ell <= ellMax.
+        precision:  'double' or 'single'. See LoadSurrogate.
+        compiled_fits: Has no effect, the fits of this model are already
+                    stored as arrays of coefficients. See LoadSurrogate.
+        """
         self.h5filename = h5filename
+        self._load_opts = {'mode_list': mode_list, 'ellMax': ellMax,
+            'precision': precision}
         domain_type = 'Time'
         keywords = {
             'Precessing': True,
@@ -2132,7 +3096,8 @@ In the __call__ method, x must have format x = [q, chi1, chi2].
         passed to self._sur_dimless() in the __call__ function of this class.
         See NRHybSur3dq8 for an example.
         """
-        sur = precessing_surrogate.PrecessingSurrogate(self.h5filename)
+        sur = precessing_surrogate.PrecessingSurrogate(self.h5filename,
+            **self._load_opts)
         return sur
 
     def _get_intrinsic_parameters(self, q, chiA0, chiB0, precessing_opts,
@@ -2167,7 +3132,9 @@ class LoadSurrogate(object):
     """
 
     #NOTE: __init__ is never called for LoadSurrogate
-    def __new__(self, surrogate_name, surrogate_name_spliced=None):
+    def __new__(self, surrogate_name, surrogate_name_spliced=None,
+            mode_list=None, ellMax=None, precision='double',
+            compiled_fits=False):
         """ Returns a SurrogateEvaluator derived object based on name.
 
         INPUT
@@ -2193,7 +3160,53 @@ class LoadSurrogate(object):
                                 If you wish to load a spliced model from its h5
                                 file, provide (i) the hdf5 file path as its
                                 surrogate name and (ii) the model name (e.g.
-                                NRHybSur3dq8Tidal) as SURROGATE_NAME_SPLICED."""
+                                NRHybSur3dq8Tidal) as SURROGATE_NAME_SPLICED.
+
+        MODE_LIST: If given, only the data needed to evaluate these (ell, m)
+                   modes is loaded. This reduces the load time and memory.
+                   Modes that are not loaded cannot be evaluated. For
+                   NRSur7dq4, all modes up to the largest ell in MODE_LIST
+                   are loaded.
+
+        ELLMAX: If given, only the data needed to evaluate modes with
+                ell <= ELLMAX is loaded.
+
+        PRECISION: 'double' (default) or 'single'. With 'single', the
+                   empirical interpolation bases are stored in single
+                   precision, which halves the memory of the model, and the
+                   waveform data pieces are reconstructed from them in single
+                   precision. This is meant for applications like template
+                   banks for detection, where speed matters more than the
+                   last digits.
+                   All phases (the TaylorT3 and (2,2) mode phase of
+                   NRHybSur3dq8, the orbital phase and the rest of the
+                   dynamics of NRSur7dq4) are still computed in double
+                   precision, as is the spline interpolation onto dense time
+                   grids. The returned waveform is double precision.
+
+                   Accuracy budget: single precision has a relative rounding
+                   error of 6e-8. The reconstruction sums n_nodes terms, so
+                   the relative error of each data piece is at most
+                   ~n_nodes*6e-8 of its peak, and is in practice ~1e-7 at the
+                   peak. The (2,2) phase is unaffected, so there is no error
+                   that accumulates with the number of cycles. This is at
+                   least four orders of magnitude below the modeling error of
+                   the surrogates. The strain from precision='single' agrees
+                   with precision='double' to a relative L2 error of ~1e-7
+                   (mismatch ~1e-14). Weak subdominant modes, compared
+                   individually, can have larger relative errors of up to
+                   ~1e-5.
+
+        COMPILED_FITS: If True, the node fits of NRHybSur3dq8 and
+                   NRHybSur3dq8Tidal are converted to plain numpy arrays on
+                   the first load and stored in a sidecar file next to the
+                   hdf5 file (e.g. NRHybSur3dq8.compiled_fits_v1.npz). Later
+                   loads with COMPILED_FITS=True read the fits from there,
+                   skipping the construction of the GPR fit objects, which
+                   greatly reduces the load time. The waveforms agree with
+                   the default load to ~1e-12 (round-off). The sidecar file is
+                   recreated if the hdf5 file changes. Has no effect for
+                   NRSur7dq4, whose fits are already stored as arrays."""
 
 
         # the "output" of this if-block is surrogate_h5file and surrogate_name
@@ -2232,5 +3245,7 @@ class LoadSurrogate(object):
         if surrogate_name not in SURROGATE_CLASSES.keys():
             raise Exception('Invalid surrogate : %s'%surrogate_name)
         else:
-            return SURROGATE_CLASSES[surrogate_name](surrogate_h5file)
+            return SURROGATE_CLASSES[surrogate_name](surrogate_h5file,
+                mode_list=mode_list, ellMax=ellMax, precision=precision,
+                compiled_fits=compiled_fits)
 